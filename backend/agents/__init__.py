@@ -5,6 +5,7 @@ This package contains the implementation of the RAVE agent system, which uses
 a recursive approach to generate, verify, and improve responses to user queries.
 """
 
-from .rave_agent import graph, State
+from .rave_agent import graph, resumable_graph, async_graph, astream, State
+from .batch import run_batch
 
-__all__ = ['graph', 'State',] 
\ No newline at end of file
+__all__ = ['graph', 'resumable_graph', 'async_graph', 'astream', 'State', 'run_batch',] 
\ No newline at end of file
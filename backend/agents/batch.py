@@ -0,0 +1,226 @@
+"""Batch research runs.
+
+Runs many questions through the async graph on one event loop, with at most
+`concurrency` questions in flight. All runs share the pooled model clients
+and the page and search caches, so questions that overlap reuse each other's
+searches and pages. Each finished question is written to the output file
+right away as one JSON line, holding the answer, the checklist, the
+knowledge base and the run's metrics. An interrupted batch continues where
+it stopped with --resume, which skips the ids already answered in the
+output; questions that failed run again and append a new line, so the last
+line of an id holds its result.
+
+Input is JSONL with a "question" per line, an optional "id" and optional
+run settings (model names, max_iterations, score_threshold,
+max_parallel_queries) that override the batch defaults. Other fields, such
+as an expected answer, stay out of the run and are reported when the batch
+starts:
+
+    {"id": "q1", "question": "What is the capital of France?", "max_iterations": 2}
+
+Usage:
+    python -m backend.agents.batch questions.jsonl results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ..config.settings import BATCH_CONCURRENCY, MAX_ITERATIONS, SCORE_THRESHOLD
+from .rave_agent import async_graph
+from .utils.cancellation import CancellationToken, RunCancelled
+from .utils.telemetry import summarize_metrics
+
+# Keys of an input line that are not run settings
+QUESTION_FIELDS = ("id", "question")
+MODEL_SETTINGS = ("question_model", "checklist_model", "query_model", "url_model", "answer_model", "scoring_model", "kb_model")
+# Keys of an input line passed on to the run's config
+RUN_SETTINGS = MODEL_SETTINGS + ("max_iterations", "score_threshold", "max_parallel_queries")
+
+
+def new_state(question: str) -> Dict[str, Any]:
+    """Initial graph state for a question, as the app builds it"""
+    return {
+        "messages": [],
+        "question": question,
+        "improved_question": "",
+        "scored_checklist": [],
+        "current_query": None,
+        "query_history": [],
+        "search_results": [],
+        "urls_to_scrape": [],
+        "scraped_content": [],
+        "knowledge_base": [],
+        "answer": None,
+    }
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Read the questions of a batch, numbering those without an id"""
+    questions = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            item.setdefault("id", str(number))
+            questions.append(item)
+    return questions
+
+
+def unknown_fields(questions: Iterable[Dict[str, Any]]) -> Counter:
+    """Number of questions per field that is neither a question field nor a run setting"""
+    return Counter(key for item in questions for key in item if key not in QUESTION_FIELDS + RUN_SETTINGS)
+
+
+def finished_ids(path: str) -> set:
+    """Ids whose last line in an output file is not an error"""
+    if not os.path.exists(path):
+        return set()
+    ids = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record.get("status") == "error":
+                    ids.discard(record["id"])
+                else:
+                    ids.add(record["id"])
+            except (json.JSONDecodeError, KeyError, AttributeError):
+                continue
+    return ids
+
+
+def result_record(item: Dict[str, Any], final_state: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+    """The output line of a finished question"""
+    checklist = final_state.get("scored_checklist") or []
+    scores = [entry.get("current_score", 0) for entry in checklist]
+    metrics = summarize_metrics(final_state.get("node_metrics", []))
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "status": "completed",
+        "answer": final_state.get("answer"),
+        "final_score": sum(scores) / len(scores) if scores else None,
+        "iterations": final_state.get("iteration", 0),
+        "scored_checklist": checklist,
+        "knowledge_base": [nugget.model_dump() for nugget in final_state.get("knowledge_base", [])],
+        "seconds": round(seconds, 4),
+        "metrics": {"total": metrics["total"], "nodes": metrics["nodes"]},
+    }
+
+
+async def run_question(item: Dict[str, Any], settings: Dict[str, Any], cancel_token: CancellationToken) -> Dict[str, Any]:
+    """Research one question and describe the outcome as an output line"""
+    configurable = {**settings, **{key: value for key, value in item.items() if key in RUN_SETTINGS}}
+    config = {"configurable": {**configurable, "cancel_token": cancel_token}}
+    started = time.perf_counter()
+    try:
+        final_state = await async_graph.ainvoke(new_state(item["question"]), config=config)
+    except RunCancelled:
+        return {"id": item["id"], "question": item["question"], "status": "cancelled"}
+    except Exception as e:
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "status": "error",
+            "error": f"{type(e).__name__}: {str(e)}",
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+    return result_record(item, final_state, time.perf_counter() - started)
+
+
+async def run_batch(
+    questions: Iterable[Dict[str, Any]],
+    output_path: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    settings: Optional[Dict[str, Any]] = None,
+    resume: bool = False,
+    cancel_token: Optional[CancellationToken] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, int]:
+    """Research a batch of questions and append the results to a JSONL file.
+
+    Args:
+        questions: Items with an "id", a "question" and optional run settings
+        output_path: JSONL file the results are appended to, one per question
+        concurrency: Questions researched at once
+        settings: Run settings shared by all questions, such as model names
+        resume: Skip questions already answered in the output file; failed
+            questions run again
+        cancel_token: Cancels every question still running or waiting
+        on_result: Called with every output line, e.g. to report progress
+
+    Returns:
+        Number of questions per status, plus those of this batch skipped on resume
+    """
+    settings = {"max_iterations": MAX_ITERATIONS, "score_threshold": SCORE_THRESHOLD, **(settings or {})}
+    cancel_token = cancel_token or CancellationToken()
+    done = finished_ids(output_path) if resume else set()
+    questions = list(questions)
+    pending = [item for item in questions if item["id"] not in done]
+    counts = {"completed": 0, "error": 0, "cancelled": 0, "skipped": len(questions) - len(pending)}
+
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    with open(output_path, "a" if resume else "w") as output:
+        async def run(item):
+            async with semaphore:
+                if cancel_token.cancelled:
+                    record = {"id": item["id"], "question": item["question"], "status": "cancelled"}
+                else:
+                    record = await run_question(item, settings, cancel_token)
+            counts[record["status"]] += 1
+            # Cancelled questions are left out so a resumed batch runs them
+            if record["status"] != "cancelled":
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+            if on_result:
+                on_result(record)
+
+        await asyncio.gather(*(run(item) for item in pending))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Research a JSONL file of questions with the RAVE graph")
+    parser.add_argument("questions", help="JSONL file with a question per line")
+    parser.add_argument("output", help="JSONL file the results are written to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    parser.add_argument("--score-threshold", type=float, default=SCORE_THRESHOLD)
+    parser.add_argument("--model", help="model for every node unless a question sets its own")
+    parser.add_argument("--resume", action="store_true", help="skip questions already answered in the output file")
+    args = parser.parse_args()
+
+    settings = {"max_iterations": args.max_iterations, "score_threshold": args.score_threshold}
+    if args.model:
+        for node_name in MODEL_SETTINGS:
+            settings[node_name] = args.model
+
+    questions = read_questions(args.questions)
+    if unknown := unknown_fields(questions):
+        fields = ", ".join(f"{key} ({count} questions)" for key, count in sorted(unknown.items()))
+        print(f"Ignoring fields that are not run settings: {fields}")
+    cancel_token = CancellationToken()
+
+    def report(record):
+        print(f"[{record['status']}] {record['id']}: {record['question'][:80]}")
+
+    try:
+        counts = asyncio.run(run_batch(questions, args.output, args.concurrency, settings, args.resume, cancel_token, report))
+    except KeyboardInterrupt:
+        cancel_token.cancel()
+        print("Batch interrupted; rerun with --resume to continue")
+        return
+    print(", ".join(f"{status}: {count}" for status, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Knowledge base engine.
+
+update_knowledge_base used to have the LLM return both new nuggets and
+updates to existing ones, and applied the updates by scanning the list.
+The model now only extracts facts; everything else happens here. Nuggets
+are kept in a dict keyed by nugget_id, ids are handed out from a counter
+that continues after the largest numeric id already present, and a second
+dict maps normalized content to the nugget holding it. A fact whose
+normalized content is already known is merged into that nugget instead of
+added: a new source URL counts as a corroboration and raises the nugget's
+confidence, the same source only keeps the higher confidence.
+
+Nuggets are never mutated, earlier graph states share them; changed nuggets
+are replaced with updated copies.
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .utils.prompts import KnowledgeNugget
+
+
+def normalize_content(content: str) -> str:
+    """Content reduced to lowercase words, so wording noise does not hide duplicates"""
+    return " ".join(re.findall(r"\w+", unicodedata.normalize("NFKC", content).casefold()))
+
+
+def content_key(content: str) -> str:
+    return hashlib.sha1(normalize_content(content).encode("utf-8")).hexdigest()
+
+
+def nugget_sources(nugget: KnowledgeNugget) -> List[str]:
+    """Distinct URLs supporting a nugget, including nuggets saved before sources were tracked"""
+    return list(dict.fromkeys([nugget.source_url, *nugget.sources]))
+
+
+def corroborations(nugget: KnowledgeNugget) -> int:
+    """Number of distinct sources that state a nugget"""
+    return len(nugget_sources(nugget))
+
+
+class AddResult(NamedTuple):
+    """The nugget a fact ended up in, and whether it was new, corroborated or a repeat"""
+    nugget: KnowledgeNugget
+    outcome: str
+
+
+class KnowledgeBase:
+    """Nuggets indexed by nugget_id and by normalized content"""
+
+    def __init__(self, nuggets: Iterable[KnowledgeNugget] = ()):
+        self.nuggets: Dict[str, KnowledgeNugget] = {}
+        self.by_content: Dict[str, str] = {}
+        self._next_id = 1
+        nuggets = list(nuggets)
+        for nugget in nuggets:
+            if nugget.nugget_id.isdigit():
+                self._next_id = max(self._next_id, int(nugget.nugget_id) + 1)
+        for nugget in nuggets:
+            # Nuggets without an id, or sharing one, get a fresh id
+            if not nugget.nugget_id or nugget.nugget_id in self.nuggets:
+                nugget = nugget.model_copy(update={"nugget_id": self.new_id()})
+            self.nuggets[nugget.nugget_id] = nugget
+            self.by_content.setdefault(content_key(nugget.content), nugget.nugget_id)
+
+    def __len__(self) -> int:
+        return len(self.nuggets)
+
+    def __iter__(self) -> Iterator[KnowledgeNugget]:
+        return iter(self.nuggets.values())
+
+    def __contains__(self, nugget_id: str) -> bool:
+        return nugget_id in self.nuggets
+
+    def get(self, nugget_id: str) -> Optional[KnowledgeNugget]:
+        return self.nuggets.get(nugget_id)
+
+    def find(self, content: str) -> Optional[KnowledgeNugget]:
+        """The nugget holding the same content, ignoring case, spacing and punctuation"""
+        nugget_id = self.by_content.get(content_key(content))
+        return self.nuggets[nugget_id] if nugget_id else None
+
+    def to_list(self) -> List[KnowledgeNugget]:
+        return list(self.nuggets.values())
+
+    def new_id(self) -> str:
+        nugget_id = str(self._next_id)
+        self._next_id += 1
+        return nugget_id
+
+    def add(self, content: str, source_url: str, confidence: float = 1.0, conflicts_with: Iterable[str] = ()) -> AddResult:
+        """Add a fact, merging it into the nugget that already holds its content.
+
+        Returns:
+            The resulting nugget and "added", "corroborated" (known content
+            from a new source) or "repeated" (known content and source)
+        """
+        existing = self.find(content)
+        if existing is None:
+            nugget = KnowledgeNugget(
+                content=content,
+                source_url=source_url,
+                confidence=confidence,
+                nugget_id=self.new_id(),
+                sources=[source_url],
+            )
+            self.nuggets[nugget.nugget_id] = nugget
+            self.by_content[content_key(content)] = nugget.nugget_id
+            outcome = "added"
+        else:
+            sources = nugget_sources(existing)
+            if source_url in sources:
+                changes = {"confidence": max(existing.confidence, confidence)}
+                outcome = "repeated"
+            else:
+                # Independent sources: the fact is wrong only if every source is
+                changes = {
+                    "confidence": 1 - (1 - existing.confidence) * (1 - confidence),
+                    "sources": sources + [source_url],
+                }
+                outcome = "corroborated"
+            nugget = self._replace(existing, **changes)
+
+        for other_id in conflicts_with:
+            self.link_conflict(nugget.nugget_id, other_id)
+        return AddResult(self.nuggets[nugget.nugget_id], outcome)
+
+    def link_conflict(self, nugget_id: str, other_id: str):
+        """Mark two nuggets as contradicting each other; unknown ids are ignored"""
+        if nugget_id == other_id or nugget_id not in self.nuggets or other_id not in self.nuggets:
+            return
+        for a, b in ((nugget_id, other_id), (other_id, nugget_id)):
+            nugget = self.nuggets[a]
+            if b not in nugget.conflicts_with:
+                self._replace(nugget, conflicts_with=nugget.conflicts_with + [b])
+
+    def _replace(self, nugget: KnowledgeNugget, **changes) -> KnowledgeNugget:
+        updated = nugget.model_copy(update=changes)
+        self.nuggets[nugget.nugget_id] = updated
+        return updated
@@ -1,4 +1,4 @@
-from typing import Annotated, Dict, Any, AsyncIterator, List, Optional, Iterator, TypedDict, Callable
+from typing import Annotated, Dict, Any, AsyncIterator, Generator, List, NamedTuple, Optional, Iterator, Tuple, TypedDict, Callable
 from pydantic import BaseModel, Field
 import logging
 import json
@@ -6,6 +6,7 @@ from datetime import datetime
 import time
 import random
 import operator
+import asyncio
 from serpapi import GoogleSearch
 
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -13,20 +14,25 @@ from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_community.document_loaders import WebBaseLoader
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import StreamWriter, Send
 
 
+from ..config.models import get_model_config
 from ..config.settings import (
     DEFAULT_MODEL,
     MAX_ITERATIONS,  
     SCORE_THRESHOLD,
     IMPROVEMENT_THRESHOLD,
     MAX_SEARCH_RESULTS,
+    MAX_PARALLEL_QUERIES,
+    KB_PROMPT_TOP_K,
+    KB_PROMPT_BUDGET_SHARE,
+    KB_PASSAGE_BUDGET_SHARE,
+    PASSAGE_TOP_K,
+    DEDUPE_ACROSS_RUNS,
     LOG_LEVEL,
     LOG_FORMAT,
     TAVILY_API_KEY,
@@ -38,6 +44,8 @@ from .utils.prompts import (
     create_evaluator_prompt,
     create_gap_analyzer_prompt,
     create_query_generator_prompt,
+    create_initial_query_prompt,
+    create_multi_query_generator_prompt,
     create_response_generator_prompt,
     create_direct_answer_prompt,
     create_question_improvement_prompt,
@@ -48,9 +56,38 @@ from .utils.prompts import (
     ChecklistItem,
     ChecklistResponse,
     KnowledgeNugget,
-    KBUpdateResponse,
-    URLSelectionResponse
+    KBExtractionResponse,
+    URLSelectionResponse,
+    QueryListResponse
 )
+from .utils.llm_clients import get_chat_model, get_embeddings
+from .knowledge_base import KnowledgeBase
+from .utils.kb_index import KnowledgeBaseIndex
+from .utils.passages import PassageIndex
+from .utils.near_duplicates import filter_near_duplicates, get_fingerprint_index
+from .utils.prompt_packer import PackedItems, count_tokens, prompt_budget, pack_items
+from .utils.telemetry import instrument_node, record_llm_usage
+from .utils.cassette import get_cassette, wrap_model, cassette_search, cassette_fetch, current_date
+from .utils.scraper import scrape_pages, fetch_document, is_retryable
+from .utils.checkpointer import get_checkpointer
+from .utils.cancellation import RunCancelled, cancellable, check_cancelled, current_token
+from .utils.rate_limiter import ReturnedError, get_limiter, rate_limited
+from .utils.page_cache import get_page_cache
+from .utils.search_cache import get_search_cache
+
+def merge_search_results(current: List[Dict[str, Any]], new: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Reducer for search_results: parallel searches are merged and deduplicated by URL, None clears"""
+    if new is None:
+        return []
+    merged = []
+    seen_urls = set()
+    for result in (current or []) + new:
+        url = result.get("link") or result.get("url")
+        if url and url in seen_urls:
+            continue
+        seen_urls.add(url)
+        merged.append(result)
+    return merged
 
 class State(TypedDict):
     """State for the RAVE workflow"""
@@ -60,12 +97,16 @@ class State(TypedDict):
     scored_checklist: List[Dict[str, Any]]
     answer: str
     query_history: List[str]
-    search_results: List[Dict[str, Any]]
+    search_results: Annotated[List[Dict[str, Any]], merge_search_results]
     scraped_content: List[str] 
     urls_to_scrape: List[str]
     current_query: str
+    current_queries: List[str]
+    iteration: int
     knowledge_base: List[KnowledgeNugget]
     cancelled: bool
+    node_metrics: Annotated[List[Dict[str, Any]], operator.add]
+    dropped_duplicates: Annotated[List[Dict[str, Any]], operator.add]
 
 def validate_state(state: State) -> bool:
     """Validate the state before processing"""
@@ -92,24 +133,106 @@ def getModel(node_name: str, config: Dict[str, Any], writer: Optional[Callable]
         raise ValueError("o1-pro is not a chat model and cannot be used with chat completions")
     
     # Get model configuration
-    from ..config.models import get_model_config
     model_config = get_model_config(model_name)
     
-    # Create base model configuration
-    chat_config = {
-        "model": model_name,
-        "api_key": OPENAI_API_KEY
-    }
-    
-    # Only add temperature for models that support it
-    if model_config.get("supports_temperature", True):
-        chat_config["temperature"] = 0.0
+    # Only set temperature for models that support it
+    temperature = 0.0 if model_config.get("supports_temperature", True) else None
     
-    return ChatOpenAI(**chat_config)
+    # Reuse the cached client and its pooled connections; calls are rate
+    # limited per model and go through the cassette when one is active
+    return wrap_model(rate_limited(get_chat_model(model_name, temperature, OPENAI_API_KEY)))
+
+
+### Running nodes
+# Nodes that call an LLM are written once as generators: they yield an
+# LLMCall and are sent the model response back. run_node drives them with
+# blocking calls for the sync graph and arun_node with async calls for the
+# async graph, so both graphs share the same node logic.
+class LLMCall(NamedTuple):
+    """A request from a node to call a model"""
+    llm: ChatOpenAI
+    prompt: Any
+    on_token: Optional[Callable[[str], None]] = None  # stream the response through this callback
+
+NodeSteps = Generator[LLMCall, Any, Dict[str, Any]]
+
+def call_llm(request: LLMCall) -> Any:
+    """Call a model, streaming tokens to the request's callback if it has one.
+
+    A cancelled run is checked before the call and between streamed chunks;
+    a blocking call that is already in flight runs to completion.
+    """
+    check_cancelled()
+    if request.on_token is None:
+        response = request.llm.invoke(request.prompt)
+    else:
+        response = None
+        for chunk in request.llm.stream(request.prompt):
+            check_cancelled()
+            request.on_token(chunk.content)
+            response = chunk if response is None else response + chunk
+        if response is None:
+            raise ValueError("Model returned an empty stream")
+    check_cancelled()
+    record_llm_usage(request.llm, request.prompt, response)
+    return response
+
+async def acall_llm(request: LLMCall) -> Any:
+    """Async variant of call_llm; cancelling the run aborts the call in flight"""
+    async def call():
+        if request.on_token is None:
+            return await request.llm.ainvoke(request.prompt)
+        response = None
+        async for chunk in request.llm.astream(request.prompt):
+            request.on_token(chunk.content)
+            response = chunk if response is None else response + chunk
+        if response is None:
+            raise ValueError("Model returned an empty stream")
+        return response
+
+    response = await cancellable(call())
+    record_llm_usage(request.llm, request.prompt, response)
+    return response
+
+def run_node(steps: NodeSteps) -> Dict[str, Any]:
+    """Run a node generator, answering each LLM request with a blocking call"""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                response = call_llm(request)
+            except RunCancelled:
+                # Cancellation ends the node instead of reaching its error handling
+                steps.close()
+                raise
+            except Exception as e:
+                # Let the node handle the error the way it always has
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as done:
+        return done.value
+
+async def arun_node(steps: NodeSteps) -> Dict[str, Any]:
+    """Run a node generator, answering each LLM request with an async call"""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                response = await acall_llm(request)
+            except RunCancelled:
+                steps.close()
+                raise
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as done:
+        return done.value
 
 
 ### Nodes
-def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def improve_question_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
     """Improve the question for clarity and completeness"""
     writer({"msg": "Improving question for clarity and completeness..."})
     
@@ -122,7 +245,7 @@ def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any])
     
     try:
         formatted_prompt = improvement_prompt.format(question=state["question"])
-        improved_question = llm.invoke(formatted_prompt)
+        improved_question = yield LLMCall(llm, formatted_prompt)
         writer({"msg": "Question improved successfully"})
         
         return {"improved_question": improved_question.content}
@@ -131,7 +254,7 @@ def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any])
         writer({"msg": f"Error improving question: {str(e)}"})
         return {}
 
-def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def generate_scored_checklist_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
     """Generate a checklist of requirements for a well-formed answer"""
     writer({"msg": "Generating answer requirements checklist..."})
     
@@ -149,7 +272,7 @@ def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[s
             question=state["improved_question"],
             format_instructions=format_instructions
         )
-        checklist_response = llm.invoke(formatted_prompt)
+        checklist_response = yield LLMCall(llm, formatted_prompt)
         
         # Parse the response into checklist items
         parsed_response = parser.parse(checklist_response.content)
@@ -162,8 +285,8 @@ def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[s
         writer({"msg": f"Error generating checklist: {str(e)}"})
         return {}
 
-def generate_query(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
-    """Generate a search query based on the question and checklist"""
+def generate_query_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
+    """Generate search queries based on the question and checklist"""
     writer({"msg": "Generating search query..."})
     
     if not validate_state(state):
@@ -171,34 +294,66 @@ def generate_query(state: State, writer: StreamWriter, config: Dict[str, Any]) -
         return {}
     
     llm = getModel("query_model", config, writer)
-    query_generator_prompt = create_query_generator_prompt()
+    max_queries = config["configurable"].get("max_parallel_queries", MAX_PARALLEL_QUERIES)
+    score_threshold = config["configurable"].get("score_threshold", SCORE_THRESHOLD)
+    unmet_items = [item for item in state.get("scored_checklist", []) if item.get("current_score", 0) < score_threshold]
     
     try:
-        formatted_prompt = query_generator_prompt.format(
-            question=state["improved_question"],
-            checklist=json.dumps(state["scored_checklist"]),
-            query_history=json.dumps(state.get("query_history", []))
-        )
-        
-        query_response = llm.invoke(formatted_prompt)
-        # Strip any quotes from the query
-        new_query = query_response.content.strip().strip('"\'')
+        if max_queries > 1 and len(unmet_items) > 1:
+            # One query per unmet checklist item, searched in parallel
+            parser = PydanticOutputParser(pydantic_object=QueryListResponse)
+            format_instructions = parser.get_format_instructions()
+            multi_query_prompt = create_multi_query_generator_prompt(format_instructions)
+            formatted_prompt = multi_query_prompt.format(
+                question=state["improved_question"],
+                checklist=json.dumps(unmet_items[:max_queries]),
+                query_history=json.dumps(state.get("query_history", [])),
+                max_queries=max_queries,
+                current_date=current_date(),
+                format_instructions=format_instructions
+            )
+            query_response = yield LLMCall(llm, formatted_prompt)
+            parsed_response = parser.parse(query_response.content)
+            new_queries = [query.strip().strip('"\'') for query in parsed_response.queries if query.strip()][:max_queries]
+            if not new_queries:
+                raise ValueError("No queries returned")
+        else:
+            if state.get("scored_checklist"):
+                query_generator_prompt = create_query_generator_prompt()
+                formatted_prompt = query_generator_prompt.format(
+                    question=state["improved_question"],
+                    checklist=json.dumps(state["scored_checklist"]),
+                    query_history=json.dumps(state.get("query_history", [])),
+                    current_date=current_date()
+                )
+            else:
+                # First iteration: the checklist is being generated in parallel
+                formatted_prompt = create_initial_query_prompt().format(question=state["improved_question"], current_date=current_date())
+            
+            query_response = yield LLMCall(llm, formatted_prompt)
+            # Strip any quotes from the query
+            new_queries = [query_response.content.strip().strip('"\'')]
         
-        # Update query history
-        query_history = state.get("query_history", [])
-        query_history.append(new_query)
+        # Update query history without mutating the list held by the caller
+        query_history = state.get("query_history", []) + new_queries
         
-        writer({"msg": "Search query generated successfully"})
+        if len(new_queries) > 1:
+            writer({"msg": f"Generated {len(new_queries)} search queries"})
+        else:
+            writer({"msg": "Search query generated successfully"})
         return {
-            "current_query": new_query,
-            "query_history": query_history
+            "current_query": new_queries[0],
+            "current_queries": new_queries,
+            "query_history": query_history,
+            "iteration": state.get("iteration", 0) + 1,
+            "search_results": None  # Start this iteration's merged results afresh
         }
         
     except Exception as e:
         writer({"msg": f"Error generating search query: {str(e)}"})
         return {}
 
-def search(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]:
+def search(state: State, writer: StreamWriter) -> Dict[str, Any]:
     """Perform a search using the generated query"""
     if writer:
         writer({"msg": "Performing search..."})
@@ -213,22 +368,47 @@ def search(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]:
             writer({"msg": "Error: TAVILY_API_KEY not set"})
             return {}
         
-        # Initialize Tavily search
-        search = TavilySearchResults(api_key=TAVILY_API_KEY, max_results=MAX_SEARCH_RESULTS)
-        
         # Get the current query from state
         current_query = state.get("current_query")
         if not current_query:
             writer({"msg": "Error: No search query available"})
             return {}
         
+        # Serve repeated and near-duplicate queries without calling Tavily,
+        # unless a cassette is recording or replaying every call
+        provider = f"tavily:{MAX_SEARCH_RESULTS}"
+        search_cache = None if get_cassette() else get_search_cache()
+        cached_results = search_cache.get(provider, current_query) if search_cache else None
+        if cached_results is not None:
+            if writer:
+                writer({"msg": "Search results served from cache"})
+            return {"search_results": cached_results}
+        
+        # Initialize Tavily search
+        search = TavilySearchResults(api_key=TAVILY_API_KEY, max_results=MAX_SEARCH_RESULTS)
+        
+        def tavily_search():
+            results = search.invoke(current_query)
+            if isinstance(results, str):
+                # The tool returns the exception it caught as a string
+                raise ReturnedError(results)
+            return results
+        
         # Perform the search
-        search_results = search.invoke(current_query)
+        search_results = cassette_search(provider, current_query, lambda: get_limiter("tavily").call(tavily_search))
+        
+        # Anything but a list of results is an error, never cached or merged into state
+        if not isinstance(search_results, list):
+            writer({"msg": f"Error performing search: {str(search_results)}"})
+            return {}
         
         if not search_results:
             writer({"msg": "Warning: No search results found. The answer will be generated without external sources."})
             return {"search_results": []}
         
+        if search_cache:
+            search_cache.put(provider, current_query, search_results)
+        
         if writer:
             writer({"msg": "Search completed successfully"})
         return {"search_results": search_results}
@@ -237,7 +417,7 @@ def search(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]:
         writer({"msg": f"Error performing search: {str(e)}"})
         return {}
 
-def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]:
+def search2(state: State, writer: StreamWriter) -> Dict[str, Any]:
     """Perform a search using SerpAPI instead of Tavily"""
 
 
@@ -260,6 +440,15 @@ def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]
             writer({"msg": "Error: No search query available"})
             return {}
         
+        # Serve repeated and near-duplicate queries without calling SerpAPI,
+        # unless a cassette is recording or replaying every call
+        search_cache = None if get_cassette() else get_search_cache()
+        cached_results = search_cache.get("serpapi", current_query) if search_cache else None
+        if cached_results is not None:
+            if writer:
+                writer({"msg": "Search results served from cache"})
+            return {"search_results": cached_results}
+        
         # Perform the search using SerpAPI
         params = {
             "engine": "google",
@@ -268,7 +457,16 @@ def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]
         }
         
         search = GoogleSearch(params)
-        results = search.get_dict()
+        
+        def serpapi_search():
+            results = search.get_dict()
+            error = results.get("error")
+            # SerpAPI reports failures, throttling included, in the response body
+            if error and "hasn't returned any results" not in error:
+                raise ReturnedError(error)
+            return results
+        
+        results = cassette_search("serpapi", current_query, lambda: get_limiter("serpapi").call(serpapi_search))
         
         # Format results to match Tavily's format
         formatted_results = []
@@ -284,7 +482,10 @@ def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]
         if not formatted_results:
             if writer:
                 writer({"msg": "Warning: No search results found. The answer will be generated without external sources."})
-            return {"search_results": [1,2,3]}  
+            return {"search_results": []}
+        
+        if search_cache:
+            search_cache.put("serpapi", current_query, formatted_results)
         
         if writer:
             writer({"msg": "Search completed successfully with SerpAPI"})
@@ -295,7 +496,7 @@ def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]
             writer({"msg": f"Error performing search with SerpAPI: {str(e)}"})
         return {}
 
-def get_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def get_best_urls_from_search_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
     """Analyze search results to identify the most relevant URLs for answering the question"""
 
     if writer:
@@ -319,7 +520,7 @@ def get_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[s
             format_instructions=format_instructions
         )
         
-        url_response = llm.invoke(formatted_prompt)
+        url_response = yield LLMCall(llm, formatted_prompt)
 
         # Parse the response using Pydantic
         try:
@@ -339,7 +540,7 @@ def get_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[s
         writer({"msg": f"Error selecting URLs: {str(e)}"})
         return {"urls_to_scrape": []}
 
-def scrape_urls(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def scrape_urls(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
     """Scrape the URLs and return the content"""
 
     if writer:
@@ -351,55 +552,54 @@ def scrape_urls(state: State, writer: StreamWriter, config: Dict[str, Any]) -> A
     
     # Extract URLs from URLWithScore objects
     urls_to_scrape = [url_obj.url for url_obj in state.get("urls_to_scrape")]
+    url_scores = {url_obj.url: url_obj.score for url_obj in state.get("urls_to_scrape")}
 
-    docs = []
-    for url in urls_to_scrape:
-        try:
-            # Configure WebBaseLoader with proper headers and timeouts
-            loader = WebBaseLoader(
-                web_paths=[url],
-                requests_kwargs={
-                    "headers": {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                        "Accept-Language": "en-US,en;q=0.5",
-                    },
-                    "timeout": 10,  # 10 second timeout
-                    "verify": True,  # Verify SSL certificates
-                }
-            )
-
-            # Try to load the content with retries
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    print("--------------------------------")
-                    print("attempt", attempt)
-                    print("--------------------------------")
-                    for doc in loader.lazy_load():
-                        print("--------------------------------")
-                        print(doc)
-                        print("--------------------------------")
-                        docs.append(doc)
-                    break  # Success, exit retry loop
-                except Exception as e:
-                    if attempt == max_retries - 1:  # Last attempt
-                        if writer:
-                            writer({"msg": f"Failed to scrape {url} after {max_retries} attempts: {str(e)}"})
-                    else:
-                        print("error", e)
-                        time.sleep(1)  # Wait before retrying
-                        continue
-            
-        except Exception as e:
-            if writer:
-                writer({"msg": f"Error scraping {url}: {str(e)}"})
-            continue
+    # Fetch all pages at once; latency is bounded by the slowest page
+    cache = None if get_cassette() else get_page_cache()
+    docs = scrape_pages(urls_to_scrape, writer, cache=cache, fetch=cassette_fetch(fetch_document, is_retryable), cancel_token=current_token())
 
-    return {"scraped_content": docs}
-
-def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
-    """Update the knowledge base with new information from search results"""
+    if writer:
+        raw_bytes = sum(doc.metadata.get("raw_bytes", len(doc.page_content)) for doc in docs)
+        kept_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in docs)
+        writer({"msg": f"Scraped {len(docs)} of {len(urls_to_scrape)} URLs"})
+        writer({"msg": f"Kept {kept_bytes:,} bytes of main content from {raw_bytes:,} bytes of pages"})
+
+    # Keep the best scored copy of syndicated or mirrored pages
+    across_runs = config["configurable"].get("dedupe_across_runs", DEDUPE_ACROSS_RUNS)
+    docs, dropped = filter_near_duplicates(docs, url_scores, get_fingerprint_index() if across_runs else None)
+    if dropped and writer:
+        copies = ", ".join(f"{item['url']} (copy of {item['duplicate_of']})" for item in dropped)
+        writer({"msg": f"Dropped {len(dropped)} near-duplicate pages: {copies}"})
+
+    return {"scraped_content": docs, "dropped_duplicates": dropped}
+
+def result_text(result: Dict) -> str:
+    """The text of a search result used to judge relevance"""
+    return f"{result.get('title', '')} {result.get('content') or result.get('snippet', '')}"
+
+def nugget_priorities(nuggets: List[KnowledgeNugget], queries: List[str], writer: StreamWriter) -> Callable[[], List[float]]:
+    """Prompt priority of each nugget: relevance to the queries weighted by confidence"""
+    def priorities() -> List[float]:
+        similarities = KnowledgeBaseIndex(nuggets, get_embeddings(), writer).scores(queries)
+        return [(1 + similarity) / 2 * nugget.confidence for similarity, nugget in zip(similarities, nuggets)]
+    return priorities
+
+def report_dropped(writer: StreamWriter, label: str, packed: PackedItems, total: int, budget: int):
+    """Tell the user which content did not fit into a prompt"""
+    if not packed.dropped:
+        return
+    nugget_ids = [getattr(item, "nugget_id", None) for item in packed.dropped]
+    details = f": {', '.join(nugget_ids)}" if all(nugget_ids) else ""
+    writer({"msg": f"Dropped {len(packed.dropped)} of {total} {label} to fit the {budget} token prompt budget{details}"})
+
+def passage_queries(state: State, config: Dict[str, Any]) -> List[str]:
+    """Checklist items still below the score threshold, or the question when all are met"""
+    threshold = config["configurable"].get("score_threshold", SCORE_THRESHOLD)
+    unmet = [item["item_to_score"] for item in state.get("scored_checklist", []) if item.get("current_score", 0) < threshold]
+    return unmet or [state.get("improved_question") or state["question"]]
+
+def update_knowledge_base_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
+    """Update the knowledge base with new information from search results and scraped pages"""
     writer({"msg": "Updating knowledge base..."})
     
     if not validate_state(state):
@@ -407,59 +607,96 @@ def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str,
         return {}
     
     llm = getModel("kb_model", config)
-    parser = PydanticOutputParser(pydantic_object=KBUpdateResponse)
+    parser = PydanticOutputParser(pydantic_object=KBExtractionResponse)
     
     try:
         # Get current knowledge base and search results
         current_kb = state.get("knowledge_base", [])
-        search_results = state.get("search_results", [])
+        # None after the reducer reset at the start of an iteration
+        search_results = state.get("search_results") or []
+        scraped_content = state.get("scraped_content", [])
         
-        if not search_results:
+        if not search_results and not scraped_content:
             writer({"msg": "No new search results to incorporate"})
             return {"knowledge_base": current_kb}
         
+        # Only send the passages of the scraped pages that address unmet checklist items
+        passage_index = PassageIndex(scraped_content, get_embeddings(), writer)
+        passages = passage_index.top_k(passage_queries(state, config), config["configurable"].get("passage_top_k", PASSAGE_TOP_K))
+        if len(passage_index):
+            writer({"msg": f"Selected {len(passages)} of {len(passage_index)} passages from {len(scraped_content)} scraped pages"})
+        
+        # Only send the existing nuggets most relevant to the new results, or
+        # to the open checklist items when this iteration has no search results
+        kb_queries = [result_text(result) for result in search_results] or passage_queries(state, config)
+        top_k = config["configurable"].get("kb_prompt_top_k", KB_PROMPT_TOP_K)
+        if len(current_kb) > top_k:
+            kb_index = KnowledgeBaseIndex(current_kb, get_embeddings(), writer)
+            relevant_kb = kb_index.top_k(kb_queries, top_k)
+            writer({"msg": f"Sending {len(relevant_kb)} of {len(current_kb)} knowledge nuggets for update"})
+        else:
+            relevant_kb = current_kb
+        
         # Get format instructions and create prompt
         format_instructions = parser.get_format_instructions()
         kb_update_prompt = create_kb_update_prompt(format_instructions)
+        today = current_date()
+        
+        def format_prompt(current_kb_json: str, search_results_json: str, passages_json: str) -> str:
+            return kb_update_prompt.format(
+                question=state["improved_question"],
+                current_kb=current_kb_json,
+                search_results=search_results_json,
+                passages=passages_json,
+                current_date=today,
+                format_instructions=format_instructions
+            )
         
-        # Format the prompt with current KB and new search results
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        formatted_prompt = kb_update_prompt.format(
-            question=state["improved_question"],
-            current_kb=json.dumps([nugget.dict() for nugget in current_kb]),
-            search_results=json.dumps(search_results),
-            current_date=current_date,
-            format_instructions=format_instructions
+        # Fit the nuggets, the passages and then the search results into the node's token budget
+        model_name = config["configurable"].get("kb_model", DEFAULT_MODEL)
+        budget = prompt_budget("kb_model", config) - count_tokens(format_prompt("[]", "[]", "[]"), model_name)
+        packed_kb = pack_items(
+            relevant_kb,
+            int(budget * KB_PROMPT_BUDGET_SHARE),
+            model_name,
+            priorities=nugget_priorities(relevant_kb, kb_queries, writer),
+            to_text=lambda nugget: json.dumps(nugget.model_dump())
+        )
+        packed_passages = pack_items(
+            passages,
+            int(budget * KB_PASSAGE_BUDGET_SHARE),
+            model_name,
+            to_text=lambda passage: json.dumps(passage.to_prompt())
+        )
+        packed_results = pack_items(search_results, budget - packed_kb.tokens - packed_passages.tokens, model_name)
+        report_dropped(writer, "knowledge nuggets", packed_kb, len(relevant_kb), budget)
+        report_dropped(writer, "page passages", packed_passages, len(passages), budget)
+        report_dropped(writer, "search results", packed_results, len(search_results), budget)
+        
+        # Format the prompt with relevant KB, page passages and new search results
+        formatted_prompt = format_prompt(
+            json.dumps([nugget.model_dump() for nugget in packed_kb.kept]),
+            json.dumps(packed_results.kept),
+            json.dumps([passage.to_prompt() for passage in packed_passages.kept])
         )
         
         # Get LLM's analysis of how to update the KB
-        kb_update_response = llm.invoke(formatted_prompt)
+        kb_update_response = yield LLMCall(llm, formatted_prompt)
         
         try:
             # Parse the response using Pydantic
-            update_data = parser.parse(kb_update_response.content)
-            
-            # Update the knowledge base
-            updated_kb = current_kb.copy()
+            extraction = parser.parse(kb_update_response.content)
             
-            # Process updated nuggets
-            for update in update_data.updated_nuggets:
-                # Find the existing nugget
-                existing_nugget = next((n for n in updated_kb if n.nugget_id == update.nugget_id), None)
-                if existing_nugget:
-                    # Update the nugget with new values
-                    if update.content is not None:
-                        existing_nugget.content = update.content
-                    if update.confidence is not None:
-                        existing_nugget.confidence = update.confidence
-                    if update.conflicts_with is not None:
-                        existing_nugget.conflicts_with = update.conflicts_with
+            # Merge the extracted facts locally: known content from a new
+            # source corroborates the nugget rather than adding a copy
+            knowledge_base = KnowledgeBase(current_kb)
+            outcomes = {"added": 0, "corroborated": 0, "repeated": 0}
+            for fact in extraction.new_nuggets:
+                result = knowledge_base.add(fact.content, fact.source_url, fact.confidence, fact.conflicts_with)
+                outcomes[result.outcome] += 1
             
-            # Add new nuggets
-            updated_kb.extend(update_data.new_nuggets)
-            
-            writer({"msg": "Knowledge base updated successfully"})
-            return {"knowledge_base": updated_kb}
+            writer({"msg": f"Knowledge base updated: {outcomes['added']} new, {outcomes['corroborated']} corroborated, {outcomes['repeated']} repeated nuggets"})
+            return {"knowledge_base": knowledge_base.to_list()}
             
         except Exception as parse_error:
             print("Error parsing KB update:", str(parse_error))
@@ -472,7 +709,7 @@ def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str,
         writer({"msg": f"Error updating knowledge base: {str(e)}"})
         return {"knowledge_base": current_kb}
 
-def generate_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def generate_answer_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
     """Generate an answer to the improved question in markdown format"""
     writer({"msg": "Generating answer ..."})
     
@@ -491,15 +728,36 @@ def generate_answer(state: State, writer: StreamWriter, config: Dict[str, Any])
         checklist = state.get("scored_checklist", [])
         knowledge_base = state.get("knowledge_base", [])
         
-        # Format the prompt with all necessary information and markdown instruction
-        formatted_prompt = answer_prompt.format(
-            question=question_to_use,
-            checklist=json.dumps([item["item_to_score"] for item in checklist]),
-            knowledge_base=json.dumps([nugget.dict() for nugget in knowledge_base]),
-            format_instructions="Please format your answer in markdown, using appropriate headings, lists, and formatting to make the information clear and well-structured."
+        checklist_items = [item["item_to_score"] for item in checklist]
+        
+        today = current_date()
+        
+        def format_prompt(knowledge_base_json: str) -> str:
+            return answer_prompt.format(
+                question=question_to_use,
+                current_date=today,
+                checklist=json.dumps(checklist_items),
+                knowledge_base=knowledge_base_json,
+                format_instructions="Please format your answer in markdown, using appropriate headings, lists, and formatting to make the information clear and well-structured."
+            )
+        
+        # Keep the nuggets most relevant to the question and checklist that fit the token budget
+        model_name = config["configurable"].get("answer_model", DEFAULT_MODEL)
+        budget = prompt_budget("answer_model", config) - count_tokens(format_prompt("[]"), model_name)
+        packed_kb = pack_items(
+            knowledge_base,
+            budget,
+            model_name,
+            priorities=nugget_priorities(knowledge_base, [question_to_use] + checklist_items, writer),
+            to_text=lambda nugget: json.dumps(nugget.model_dump())
         )
+        report_dropped(writer, "knowledge nuggets", packed_kb, len(knowledge_base), budget)
         
-        answer = llm.invoke(formatted_prompt)
+        # Format the prompt with all necessary information and markdown instruction
+        formatted_prompt = format_prompt(json.dumps([nugget.model_dump() for nugget in packed_kb.kept]))
+        
+        # Stream tokens on the custom channel so the answer renders as it is written
+        answer = yield LLMCall(llm, formatted_prompt, on_token=lambda token: writer({"answer_token": token}))
         writer({"msg": "Answer generated successfully"})
         
         return {"answer": answer.content}
@@ -508,7 +766,7 @@ def generate_answer(state: State, writer: StreamWriter, config: Dict[str, Any])
         writer({"msg": f"Error generating answer: {str(e)}"})
         return {}
 
-def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+def score_answer_steps(state: State, writer: StreamWriter, config: Dict[str, Any]) -> NodeSteps:
     """Score the answer against the checklist requirements"""
     writer({"msg": "Scoring answer against requirements..."})
     
@@ -529,7 +787,7 @@ def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) ->
             format_instructions=format_instructions
         )
         
-        scoring_response = llm.invoke(formatted_prompt)
+        scoring_response = yield LLMCall(llm, formatted_prompt)
         parsed_response = parser.parse(scoring_response.content)
         
         # Convert Pydantic model back to dict format
@@ -542,7 +800,82 @@ def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) ->
         writer({"msg": f"Error scoring answer: {str(e)}"})
         return {}
 
+### Node entry points
+def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Improve the question for clarity and completeness"""
+    return run_node(improve_question_steps(state, writer, config))
+
+def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate a checklist of requirements for a well-formed answer"""
+    return run_node(generate_scored_checklist_steps(state, writer, config))
+
+def generate_query(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate a search query based on the question and checklist"""
+    return run_node(generate_query_steps(state, writer, config))
+
+def get_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze search results to identify the most relevant URLs for answering the question"""
+    return run_node(get_best_urls_from_search_steps(state, writer, config))
+
+def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Update the knowledge base with new information from search results"""
+    return run_node(update_knowledge_base_steps(state, writer, config))
+
+def generate_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate an answer to the improved question in markdown format"""
+    return run_node(generate_answer_steps(state, writer, config))
+
+def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Score the answer against the checklist requirements"""
+    return run_node(score_answer_steps(state, writer, config))
+
+### Async node entry points
+async def aimprove_question(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of improve_question"""
+    return await arun_node(improve_question_steps(state, writer, config))
+
+async def agenerate_scored_checklist(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of generate_scored_checklist"""
+    return await arun_node(generate_scored_checklist_steps(state, writer, config))
+
+async def agenerate_query(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of generate_query"""
+    return await arun_node(generate_query_steps(state, writer, config))
+
+async def asearch(state: State, writer: StreamWriter) -> Dict[str, Any]:
+    """Async variant of search; the provider client is blocking so it runs in a worker thread"""
+    return await asyncio.to_thread(search, state, writer)
+
+async def asearch2(state: State, writer: StreamWriter) -> Dict[str, Any]:
+    """Async variant of search2; the provider client is blocking so it runs in a worker thread"""
+    return await asyncio.to_thread(search2, state, writer)
+
+async def aget_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of get_best_urls_from_search"""
+    return await arun_node(get_best_urls_from_search_steps(state, writer, config))
+
+async def ascrape_urls(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of scrape_urls; the scraper keeps its own thread pool off the event loop"""
+    return await asyncio.to_thread(scrape_urls, state, writer, config)
+
+async def aupdate_knowledge_base(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of update_knowledge_base"""
+    return await arun_node(update_knowledge_base_steps(state, writer, config))
+
+async def agenerate_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of generate_answer"""
+    return await arun_node(generate_answer_steps(state, writer, config))
+
+async def ascore_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of score_answer"""
+    return await arun_node(score_answer_steps(state, writer, config))
+
 ### Conditions
+def dispatch_searches(state: State) -> List[Send]:
+    """Send every query of this iteration to its own search2 branch"""
+    queries = state.get("current_queries") or [state.get("current_query")]
+    return [Send("search2", {**state, "current_query": query}) for query in queries]
+
 def should_continue_searching(state: State, config: Dict[str, Any], writer: StreamWriter) -> bool:
     """Check if we should continue searching based on checklist scores and max iterations"""
     writer({"msg": "Evaluating whether to continue searching..."})
@@ -552,8 +885,8 @@ def should_continue_searching(state: State, config: Dict[str, Any], writer: Stre
         writer({"msg": "No checklist available, stopping search"})
         return False
     
-    # Get current iteration count from query history
-    current_iterations = len(state.get("query_history", []))
+    # Get current iteration count
+    current_iterations = state.get("iteration", 0)
     max_iterations = config["configurable"]["max_iterations"]
     
     # Check if we've reached max iterations
@@ -573,40 +906,83 @@ def should_continue_searching(state: State, config: Dict[str, Any], writer: Stre
         return False
 
 ### Graph
+NODES = {
+    "improve_question": improve_question,
+    "generate_scored_checklist": generate_scored_checklist,
+    "generate_initial_query": generate_query,
+    "generate_query": generate_query,
+    "search2": search2,
+    "get_best_urls_from_search": get_best_urls_from_search,
+    "scrape_urls": scrape_urls,
+    "update_knowledge_base": update_knowledge_base,
+    "generate_answer": generate_answer,
+    "score_answer": score_answer,
+}
+
+ASYNC_NODES = {
+    "improve_question": aimprove_question,
+    "generate_scored_checklist": agenerate_scored_checklist,
+    "generate_initial_query": agenerate_query,
+    "generate_query": agenerate_query,
+    "search2": asearch2,
+    "get_best_urls_from_search": aget_best_urls_from_search,
+    "scrape_urls": ascrape_urls,
+    "update_knowledge_base": aupdate_knowledge_base,
+    "generate_answer": agenerate_answer,
+    "score_answer": ascore_answer,
+}
+
+def build_graph(nodes: Dict[str, Callable]) -> StateGraph:
+    """Wire the RAVE workflow from a set of node functions"""
+    graph_builder = StateGraph(State)
+
+    # Add nodes, each timed and metered by the instrumentation wrapper
+    for name, node in nodes.items():
+        graph_builder.add_node(name, instrument_node(name, node))
+
+    # Add edges
+    graph_builder.add_edge(START, "improve_question")
+    # The checklist and the first query only need the improved question, so
+    # they run as parallel branches and search2 waits for both of them
+    graph_builder.add_edge("improve_question", "generate_scored_checklist")
+    graph_builder.add_edge("improve_question", "generate_initial_query")
+    graph_builder.add_edge(["generate_scored_checklist", "generate_initial_query"], "search2")
+    # Later iterations come back through generate_query, which may fan out
+    # several queries; their results are merged by the search_results reducer
+    graph_builder.add_conditional_edges("generate_query", dispatch_searches, ["search2"])
+    graph_builder.add_edge("search2", "get_best_urls_from_search")
+    graph_builder.add_edge("get_best_urls_from_search", "scrape_urls")
+    graph_builder.add_edge("scrape_urls", "update_knowledge_base")
+    graph_builder.add_edge("update_knowledge_base", "generate_answer")
+    graph_builder.add_edge("generate_answer", "score_answer")
+    graph_builder.add_conditional_edges(
+        "score_answer",
+        should_continue_searching,
+        {
+            True: "generate_query",  # If scores < threshold, go back to generate_query
+            False: END  # If all scores are above threshold, we're done
+        }
+    )
+    return graph_builder
 
 # Define the graph
-graph_builder = StateGraph(State)
-
-# Add nodes
-graph_builder.add_node("improve_question", improve_question)
-graph_builder.add_node("generate_scored_checklist", generate_scored_checklist)
-graph_builder.add_node("generate_query", generate_query)
-graph_builder.add_node("search2", search2)
-graph_builder.add_node("get_best_urls_from_search", get_best_urls_from_search)
-graph_builder.add_node("scrape_urls", scrape_urls)
-graph_builder.add_node("update_knowledge_base", update_knowledge_base)
-graph_builder.add_node("generate_answer", generate_answer)
-graph_builder.add_node("score_answer", score_answer)
-
-# Add edges
-graph_builder.add_edge(START, "improve_question")
-graph_builder.add_edge("improve_question", "generate_scored_checklist")
-graph_builder.add_edge("generate_scored_checklist", "generate_query")
-graph_builder.add_edge("generate_query", "search2")
-graph_builder.add_edge("search2", "get_best_urls_from_search")
-graph_builder.add_edge("get_best_urls_from_search", "scrape_urls")
-graph_builder.add_edge("scrape_urls", "update_knowledge_base")
-graph_builder.add_edge("update_knowledge_base", "generate_answer")
-graph_builder.add_edge("generate_answer", "score_answer")
-graph_builder.add_conditional_edges(
-    "score_answer",
-    should_continue_searching,
-    {
-        True: "generate_query",  # If scores < threshold, go back to generate_query
-        False: END  # If all scores are above threshold, we're done
-    }
-)
+graph_builder = build_graph(NODES)
 
 # Compile the graph
 compiled = graph_builder.compile()
-graph = compiled 
\ No newline at end of file
+
+graph = compiled
+
+# Interactive runs are checkpointed after every step under the thread id of
+# their session, so an interrupted run resumes where it stopped
+resumable_graph = graph_builder.compile(checkpointer=get_checkpointer())
+
+# The same workflow with async nodes, for serving many sessions on one event loop
+async_graph_builder = build_graph(ASYNC_NODES)
+async_graph = async_graph_builder.compile()
+
+async def astream(initial_state: Dict[str, Any], config: Dict[str, Any], stream_mode: Optional[List[str]] = None) -> AsyncIterator[Any]:
+    """Stream a research run on the async graph"""
+    stream_mode = stream_mode or ["values", "custom"]
+    async for output in async_graph.astream(initial_state, config=config, stream_mode=stream_mode):
+        yield output
@@ -0,0 +1,122 @@
+"""Cooperative cancellation of research runs.
+
+A run is cancelled through the CancellationToken passed in its config as
+configurable["cancel_token"]. instrument_node makes the token of the run
+current while a node executes, and checks it before the node starts. The
+LLM drivers check it around every model call and abort in-flight async
+calls, and scrape_pages stops scheduling fetches and retries. Once the token
+is set the run raises RunCancelled out of the graph, leaving the last
+checkpoint in place so the run can still be resumed.
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class RunCancelled(Exception):
+    """Raised inside a run whose cancellation token was set"""
+
+
+class CancellationToken:
+    """A thread-safe flag that cancels a run when set"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the run; callbacks registered with on_cancel run once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RunCancelled("Run was cancelled")
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep for up to timeout seconds, waking early on cancellation"""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call callback on cancellation, right away if already cancelled.
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+# Token of the run the current node belongs to
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("cancel_token", default=None)
+
+
+def config_token(config: Optional[Dict[str, Any]]) -> Optional[CancellationToken]:
+    """The cancellation token of a run config, if it has one"""
+    return ((config or {}).get("configurable") or {}).get("cancel_token")
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Raise RunCancelled if the current run was cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancellation_scope(token: Optional[CancellationToken]) -> Iterator[None]:
+    """Make token current for the code run inside the scope"""
+    reset = _current_token.set(token)
+    try:
+        yield
+    finally:
+        _current_token.reset(reset)
+
+
+async def cancellable(awaitable: Any) -> Any:
+    """Await awaitable, aborting it as soon as the current run is cancelled.
+
+    The awaitable runs as a task that is cancelled from the cancelling
+    thread, so an HTTP request in flight is dropped instead of awaited.
+    """
+    token = _current_token.get()
+    if token is None:
+        return await awaitable
+    token.raise_if_cancelled()
+
+    task = asyncio.ensure_future(awaitable)
+    loop = asyncio.get_running_loop()
+    unregister = token.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if token.cancelled:
+            raise RunCancelled("Run was cancelled") from None
+        raise
+    finally:
+        unregister()
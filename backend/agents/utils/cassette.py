@@ -0,0 +1,349 @@
+"""Record/replay cassettes for model, search and page calls.
+
+In record mode every request to OpenAI, SerpAPI, Tavily or a scraped site
+is passed through and its response appended to a JSONL cassette, keyed by a
+stable hash of the request (the prompt and model, the query, or the URL).
+In replay mode the same requests are served from the cassette without any
+network access, optionally sleeping for the recorded latency. A request
+made several times replays its recordings in the order they were captured.
+
+Caches are bypassed while a cassette is active, so a recording captures
+every call and a replay does not depend on local cache state.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from ...config.settings import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY_SCALE
+from .page_cache import normalize_url
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(KeyError):
+    """A replayed request that was never recorded"""
+
+
+class ReplayedError(Exception):
+    """An error that was recorded instead of a response"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Stable hash of a request"""
+    payload = json.dumps({"kind": kind, **request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Interactions recorded to, or replayed from, a JSONL file"""
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._played: Dict[str, int] = defaultdict(int)
+        self._interactions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Prompts contain the date, so a replay pretends it is still the day of the recording
+        self.date = datetime.now().strftime("%Y-%m-%d")
+
+        if mode == "record":
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A recording always starts from an empty cassette
+            with open(path, "w") as f:
+                f.write(json.dumps({"kind": "meta", "date": self.date}) + "\n")
+        else:
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    interaction = json.loads(line)
+                    if interaction["kind"] == "meta":
+                        self.date = interaction["date"]
+                    else:
+                        self._interactions[interaction["key"]].append(interaction)
+
+    def _append(self, interaction: Dict[str, Any]):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(interaction, default=str) + "\n")
+
+    def _next(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """The next recording of a request, repeating the last one once they run out"""
+        key = request_key(kind, request)
+        with self._lock:
+            recordings = self._interactions.get(key)
+            if not recordings:
+                raise CassetteMiss(f"No {kind} recorded for {json.dumps(request, default=str)[:200]}")
+            index = min(self._played[key], len(recordings) - 1)
+            self._played[key] += 1
+            return recordings[index]
+
+    def save(self, kind: str, request: Dict[str, Any], seconds: float, response: Any = None,
+             error: Optional[Exception] = None, retryable: bool = True):
+        """Append the response, or the error, of a request to the cassette"""
+        interaction = {"kind": kind, "key": request_key(kind, request), "request": request, "seconds": seconds}
+        if error is not None:
+            interaction.update(error=str(error), retryable=retryable)
+        else:
+            interaction["response"] = response
+        self._append(interaction)
+
+    def record(self, kind: str, request: Dict[str, Any], fetch: Callable[[], Any], encode: Callable[[Any], Any] = lambda r: r,
+               retryable: Callable[[Exception], bool] = lambda e: True) -> Any:
+        """Make a request and record what came back"""
+        started = time.perf_counter()
+        try:
+            response = fetch()
+        except Exception as e:
+            self.save(kind, request, time.perf_counter() - started, error=e, retryable=retryable(e))
+            raise
+        self.save(kind, request, time.perf_counter() - started, response=encode(response))
+        return response
+
+    def replay(self, kind: str, request: Dict[str, Any]) -> Tuple[Any, float, Optional[ReplayedError]]:
+        """The recorded response of a request, the delay to simulate and the recorded error.
+
+        The caller waits out the delay, asynchronously on the async paths, and
+        then raises the error if there is one.
+        """
+        interaction = self._next(kind, request)
+        delay = interaction.get("seconds", 0.0) * self.latency_scale
+        if "error" in interaction:
+            return None, delay, ReplayedError(interaction["error"], interaction.get("retryable", True))
+        return interaction["response"], delay, None
+
+    def call(self, kind: str, request: Dict[str, Any], fetch: Callable[[], Any], encode: Callable[[Any], Any] = lambda r: r,
+             decode: Callable[[Any], Any] = lambda r: r, retryable: Callable[[Exception], bool] = lambda e: True) -> Any:
+        """Record or replay a blocking request"""
+        if self.mode == "record":
+            return self.record(kind, request, fetch, encode, retryable)
+        response, delay, error = self.replay(kind, request)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return decode(response)
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The active cassette, or None when calls go straight to the providers"""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        if not _cassette_loaded:
+            if CASSETTE_MODE not in MODES:
+                raise ValueError(f"RAVE_CASSETTE_MODE must be one of {MODES}, not {CASSETTE_MODE!r}")
+            if CASSETTE_MODE != "off":
+                _cassette = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_LATENCY_SCALE)
+            _cassette_loaded = True
+        return _cassette
+
+
+def current_date() -> str:
+    """Today's date, or the date of the recording while a cassette is active"""
+    cassette = get_cassette()
+    return cassette.date if cassette else datetime.now().strftime("%Y-%m-%d")
+
+
+@contextlib.contextmanager
+def use_cassette(path: str, mode: str, latency_scale: float = 0.0) -> Iterator[Cassette]:
+    """Record or replay every provider call made inside the block"""
+    global _cassette, _cassette_loaded
+    cassette = Cassette(path, mode, latency_scale)
+    with _cassette_lock:
+        previous = (_cassette, _cassette_loaded)
+        _cassette, _cassette_loaded = cassette, True
+    try:
+        yield cassette
+    finally:
+        with _cassette_lock:
+            _cassette, _cassette_loaded = previous
+
+
+### Models
+def message_request(model_name: str, messages: List[BaseMessage]) -> Dict[str, Any]:
+    return {"model": model_name, "messages": [{"type": m.type, "content": m.content} for m in messages]}
+
+
+def encode_message(message: BaseMessage) -> Dict[str, Any]:
+    return {
+        "content": message.content,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+        "response_metadata": getattr(message, "response_metadata", {}),
+    }
+
+
+def token_chunks(text: str) -> List[str]:
+    """Split replayed text into word-sized stream chunks"""
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that records the calls of the wrapped model, or replays them"""
+    llm: Any
+    cassette: Any
+    model_name: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def _request(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        return message_request(self.model_name, messages)
+
+    def _replayed(self, response: Dict[str, Any]) -> AIMessage:
+        return AIMessage(
+            content=response["content"],
+            usage_metadata=response.get("usage_metadata"),
+            response_metadata=response.get("response_metadata") or {}
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self.cassette.call(
+            "llm", self._request(messages), lambda: self.llm.invoke(messages, stop=stop, **kwargs),
+            encode=encode_message, decode=self._replayed
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        request = self._request(messages)
+        if self.cassette.mode == "record":
+            started = time.perf_counter()
+            try:
+                message = await self.llm.ainvoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self.cassette.save("llm", request, time.perf_counter() - started, error=e)
+                raise
+            self.cassette.save("llm", request, time.perf_counter() - started, response=encode_message(message))
+        else:
+            response, delay, error = self.cassette.replay("llm", request)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            message = self._replayed(response)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _replay_chunks(self, response: Dict[str, Any]) -> Iterator[ChatGenerationChunk]:
+        chunks = token_chunks(response["content"])
+        for i, text in enumerate(chunks):
+            last = i == len(chunks) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=text,
+                usage_metadata=response.get("usage_metadata") if last else None
+            ))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        request = self._request(messages)
+        if self.cassette.mode == "replay":
+            response, delay, error = self.cassette.replay("llm", request)
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            yield from self._replay_chunks(response)
+            return
+
+        # Chunks are passed on as they arrive and the whole response is recorded at the end
+        started, response = time.perf_counter(), None
+        try:
+            for chunk in self.llm.stream(messages, stop=stop, **kwargs):
+                response = chunk if response is None else response + chunk
+                yield ChatGenerationChunk(message=chunk)
+        except Exception as e:
+            self.cassette.save("llm", request, time.perf_counter() - started, error=e)
+            raise
+        if response is not None:
+            self.cassette.save("llm", request, time.perf_counter() - started, response=encode_message(response))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        request = self._request(messages)
+        if self.cassette.mode == "replay":
+            response, delay, error = self.cassette.replay("llm", request)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            for chunk in self._replay_chunks(response):
+                yield chunk
+            return
+
+        started, response = time.perf_counter(), None
+        try:
+            async for chunk in self.llm.astream(messages, stop=stop, **kwargs):
+                response = chunk if response is None else response + chunk
+                yield ChatGenerationChunk(message=chunk)
+        except Exception as e:
+            self.cassette.save("llm", request, time.perf_counter() - started, error=e)
+            raise
+        if response is not None:
+            self.cassette.save("llm", request, time.perf_counter() - started, response=encode_message(response))
+
+
+def wrap_model(llm: BaseChatModel) -> BaseChatModel:
+    """Route a model's calls through the active cassette, if there is one"""
+    cassette = get_cassette()
+    if cassette is None:
+        return llm
+    model_name = getattr(llm, "model_name", None) or type(llm).__name__
+    return CassetteChatModel(llm=llm, cassette=cassette, model_name=model_name)
+
+
+### Search and pages
+def cassette_search(provider: str, query: str, search: Callable[[], Any]) -> Any:
+    """Run a search through the active cassette, if there is one"""
+    cassette = get_cassette()
+    if cassette is None:
+        return search()
+    return cassette.call("search", {"provider": provider, "query": query}, search)
+
+
+def encode_document(result: Tuple[Optional[Document], Any]) -> Optional[Dict[str, Any]]:
+    doc, _ = result
+    return {"page_content": doc.page_content, "metadata": doc.metadata} if doc else None
+
+
+def decode_document(response: Optional[Dict[str, Any]]) -> Tuple[Optional[Document], None]:
+    if response is None:
+        return None, None
+    return Document(page_content=response["page_content"], metadata=response["metadata"]), None
+
+
+def cassette_fetch(fetch: Callable, retryable: Callable[[Exception], bool]) -> Callable:
+    """Wrap a scraper fetch function so page loads go through the active cassette"""
+    cassette = get_cassette()
+    if cassette is None:
+        return fetch
+
+    def fetch_through_cassette(url: str, timeout: float, cached: Any = None):
+        return cassette.call(
+            "page", {"url": normalize_url(url)}, lambda: fetch(url, timeout, cached),
+            encode=encode_document, decode=decode_document, retryable=retryable
+        )
+    return fetch_through_cassette
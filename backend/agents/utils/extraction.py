@@ -0,0 +1,280 @@
+"""Main content extraction for scraped pages.
+
+The scraper used to keep everything BeautifulSoup found in a page, so nav
+bars, cookie banners, footers and related-article lists travelled with
+every document through graph state, the UI stream and the prompts. Pages
+are now parsed with lxml and reduced to their main content the way
+Readability does it: boilerplate elements are removed, paragraphs score
+their parent and grandparent by length and commas, scores are discounted by
+link density, and the best scoring element is kept along with siblings
+that score close to it. Pages too short to have a clear main block keep
+their cleaned body text. The text is normalized and repeated lines are
+dropped, since menus and share buttons tend to appear more than once.
+
+PDFs are read with pypdf when it is installed and skipped otherwise.
+"""
+import io
+import re
+import unicodedata
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import lxml.html
+from langchain_core.documents import Document
+from lxml import etree
+
+from ...config.settings import EXTRACT_MIN_CHARS, PDF_MAX_PAGES
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+PDF_CONTENT_TYPES = ("application/pdf", "application/x-pdf")
+
+# Elements that never hold main content
+DROP_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "form", "button", "input", "select", "textarea", "nav", "aside", "footer", "dialog",
+)
+DROP_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog", "menu", "search"}
+
+# Elements rendered on their own lines
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "ol", "p", "pre",
+    "section", "table", "td", "th", "tr", "ul",
+}
+
+# Class and id patterns of boilerplate and of content containers
+NEGATIVE = re.compile(
+    r"ad-|ads\b|advert|banner|breadcrumb|comment|consent|cookie|disqus|footer|gdpr|header|"
+    r"masthead|menu|modal|nav|newsletter|outbrain|pager|pagination|popup|promo|related|"
+    r"share|sidebar|social|sponsor|subscribe|taboola|widget",
+    re.IGNORECASE
+)
+POSITIVE = re.compile(r"article|blog|body|content|entry|main|post|story|text", re.IGNORECASE)
+
+# Paragraphs shorter than this do not vote for a main content element
+MIN_PARAGRAPH_CHARS = 25
+
+
+class SkippedContent(ValueError):
+    """A response that is not worth extracting, such as a non-HTML document"""
+
+
+def is_html(content_type: str) -> bool:
+    """Whether a Content-Type header names HTML; a missing header is assumed to"""
+    media_type = content_type.split(";")[0].strip().lower()
+    return not media_type or media_type in HTML_CONTENT_TYPES
+
+
+def is_pdf(content_type: str, url: str) -> bool:
+    """Whether a response is a PDF, going by the URL when the server is vague"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in PDF_CONTENT_TYPES:
+        return True
+    return media_type in ("", "application/octet-stream") and urlparse(url).path.lower().endswith(".pdf")
+
+
+def pdf_supported() -> bool:
+    return pypdf is not None
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, drop empty lines and keep the first copy of repeated lines"""
+    lines, seen = [], set()
+    for line in unicodedata.normalize("NFKC", text).splitlines():
+        line = " ".join(line.split())
+        key = line.casefold()
+        if not line or key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def render_text(element: etree._Element) -> str:
+    """Text of an element with block elements on their own lines"""
+    parts = []
+    for event, el in etree.iterwalk(element, events=("start", "end")):
+        block = el.tag in BLOCK_TAGS
+        if event == "start":
+            if block:
+                parts.append("\n")
+            if el.text:
+                parts.append(el.text)
+        else:
+            if block:
+                parts.append("\n")
+            if el is not element and el.tail:
+                parts.append(el.tail)
+    return "".join(parts)
+
+
+def text_length(element: etree._Element) -> int:
+    return len(" ".join(element.text_content().split()))
+
+
+def link_density(element: etree._Element) -> float:
+    """Share of an element's text that sits inside links"""
+    total = text_length(element)
+    if not total:
+        return 0.0
+    return sum(text_length(link) for link in element.iter("a")) / total
+
+
+def class_weight(element: etree._Element) -> float:
+    weight = 0.0
+    for attribute in ("class", "id"):
+        value = element.get(attribute)
+        if not value:
+            continue
+        if NEGATIVE.search(value):
+            weight -= 25
+        if POSITIVE.search(value):
+            weight += 25
+    return weight
+
+
+def is_boilerplate(element: etree._Element) -> bool:
+    if element.tag in ("html", "body", "article", "main"):
+        return False
+    if (element.get("role") or "").lower() in DROP_ROLES or element.get("aria-hidden") == "true":
+        return True
+    if element.get("hidden") is not None or "display:none" in (element.get("style") or "").replace(" ", ""):
+        return True
+    names = f"{element.get('class', '')} {element.get('id', '')}"
+    return bool(NEGATIVE.search(names)) and not POSITIVE.search(names)
+
+
+def remove_boilerplate(root: etree._Element):
+    """Strip elements that cannot be main content, keeping their tail text"""
+    etree.strip_elements(root, *DROP_TAGS, with_tail=False)
+    for element in [el for el in root.iter() if isinstance(el.tag, str) and is_boilerplate(el)]:
+        if element.getparent() is not None:
+            element.drop_tree()
+
+
+def initial_score(element: etree._Element) -> float:
+    tag = element.tag
+    if tag in ("article", "main"):
+        score = 10
+    elif tag == "div":
+        score = 5
+    elif tag in ("pre", "td", "blockquote"):
+        score = 3
+    elif tag in ("address", "ol", "ul", "dl", "dd", "dt", "li", "form"):
+        score = -3
+    elif tag in ("h1", "h2", "h3", "h4", "h5", "h6", "th"):
+        score = -5
+    else:
+        score = 0
+    return score + class_weight(element)
+
+
+def main_content(body: etree._Element) -> Optional[str]:
+    """Text of the best scoring content element and its related siblings"""
+    scores: Dict[etree._Element, float] = {}
+    for paragraph in body.iter("p", "pre", "td"):
+        length = text_length(paragraph)
+        if length < MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + paragraph.text_content().count(",") + min(length // 100, 3)
+        parent = paragraph.getparent()
+        grandparent = parent.getparent() if parent is not None else None
+        for ancestor, share in ((parent, 1.0), (grandparent, 0.5)):
+            if ancestor is None or not isinstance(ancestor.tag, str):
+                continue
+            if ancestor not in scores:
+                scores[ancestor] = initial_score(ancestor)
+            scores[ancestor] += score * share
+
+    if not scores:
+        return None
+    for element in scores:
+        scores[element] *= 1 - link_density(element)
+    top = max(scores, key=scores.get)
+
+    # Siblings split off the main block, such as a lead paragraph, come along
+    threshold = max(10, scores[top] * 0.2)
+    parent = top.getparent()
+    kept = [top] if parent is None else [
+        sibling for sibling in parent
+        if sibling is top
+        or scores.get(sibling, float("-inf")) >= threshold
+        or (sibling.tag == "p" and text_length(sibling) > 80 and link_density(sibling) < 0.25)
+    ]
+    return "\n".join(render_text(element) for element in kept)
+
+
+def extract_document(url: str, content: bytes, encoding: Optional[str] = None) -> Document:
+    """Parse an HTML page and keep its normalized main content.
+
+    Args:
+        url: Where the page was fetched from
+        content: The raw response body
+        encoding: Charset from the Content-Type header; lxml falls back to the
+            page's meta charset when it is missing
+
+    Raises:
+        SkippedContent: When the page holds no text
+    """
+    parser = lxml.html.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True)
+    try:
+        root = lxml.html.document_fromstring(content, parser=parser)
+    except (etree.ParserError, ValueError) as e:
+        raise SkippedContent(f"Could not parse {url}: {str(e)}") from e
+
+    metadata = {"source": url, "raw_bytes": len(content)}
+    if (title := root.find(".//title")) is not None:
+        metadata["title"] = title.text_content().strip()
+    if (description := root.find(".//meta[@name='description']")) is not None:
+        metadata["description"] = description.get("content", "No description found.")
+    if root.tag == "html":
+        metadata["language"] = root.get("lang", "No language found.")
+
+    body = root.find("body")
+    if body is None:
+        body = root
+    remove_boilerplate(body)
+    text = normalize_text(main_content(body) or "")
+    if len(text) < EXTRACT_MIN_CHARS:
+        # No clear main block; the cleaned page is still far smaller than the raw one
+        text = normalize_text(render_text(body))
+    if not text:
+        raise SkippedContent(f"No text found in {url}")
+    return Document(page_content=text, metadata=metadata)
+
+
+def extract_pdf(url: str, content: bytes) -> Document:
+    """Extract the text of the first PDF_MAX_PAGES pages of a PDF.
+
+    Raises:
+        SkippedContent: When pypdf is not installed, or the PDF cannot be read
+            or holds no text (e.g. a scan)
+    """
+    if pypdf is None:
+        raise SkippedContent(f"Skipped PDF {url}, install pypdf to read PDFs")
+    try:
+        reader = pypdf.PdfReader(io.BytesIO(content))
+        pages = [page.extract_text() or "" for page in reader.pages[:PDF_MAX_PAGES]]
+        title = (reader.metadata.title if reader.metadata else None) or ""
+    except Exception as e:
+        raise SkippedContent(f"Could not read PDF {url}: {str(e)}") from e
+
+    text = normalize_text("\n".join(pages))
+    if not text:
+        raise SkippedContent(f"No text found in PDF {url}")
+    metadata = {"source": url, "raw_bytes": len(content), "content_type": "application/pdf"}
+    if title.strip():
+        metadata["title"] = title.strip()
+    return Document(page_content=text, metadata=metadata)
+
+
+def extract_content(url: str, content: bytes, content_type: str, encoding: Optional[str] = None) -> Document:
+    """Extract the text of an HTML page or a PDF"""
+    if is_pdf(content_type, url):
+        return extract_pdf(url, content)
+    return extract_document(url, content, encoding)
@@ -0,0 +1,142 @@
+"""Vector index over knowledge base nuggets.
+
+update_knowledge_base used to send the whole knowledge base with every
+update, so the prompt grew every iteration. The index embeds nugget content
+into a NumPy matrix so that only the nuggets most relevant to the new search
+results are sent. Embeddings are cached by text, so each nugget is embedded
+once per process rather than once per iteration.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ...config.settings import EMBEDDING_CACHE_SIZE
+from .prompts import KnowledgeNugget
+from .search_cache import STOP_WORDS
+
+
+class LocalEmbeddings(Embeddings):
+    """Offline embeddings using hashed content-word unigrams and bigrams.
+
+    Much weaker than a real embedding model, but deterministic and free,
+    which makes it the fallback for offline runs and tests.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        words = [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOP_WORDS]
+        vector = np.zeros(self.dimensions)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# Embeddings keyed by (embedder, text digest), least recently used dropped first
+_embedding_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+
+def embed_texts(embedder: Embeddings, texts: List[str]) -> np.ndarray:
+    """Embed texts as unit-length rows, only calling the embedder for unseen texts"""
+    embedder_key = f"{type(embedder).__name__}:{getattr(embedder, 'model', '')}"
+    keys = [(embedder_key, hashlib.sha1(text.encode("utf-8")).hexdigest()) for text in texts]
+
+    vectors: Dict[tuple, np.ndarray] = {}
+    with _embedding_cache_lock:
+        for key in keys:
+            if key in _embedding_cache:
+                _embedding_cache.move_to_end(key)
+                vectors[key] = _embedding_cache[key]
+
+    missing = list(dict.fromkeys((key, text) for key, text in zip(keys, texts) if key not in vectors))
+    if missing:
+        embedded = embedder.embed_documents([text for _, text in missing])
+        with _embedding_cache_lock:
+            for (key, _), vector in zip(missing, embedded):
+                vector = np.asarray(vector, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                vectors[key] = _embedding_cache[key] = vector / norm if norm else vector
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    return np.vstack([vectors[key] for key in keys])
+
+
+def embed_with_fallback(embedder: Embeddings, texts: List[str], writer: Optional[Callable] = None) -> Tuple[Embeddings, np.ndarray]:
+    """Embed texts, switching to LocalEmbeddings when the embedder fails.
+
+    Returns:
+        The embedder that produced the vectors, which callers keep so later
+        vectors stay comparable, and the vectors
+    """
+    try:
+        return embedder, embed_texts(embedder, texts)
+    except Exception as e:
+        if isinstance(embedder, LocalEmbeddings):
+            raise
+        if writer:
+            writer({"msg": f"Embedding failed, using local embeddings: {str(e)}"})
+        embedder = LocalEmbeddings()
+        return embedder, embed_texts(embedder, texts)
+
+
+class KnowledgeBaseIndex:
+    """Nuggets in their original order plus a matrix of their content embeddings.
+
+    Rows are addressed by position, so nuggets sharing an id, or without
+    one, each keep their own row and score.
+    """
+
+    def __init__(self, nuggets: List[KnowledgeNugget], embedder: Embeddings, writer: Optional[Callable] = None):
+        self.embedder = embedder
+        self.writer = writer
+        self.nuggets: List[KnowledgeNugget] = list(nuggets)
+        self.by_id: Dict[str, KnowledgeNugget] = {}
+        for nugget in self.nuggets:
+            self.by_id.setdefault(nugget.nugget_id, nugget)
+        self.matrix = None
+        self.matrix = self._embed([nugget.content for nugget in self.nuggets]) if self.nuggets else None
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        embedder, vectors = embed_with_fallback(self.embedder, texts, self.writer)
+        if embedder is not self.embedder:
+            # Switch the whole index to local embeddings so vectors stay comparable
+            self.embedder = embedder
+            if self.matrix is not None:
+                self.matrix = embed_texts(embedder, [nugget.content for nugget in self.nuggets])
+        return vectors
+
+    def get(self, nugget_id: str) -> Optional[KnowledgeNugget]:
+        """The first nugget with an id"""
+        return self.by_id.get(nugget_id)
+
+    def scores(self, queries: List[str]) -> np.ndarray:
+        """Similarity of each nugget, in index order, to its closest query"""
+        if not self.nuggets or not queries:
+            return np.zeros(len(self.nuggets))
+        return (self.matrix @ self._embed(queries).T).max(axis=1)
+
+    def top_k(self, queries: List[str], k: int) -> List[KnowledgeNugget]:
+        """The k nuggets most similar to any of the queries, best first"""
+        if not self.nuggets or k <= 0:
+            return []
+        if len(self.nuggets) <= k or not queries:
+            return self.nuggets[:k]
+
+        best = np.argsort(-self.scores(queries), kind="stable")[:k]
+        return [self.nuggets[i] for i in best]
@@ -0,0 +1,141 @@
+"""Registry of reusable chat model clients.
+
+Building a ChatOpenAI per node call also builds a fresh HTTP connection
+pool, so every LLM call paid for a new TLS handshake. Clients are instead
+cached by (model, temperature, api key) and all of them share one pair of
+keep-alive httpx clients, using HTTP/2 when the h2 package is installed.
+Async connections belong to the event loop that opened them, so the shared
+async client keeps a separate connection pool per event loop.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from ...config.models import DEFAULT_EMBEDDING_MODEL
+from ...config.settings import (
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    EMBEDDING_BACKEND,
+    OPENAI_API_KEY
+)
+from .kb_index import LocalEmbeddings
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_clients: Dict[Tuple[str, Optional[float], str], ChatOpenAI] = {}
+_embeddings: Optional[Embeddings] = None
+_http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None
+_lock = threading.Lock()
+
+
+class LoopAsyncClient(httpx.AsyncClient):
+    """An AsyncClient that sends each request through a pool of the running event loop.
+
+    A pooled connection cannot be used from another loop, so a single
+    AsyncClient breaks with "Event loop is closed" on the next asyncio.run.
+    Pools are dropped along with their loop.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._loop_lock = threading.Lock()
+
+    def loop_client(self) -> httpx.AsyncClient:
+        """The client holding the connections of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            client = self._loop_clients.get(loop)
+            if client is None:
+                client = self._loop_clients[loop] = httpx.AsyncClient(**self._client_kwargs)
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self.loop_client().send(request, **kwargs)
+
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Get the shared sync and async HTTP clients used by every chat model"""
+    global _http_clients
+    with _lock:
+        if _http_clients is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            )
+            _http_clients = (
+                httpx.Client(http2=HTTP2_AVAILABLE, limits=limits),
+                LoopAsyncClient(http2=HTTP2_AVAILABLE, limits=limits)
+            )
+        return _http_clients
+
+
+def get_chat_model(model_name: str, temperature: Optional[float], api_key: str) -> ChatOpenAI:
+    """Get a cached chat model client, creating it on first use.
+
+    Args:
+        model_name: The OpenAI model name
+        temperature: Sampling temperature, or None for models that do not support it
+        api_key: The OpenAI API key
+
+    Returns:
+        ChatOpenAI instance shared by every caller with the same settings
+    """
+    # Only a digest of the key is kept in the registry
+    key = (model_name, temperature, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    http_client, http_async_client = get_http_clients()
+    chat_config = {
+        "model": model_name,
+        "api_key": api_key,
+        "http_client": http_client,
+        "http_async_client": http_async_client,
+        "stream_usage": True,  # streamed answers report token usage too
+        "max_retries": 0  # retries are left to the shared rate limiter, which sees every 429
+    }
+    if temperature is not None:
+        chat_config["temperature"] = temperature
+
+    with _lock:
+        return _clients.setdefault(key, ChatOpenAI(**chat_config))
+
+
+def get_embeddings() -> Embeddings:
+    """Get the shared embedding client for the configured backend"""
+    global _embeddings
+    if _embeddings is None:
+        if EMBEDDING_BACKEND == "local":
+            embeddings = LocalEmbeddings()
+        else:
+            http_client, http_async_client = get_http_clients()
+            embeddings = OpenAIEmbeddings(
+                model=DEFAULT_EMBEDDING_MODEL,
+                api_key=OPENAI_API_KEY,
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
+        with _lock:
+            if _embeddings is None:
+                _embeddings = embeddings
+    return _embeddings
+
+
+def clear_chat_models():
+    """Drop all cached clients, e.g. after an API key change"""
+    global _embeddings
+    with _lock:
+        _clients.clear()
+        _embeddings = None
@@ -0,0 +1,158 @@
+"""Near-duplicate filtering of scraped pages.
+
+Syndicated news and mirrored pages mean the URLs of one scrape often carry
+essentially the same text, and every copy costs memory, passages and prompt
+tokens downstream. Each page gets a 64-bit SimHash of its word shingles;
+pages whose fingerprints differ in at most NEAR_DUPLICATE_DISTANCE bits are
+treated as copies. Pages are visited from the highest URL selection score
+down, so the copy that is kept is the one the model rated most relevant.
+
+Fingerprints are bucketed by bands: with d allowed differing bits, splitting
+the fingerprint into d + 1 bands guarantees two near-duplicates share at
+least one band exactly, so a lookup only compares against pages in the same
+buckets instead of every page seen.
+"""
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ...config.settings import FINGERPRINT_INDEX_SIZE, NEAR_DUPLICATE_DISTANCE, NEAR_DUPLICATE_MIN_WORDS
+
+FINGERPRINT_BITS = 64
+SHINGLE_WORDS = 3
+
+
+def simhash(text: str) -> Optional[int]:
+    """SimHash of a text's word shingles, or None when it is too short to tell copies apart"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < NEAR_DUPLICATE_MIN_WORDS:
+        return None
+    shingles = Counter(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+
+    hashes = np.array(
+        [hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles],
+        dtype="S8"
+    ).view(np.uint8).reshape(-1, 8)
+    bits = np.unpackbits(hashes, axis=1, bitorder="little").astype(np.float64)
+    # Every shingle votes for each bit it has set and against each bit it has not
+    totals = (2 * bits - 1).T @ np.fromiter(shingles.values(), dtype=np.float64, count=len(shingles))
+    return int.from_bytes(np.packbits(totals > 0, bitorder="little").tobytes(), "little")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class FingerprintIndex:
+    """Fingerprints keyed by URL, bucketed by band for near-duplicate lookups"""
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_DISTANCE, max_size: int = FINGERPRINT_INDEX_SIZE):
+        self.max_distance = max_distance
+        self.max_size = max_size
+        bands = max_distance + 1
+        bounds = [FINGERPRINT_BITS * band // bands for band in range(bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.fingerprints: "OrderedDict[str, int]" = OrderedDict()
+        self.buckets: Dict[Tuple[int, int], set] = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        return [(band, (fingerprint >> start) & mask) for band, (start, mask) in enumerate(self.bands)]
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def add(self, url: str, fingerprint: int):
+        """Index a page's fingerprint, dropping the oldest pages above max_size"""
+        with self._lock:
+            self._remove(url)
+            self.fingerprints[url] = fingerprint
+            for key in self._keys(fingerprint):
+                self.buckets.setdefault(key, set()).add(url)
+            while len(self.fingerprints) > self.max_size:
+                self._remove(next(iter(self.fingerprints)))
+
+    def _remove(self, url: str):
+        fingerprint = self.fingerprints.pop(url, None)
+        if fingerprint is None:
+            return
+        for key in self._keys(fingerprint):
+            self.buckets[key].discard(url)
+            if not self.buckets[key]:
+                del self.buckets[key]
+
+    def nearest(self, fingerprint: int, exclude: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """The closest indexed page within max_distance bits, with its distance.
+
+        Args:
+            fingerprint: SimHash of the page looked up
+            exclude: URL never reported, so a page fetched again is not its own copy
+        """
+        with self._lock:
+            candidates = set().union(*(self.buckets.get(key, ()) for key in self._keys(fingerprint)))
+            candidates.discard(exclude)
+            best = None
+            for url in sorted(candidates):
+                distance = hamming(fingerprint, self.fingerprints[url])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (url, distance)
+            return best
+
+
+def filter_near_duplicates(
+    docs: Sequence[Document],
+    scores: Dict[str, int],
+    index: Optional[FingerprintIndex] = None
+) -> Tuple[List[Document], List[Dict[str, Any]]]:
+    """Keep one page per group of near-duplicates, the one with the highest score.
+
+    Args:
+        docs: Scraped pages, with their URL in metadata["source"]
+        scores: URL selection score per URL; unscored pages rank last
+        index: Fingerprints of pages seen before, e.g. by earlier runs, which
+            is extended with the kept pages; a fresh index when not given
+
+    Returns:
+        The kept pages in their original order, and a record for every
+        dropped page naming the page it duplicates
+    """
+    index = index if index is not None else FingerprintIndex()
+    urls = [doc.metadata.get("source", "") for doc in docs]
+    order = sorted(range(len(docs)), key=lambda i: (-scores.get(urls[i], -1), i))
+
+    kept, dropped = set(), []
+    for i in order:
+        fingerprint = simhash(docs[i].page_content)
+        if fingerprint is None:
+            kept.add(i)
+            continue
+        match = index.nearest(fingerprint, exclude=urls[i])
+        if match:
+            dropped.append({
+                "url": urls[i],
+                "duplicate_of": match[0],
+                "score": scores.get(urls[i]),
+                "distance": match[1],
+            })
+            continue
+        index.add(urls[i], fingerprint)
+        kept.add(i)
+    return [doc for i, doc in enumerate(docs) if i in kept], dropped
+
+
+_fingerprint_index: Optional[FingerprintIndex] = None
+_fingerprint_index_lock = threading.Lock()
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    """Get the process-wide index of pages scraped by earlier runs"""
+    global _fingerprint_index
+    with _fingerprint_index_lock:
+        if _fingerprint_index is None:
+            _fingerprint_index = FingerprintIndex()
+        return _fingerprint_index
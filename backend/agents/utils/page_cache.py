@@ -0,0 +1,194 @@
+"""Persistent cache of scraped pages.
+
+Pages are keyed by a hash of their normalized URL and stored as extracted
+text in a local SQLite file. Fresh entries are served without any network
+round trip, stale entries are revalidated with ETag/Last-Modified, and the
+least recently used pages are evicted once the cache outgrows its size limit.
+Every page records the CONTENT_VERSION it was extracted with, and pages of
+another version are never served, so a change to extraction takes effect
+right away instead of once the old pages expire.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+
+from ...config.settings import PAGE_CACHE_PATH, PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+# Format of the stored text; bump it whenever extraction changes what is stored.
+# 1: full page text from BeautifulSoup, 2: main content extracted with lxml
+CONTENT_VERSION = 2
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings share a cache entry"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def url_key(url: str) -> str:
+    """Content address of a URL in the cache"""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+class CachedPage(BaseModel):
+    """A scraped page as stored in the cache"""
+    url: str
+    text: str
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = Field(default_factory=time.time)
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating this page"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.text, metadata=dict(self.metadata))
+
+
+class PageCache:
+    """SQLite-backed page cache with TTL and size-bounded LRU eviction"""
+
+    def __init__(self, path: str = PAGE_CACHE_PATH, ttl: float = PAGE_CACHE_TTL, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(pages)")]
+        if "version" not in columns:
+            # Caches written before pages were versioned hold version 1 text
+            self._conn.execute("ALTER TABLE pages ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.execute("DELETE FROM pages WHERE version != ?", (CONTENT_VERSION,))
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """Look up a page, fresh or stale, and mark it as recently used"""
+        key = url_key(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, text, metadata, etag, last_modified, fetched_at FROM pages WHERE key = ? AND version = ?",
+                (key, CONTENT_VERSION)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+
+        return CachedPage(
+            url=row[0],
+            text=row[1],
+            metadata=json.loads(row[2]),
+            etag=row[3],
+            last_modified=row[4],
+            fetched_at=row[5]
+        )
+
+    def put(self, url: str, document: Document, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store the extracted text of a freshly fetched page"""
+        metadata = json.dumps(document.metadata)
+        size = len(document.page_content.encode("utf-8")) + len(metadata)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url_key(url), url, document.page_content, metadata, etag, last_modified, now, now, size, CONTENT_VERSION)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def refresh(self, url: str):
+        """Restart the TTL of a page the server confirmed as unchanged"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, url_key(url))
+            )
+            self._conn.commit()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """Drop least recently used pages until the cache fits max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM pages ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Get the process-wide page cache"""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache()
+        return _page_cache
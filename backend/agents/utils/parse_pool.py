@@ -0,0 +1,231 @@
+"""Document parsing in worker processes.
+
+lxml and pypdf hold the GIL while they parse, so a large page parsed on a
+scrape thread stalled every other session streaming from the same Streamlit
+process. The fetch layer now hands the raw bytes of each document to a
+bounded process pool and gets the extracted text back. Small pages, which
+parse in about a millisecond, stay in the fetching thread where the
+round trip to a worker would cost more than the parse.
+
+Every document has a time limit. Workers enforce it with a timer signal,
+and the caller stops waiting at twice the limit in case a parse is stuck in
+C code where the signal cannot interrupt it. Both limits count from the
+moment a worker picks the document up, which the worker reports, so time
+spent queued behind other sessions' documents does not count. A stuck
+worker retires its pool: new documents go to a fresh pool, the documents
+already running or queued in the old one still finish, and only then is
+the stuck worker killed.
+"""
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from ...config.settings import PARSE_INLINE_BYTES, PARSE_TIMEOUT, PARSE_WORKERS
+from .extraction import SkippedContent, extract_content
+
+
+# How often a waiting caller checks whether its document has started
+START_POLL_INTERVAL = 0.1
+
+
+class ParseTimeout(SkippedContent):
+    """A document took longer than its time limit to parse"""
+
+
+class PoolRetired(RuntimeError):
+    """A task was submitted to a pool that no longer takes tasks"""
+
+
+@contextmanager
+def time_limit(seconds: float) -> Iterator[None]:
+    """Raise ParseTimeout in the main thread once seconds have passed.
+
+    Only available where timer signals are, and only in a main thread, which
+    is where pool workers run their tasks; elsewhere the block is unbounded.
+    """
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise ParseTimeout(f"Parsing took longer than {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def parse_in_worker(url: str, content: bytes, content_type: str, encoding: Optional[str], timeout: float) -> Tuple[str, Dict[str, Any]]:
+    """Pool task: extract a document within its time limit"""
+    with time_limit(timeout):
+        doc = extract_content(url, content, content_type, encoding)
+    return doc.page_content, doc.metadata
+
+
+_started_queue = None
+
+
+def init_worker(started):
+    """Pool initializer: keep the queue that task starts are reported on"""
+    global _started_queue
+    _started_queue = started
+
+
+def run_task(task_id: int, fn: Callable, *args) -> Any:
+    """Pool task: report when and where the task starts, then run it"""
+    _started_queue.put((task_id, os.getpid(), time.time()))
+    return fn(*args)
+
+
+class ParsePool:
+    """A process pool that knows when and in which worker each task started.
+
+    Futures of a ProcessPoolExecutor report running as soon as they are
+    queued for a worker, so workers report their start on a queue instead.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS):
+        # Forking a process that runs threads (Streamlit, scrape threads) can deadlock
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        self.started = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(self.started,))
+        self.tasks: Dict[int, Future] = {}
+        self.starts: Dict[int, Tuple[int, float]] = {}
+        self.retired = False
+        self.stuck_pids = set()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> Tuple[int, Future]:
+        """Queue fn(*args) for a worker.
+
+        Raises:
+            PoolRetired: When the pool has been retired
+        """
+        with self._lock:
+            if self.retired:
+                raise PoolRetired("The parse pool has been retired")
+            task_id = next(self._ids)
+            future = self.executor.submit(run_task, task_id, fn, *args)
+            self.tasks[task_id] = future
+        future.add_done_callback(lambda _: self._forget(task_id))
+        return task_id, future
+
+    def _forget(self, task_id: int):
+        with self._lock:
+            self.tasks.pop(task_id, None)
+            self.starts.pop(task_id, None)
+
+    def started_at(self, task_id: int) -> Optional[Tuple[int, float]]:
+        """The worker pid and wall clock start of a task, None while it is queued"""
+        with self._lock:
+            while not self.started.empty():
+                started_id, pid, start = self.started.get()
+                if started_id in self.tasks:
+                    self.starts[started_id] = (pid, start)
+            return self.starts.get(task_id)
+
+    def run(self, fn: Callable, *args, timeout: float) -> Any:
+        """Run fn(*args) in a worker and wait for its result.
+
+        Args:
+            timeout: Seconds the task may run once a worker has started it
+
+        Raises:
+            FuturesTimeout: When the task is still running after timeout
+                seconds; its worker is stuck and the pool is retired
+            PoolRetired: When the pool was retired before the task was queued
+        """
+        task_id, future = self.submit(fn, *args)
+        while True:
+            try:
+                return future.result(timeout=START_POLL_INTERVAL)
+            except FuturesTimeout:
+                started = self.started_at(task_id)
+                if started is not None and time.time() - started[1] > timeout:
+                    self.retire(stuck_pid=started[0])
+                    raise
+
+    def retire(self, stuck_pid: Optional[int] = None):
+        """Take no more tasks, and once the other tasks are done kill the stuck worker"""
+        with self._lock:
+            self.retired = True
+            if stuck_pid is not None:
+                self.stuck_pids.add(stuck_pid)
+            # Waiting on another stuck worker would never end
+            others: List[Future] = [
+                future for task_id, future in self.tasks.items()
+                if self.starts.get(task_id, (None,))[0] not in self.stuck_pids
+            ]
+        # Running and queued tasks of other sessions still complete
+        self.executor.shutdown(wait=False)
+        if stuck_pid is None:
+            return
+
+        def reap():
+            wait(others)
+            try:
+                os.kill(stuck_pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        threading.Thread(target=reap, name="parse-pool-reaper", daemon=True).start()
+
+
+_parse_pool: Optional[ParsePool] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """Get the process-wide parse pool, starting a new one on first use or after a retirement"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool.retired:
+            _parse_pool = ParsePool()
+        return _parse_pool
+
+
+def parse_content(url: str, content: bytes, content_type: str, encoding: Optional[str] = None, timeout: float = PARSE_TIMEOUT) -> Document:
+    """Extract the text of a fetched document, in a worker process unless it is small.
+
+    Args:
+        url: Where the document was fetched from
+        content: The raw response body
+        content_type: The Content-Type header of the response
+        encoding: Charset from the Content-Type header, if it names one
+        timeout: Seconds the document may take to parse
+
+    Raises:
+        SkippedContent: When the document cannot be extracted in time or at all
+    """
+    if len(content) <= PARSE_INLINE_BYTES:
+        return extract_content(url, content, content_type, encoding)
+
+    while True:
+        pool = get_parse_pool()
+        try:
+            # The worker's own limit normally fires first; this one catches a parse stuck in C code
+            page_content, metadata = pool.run(parse_in_worker, url, content, content_type, encoding, timeout, timeout=2 * timeout)
+        except PoolRetired:
+            # Another session retired the pool between the lookup and the submit
+            continue
+        except FuturesTimeout:
+            raise ParseTimeout(f"Parsing {url} took longer than {timeout}s")
+        except BrokenProcessPool as e:
+            pool.retire()
+            raise SkippedContent(f"Parser process failed on {url}: {str(e)}") from e
+        return Document(page_content=page_content, metadata=metadata)
@@ -0,0 +1,131 @@
+"""Passage retrieval over scraped pages.
+
+Scraped pages used to reach the knowledge base update only through the
+search result snippets, and whole pages are far too long for its prompt.
+Each page is split into overlapping word windows, the passages of a run's
+pages are indexed with BM25, and the checklist items that still fall short
+of the threshold are used as queries. BM25 picks the candidate passages,
+which are then embedded and ranked again by cosine similarity; the two
+rankings are merged with reciprocal rank fusion so that neither score scale
+dominates. Only candidates are embedded, so a long page costs one BM25 pass
+rather than one embedding call per passage.
+"""
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from ...config.settings import PASSAGE_CANDIDATES, PASSAGE_OVERLAP_WORDS, PASSAGE_WORDS
+from .kb_index import embed_with_fallback
+from .search_cache import STOP_WORDS
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal rank fusion damping, larger values flatten the head of each ranking
+RRF_K = 60
+
+
+class Passage(NamedTuple):
+    """A window of words from a scraped page"""
+    source_url: str
+    title: str
+    text: str
+    position: int
+
+    def to_prompt(self) -> Dict[str, str]:
+        return {"source_url": self.source_url, "title": self.title, "text": self.text}
+
+
+def content_terms(text: str) -> List[str]:
+    """Lowercased words of a text without stop words"""
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOP_WORDS]
+
+
+def chunk_document(doc: Document, words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP_WORDS) -> List[Passage]:
+    """Split a page into windows of words, each overlapping the previous one"""
+    tokens = doc.page_content.split()
+    if not tokens:
+        return []
+    source_url = doc.metadata.get("source", "")
+    title = (doc.metadata.get("title") or "").strip()
+    step = max(1, words - overlap)
+    passages = []
+    for start in range(0, len(tokens), step):
+        passages.append(Passage(source_url, title, " ".join(tokens[start:start + words]), len(passages)))
+        if start + words >= len(tokens):
+            break
+    return passages
+
+
+class PassageIndex:
+    """BM25 over the passages of a set of pages, reranked with embeddings"""
+
+    def __init__(self, docs: Sequence[Document], embedder: Embeddings, writer: Optional[Callable] = None):
+        self.embedder = embedder
+        self.writer = writer
+        self.passages = [passage for doc in docs for passage in chunk_document(doc)]
+        self.term_counts = [Counter(content_terms(f"{p.title} {p.text}")) for p in self.passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(self.passages)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def bm25(self, query: str) -> np.ndarray:
+        """BM25 score of every passage, in index order, for a query"""
+        scores = np.zeros(len(self.passages))
+        terms = [term for term in set(content_terms(query)) if term in self.idf]
+        for i, counts in enumerate(self.term_counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / (self.average_length or 1))
+            for term in terms:
+                frequency = counts.get(term, 0)
+                if frequency:
+                    scores[i] += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def top_k(self, queries: List[str], k: int, candidates: int = PASSAGE_CANDIDATES) -> List[Passage]:
+        """The k passages most relevant to any of the queries, best first.
+
+        Args:
+            queries: Texts the passages should answer, such as unmet checklist items
+            k: Passages returned
+            candidates: Passages per query taken from BM25 for embedding reranking
+        """
+        if not self.passages or not queries or k <= 0:
+            return []
+
+        fused: Dict[int, float] = {}
+        bm25_rankings = []
+        for query in queries:
+            scores = self.bm25(query)
+            ranking = [i for i in np.argsort(-scores, kind="stable")[:candidates] if scores[i] > 0]
+            bm25_rankings.append(ranking)
+        pool = sorted({i for ranking in bm25_rankings for i in ranking})
+        if not pool:
+            return []
+
+        # Rerank the BM25 candidates of each query by embedding similarity
+        # One call, so a fallback to local embeddings covers passages and queries alike
+        self.embedder, vectors = embed_with_fallback(self.embedder, [self.passages[i].text for i in pool] + queries, self.writer)
+        similarities = vectors[:len(pool)] @ vectors[len(pool):].T
+        for q, ranking in enumerate(bm25_rankings):
+            in_ranking = set(ranking)
+            by_similarity = [pool[j] for j in np.argsort(-similarities[:, q], kind="stable") if pool[j] in in_ranking]
+            for rank_list in (ranking, by_similarity):
+                for rank, i in enumerate(rank_list):
+                    fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        best = sorted(fused, key=lambda i: (-fused[i], i))[:k]
+        return [self.passages[i] for i in best]
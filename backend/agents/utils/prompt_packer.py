@@ -0,0 +1,124 @@
+"""Token-budgeted packing of prompt content.
+
+generate_answer and update_knowledge_base used to serialize the whole
+knowledge base (and every search result) into their prompts, whatever the
+context window of the model. The packer counts tokens and keeps the most
+valuable items that fit a per-node budget derived from the model's
+context_window, so long sessions neither overflow nor pay for content that
+does not matter.
+"""
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import tiktoken
+
+from ...config.models import get_model_config
+from ...config.settings import (
+    DEFAULT_MODEL,
+    PROMPT_OUTPUT_RESERVE,
+    PROMPT_BUDGET_FRACTION,
+    PROMPT_TOKEN_LIMITS,
+    CHARS_PER_TOKEN
+)
+
+FALLBACK_ENCODING = "o200k_base"
+
+# Encodings by model name; None when tiktoken cannot load one (e.g. offline)
+_encodings: Dict[str, Optional[tiktoken.Encoding]] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model_name: str) -> Optional[tiktoken.Encoding]:
+    """Get the tiktoken encoding for a model, or None if it is unavailable"""
+    with _encodings_lock:
+        if model_name not in _encodings:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+            except Exception:
+                # The BPE files are downloaded on first use
+                encoding = None
+            _encodings[model_name] = encoding
+        return _encodings[model_name]
+
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL) -> int:
+    """Count the tokens of a text, approximating from its length when offline"""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def prompt_budget(node_name: str, config: Dict[str, Any]) -> int:
+    """Tokens a node may spend on its prompt.
+
+    Args:
+        node_name: The model setting of the node (e.g. 'answer_model')
+        config: The configuration dictionary containing model settings
+
+    Returns:
+        The context window of the node's model less the space kept for the
+        response, scaled down for counting error and capped per node
+    """
+    model_name = config["configurable"].get(node_name, DEFAULT_MODEL)
+    context_window = get_model_config(model_name)["context_window"]
+    budget = int((context_window - PROMPT_OUTPUT_RESERVE) * PROMPT_BUDGET_FRACTION)
+    return max(0, min(budget, PROMPT_TOKEN_LIMITS.get(node_name, budget)))
+
+
+class PackedItems(NamedTuple):
+    """Items that fit a token budget and those that had to be dropped"""
+    kept: List[Any]
+    dropped: List[Any]
+    tokens: int
+
+
+def pack_items(
+    items: Sequence[Any],
+    budget: int,
+    model_name: str = DEFAULT_MODEL,
+    priorities: Optional[Callable[[], Sequence[float]]] = None,
+    to_text: Callable[[Any], str] = json.dumps
+) -> PackedItems:
+    """Keep the highest priority items whose serialized form fits the budget.
+
+    Args:
+        items: The candidate items, serialized as a JSON list in the prompt
+        budget: Tokens available for the list
+        model_name: Model whose tokenizer is used for counting
+        priorities: Optional callable returning one priority per item, higher
+            first; only called when not everything fits. Without it, earlier
+            items win
+        to_text: How a single item is serialized
+
+    Returns:
+        Kept items in their original order, dropped items and the tokens used
+    """
+    # Each item costs its own tokens plus a separator; the brackets cost one more
+    costs = [count_tokens(to_text(item), model_name) + 1 for item in items]
+    if sum(costs) + 1 <= budget:
+        return PackedItems(list(items), [], sum(costs) + 1)
+
+    order = list(range(len(items)))
+    if priorities is not None:
+        scores = list(priorities())
+        order.sort(key=lambda i: -scores[i])
+
+    kept = set()
+    used = 1
+    for i in order:
+        # Skip items that do not fit, a smaller one further down may still fit
+        if used + costs[i] <= budget:
+            kept.add(i)
+            used += costs[i]
+
+    return PackedItems(
+        [item for i, item in enumerate(items) if i in kept],
+        [item for i, item in enumerate(items) if i not in kept],
+        used
+    )
@@ -1,9 +1,7 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
-from typing import List, Optional
-import random
-from datetime import datetime
+from typing import List
 
 class ChecklistItem(BaseModel):
     item_to_score: str = Field(description="A specific requirement that should be addressed in the answer")
@@ -18,19 +16,23 @@ class KnowledgeNugget(BaseModel):
     source_url: str = Field(description="URL where this information was found")
     confidence: float = Field(description="Confidence in this information (0-1)", ge=0, le=1, default=1.0)
     conflicts_with: List[str] = Field(description="List of nugget IDs this conflicts with", default_factory=list)
-    nugget_id: str = Field(description="Unique identifier for this nugget", default_factory=lambda: str(random.randint(1000, 9999)))
+    nugget_id: str = Field(description="Unique identifier for this nugget, assigned by the knowledge base", default="")
+    sources: List[str] = Field(description="Every URL this information was found at", default_factory=list)
 
-class KnowledgeNuggetUpdate(BaseModel):
-    """Update to an existing knowledge nugget"""
-    nugget_id: str
-    content: Optional[str] = None
-    confidence: Optional[float] = None
-    conflicts_with: Optional[List[str]] = None
+class ExtractedFact(BaseModel):
+    """A fact extracted from new search results or page passages"""
+    content: str = Field(description="The fact, stated on its own")
+    source_url: str = Field(description="URL where this fact was found")
+    confidence: float = Field(description="Confidence in this fact (0-1)", ge=0, le=1, default=1.0)
+    conflicts_with: List[str] = Field(description="IDs of existing nuggets this fact contradicts", default_factory=list)
 
-class KBUpdateResponse(BaseModel):
+class KBExtractionResponse(BaseModel):
     """Response format for knowledge base updates"""
-    new_nuggets: List[KnowledgeNugget] = Field(default_factory=list)
-    updated_nuggets: List[KnowledgeNuggetUpdate] = Field(default_factory=list)
+    new_nuggets: List[ExtractedFact] = Field(default_factory=list)
+
+class QueryListResponse(BaseModel):
+    """Response format for generating several search queries at once"""
+    queries: List[str] = Field(description="Search queries, one per unmet checklist requirement")
 
 class URLWithScore(BaseModel):
     """A URL with its relevance score"""
@@ -59,9 +61,8 @@ def create_gap_analyzer_prompt():
 
 def create_query_generator_prompt():
     """Create a prompt for generating search queries"""
-    current_date = datetime.now().strftime("%Y-%m-%d")
     return ChatPromptTemplate.from_messages([
-        ("system", f"""You are an expert at generating effective search queries.
+        ("system", """You are an expert at generating effective search queries.
         Based on the question and checklist requirements, generate a search query that will help find relevant information.
         Consider the query history to avoid repeating similar searches.
         The query should be specific and focused on finding information that will help address the checklist requirements.
@@ -75,6 +76,38 @@ def create_query_generator_prompt():
         Generate a new search query:""")
     ])
 
+def create_initial_query_prompt():
+    """Create a prompt for generating the first search query from the question alone"""
+    return ChatPromptTemplate.from_messages([
+        ("system", """You are an expert at generating effective search queries.
+        Based on the question, generate a search query that will find the most relevant and authoritative information for answering it.
+        The query should be specific and cover the core of the question.
+        Current date: {current_date}
+        
+        Return only the search query text, nothing else."""),
+        ("user", """Question: {question}
+        
+        Generate a search query:""")
+    ])
+
+def create_multi_query_generator_prompt(format_instructions: str):
+    """Create a prompt for generating one search query per unmet checklist requirement"""
+    return ChatPromptTemplate.from_messages([
+        ("system", """You are an expert at generating effective search queries.
+        Based on the question and the checklist requirements that are not yet met, generate one search query per requirement.
+        Each query should be specific and focused on finding information for its requirement.
+        Consider the query history to avoid repeating similar searches.
+        Generate at most {max_queries} queries.
+        Current date: {current_date}
+        
+        {format_instructions}"""),
+        ("user", """Question: {question}
+        Unmet Checklist Requirements: {checklist}
+        Previous Queries: {query_history}
+        
+        Generate the search queries:""")
+    ])
+
 def create_response_generator_prompt():
     """Create a prompt for generating improved responses"""
     return ChatPromptTemplate.from_messages([
@@ -87,9 +120,8 @@ def create_response_generator_prompt():
 
 def create_direct_answer_prompt():
     """Create a prompt for generating direct answers"""
-    current_date = datetime.now().strftime("%Y-%m-%d")
     return ChatPromptTemplate.from_messages([
-        ("system", f"""You are an expert at providing clear and comprehensive answers.
+        ("system", """You are an expert at providing clear and comprehensive answers.
         Your task is to generate an answer that addresses all the requirements in the checklist.
         Use the knowledge base to enhance your answer with relevant information.
         Make sure to cite sources when using information from the knowledge base.
@@ -146,28 +178,27 @@ def create_kb_update_prompt(format_instructions: str):
     """Create a prompt for updating the knowledge base with new information"""
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert at analyzing and integrating information.
-        Your task is to update the knowledge base with new information from search results.
+        Your task is to extract facts relevant to the question from new search results
+        and from passages of the scraped pages.
         Current date: {current_date}
         
         For each piece of information:
-        1. Compare it with existing knowledge
-        2. Identify any conflicts or corroborations
-        3. Update confidence scores based on multiple sources
-        4. Create new nuggets for unique information
-        5. Update existing nuggets when new information is found
+        1. Compare it with the existing knowledge base
+        2. Return each new fact once, stated on its own, with the URL it came from
+        3. Rate your confidence in it based on the source's reliability
+        4. When a new source confirms an existing nugget, return that nugget's content word for word with the new source URL
+        5. Do not return existing nuggets that no new source confirms
         
-        When conflicts are found:
-        1. Create a new nugget documenting the conflict
-        2. Link conflicting nuggets together
-        3. Adjust confidence scores based on source reliability
+        When a fact contradicts existing nuggets, list their nugget IDs in conflicts_with.
         
         You MUST return a JSON object following these format instructions exactly:
         {format_instructions}"""),
         ("user", """Question: {question}
         Current Knowledge Base: {current_kb}
         New Search Results: {search_results}
+        Relevant Page Passages: {passages}
         
-        Analyze and update the knowledge base. Return a JSON object following the format instructions exactly:""")
+        Extract the new facts. Return a JSON object following the format instructions exactly:""")
     ])
 
 def create_url_selection_prompt(format_instructions: str):
@@ -0,0 +1,409 @@
+"""Shared rate limiting for OpenAI, SerpAPI and Tavily.
+
+With several sessions or a batch running at once, every caller used to hit
+the providers as fast as it could and fail on 429s. All calls now go through
+one ProviderLimiter per provider, and per model for OpenAI:
+
+- token buckets keep requests per minute, and for OpenAI tokens per minute,
+  under the configured quota
+- the number of calls in flight follows AIMD: it grows by one per window of
+  successful calls and halves on a 429, and a Retry-After header pauses
+  every caller of the provider
+- rate-limited and failed calls are retried with jittered exponential
+  backoff, never less than the provider's Retry-After
+
+Limiters are process-wide, so concurrent sessions share a provider's quota.
+"""
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from ...config.settings import (
+    RATE_LIMITS,
+    MODEL_RATE_LIMITS,
+    RATE_LIMIT_BURST_SECONDS,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX
+)
+from .cancellation import cancellable, current_token
+from .prompt_packer import count_tokens
+
+# Longest a waiting caller sleeps before checking the limiter again
+POLL_INTERVAL = 0.05
+
+# Wording of rate limit and server errors in messages of clients that return errors
+RATE_LIMIT_MESSAGE = re.compile(r"\b429\b|too many requests|rate limit|run out of searches|throughput|quota", re.IGNORECASE)
+SERVER_ERROR_MESSAGE = re.compile(r"\b5\d\d server error|service unavailable|bad gateway|timed? ?out|connection", re.IGNORECASE)
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most burst_seconds of quota.
+
+    Callers keep their own locking; the bucket itself is not thread-safe.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        """Take amount; the level may go negative to charge for a late correction"""
+        self.level -= amount
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an OpenAI, httpx or requests error"""
+    code = getattr(error, "status_code", None)
+    if code is None and getattr(error, "response", None) is not None:
+        code = getattr(error.response, "status_code", None)
+    return code
+
+
+class ReturnedError(Exception):
+    """A provider failure that its client returned instead of raising.
+
+    SerpAPI answers a throttled search with {"error": ...} and Tavily's tool
+    returns the repr of the exception it caught; raising them as this error
+    lets the limiter back off. The status is guessed from the message.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        if RATE_LIMIT_MESSAGE.search(message):
+            self.status_code = 429
+        elif SERVER_ERROR_MESSAGE.search(message):
+            self.status_code = 503
+        else:
+            self.status_code = 400
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return status_code(error) == 429
+
+
+def is_transient(error: Exception) -> bool:
+    """Errors worth retrying: rate limits, server errors and dropped connections"""
+    code = status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in (
+        "APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError"
+    )
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked to wait, from Retry-After or retry-after-ms"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    if milliseconds := headers.get("retry-after-ms"):
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time()) if date else None
+
+
+class ProviderLimiter:
+    """Request and token quotas plus adaptive concurrency for one provider"""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 8,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+        backoff_base: float = RATE_LIMIT_BACKOFF_BASE,
+        backoff_max: float = RATE_LIMIT_BACKOFF_MAX,
+        burst_seconds: float = RATE_LIMIT_BURST_SECONDS
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {"calls": 0, "rate_limited": 0, "retries": 0, "waited": 0.0}
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and the quota for a call, or return how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return POLL_INTERVAL
+            wait = self.requests.wait_time(1, now)
+            if self.tokens:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self.stats["calls"] += 1
+            return 0.0
+
+    def acquire(self, tokens: int = 0):
+        """Block until a call may start"""
+        token = current_token()
+        while (wait := self._try_acquire(tokens)) > 0:
+            wait = min(wait, POLL_INTERVAL * 20)
+            self.stats["waited"] += wait
+            if token:
+                token.raise_if_cancelled()
+                token.wait(wait)
+            else:
+                time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """Wait on the event loop until a call may start"""
+        token = current_token()
+        while (wait := self._try_acquire(tokens)) > 0:
+            wait = min(wait, POLL_INTERVAL * 20)
+            self.stats["waited"] += wait
+            if token:
+                token.raise_if_cancelled()
+            await cancellable(asyncio.sleep(wait))
+
+    def release(self, error: Optional[Exception] = None, reserved_tokens: int = 0, used_tokens: Optional[int] = None, adapt: bool = True):
+        """End a call, adapting concurrency to how it went.
+
+        Args:
+            adapt: False for a call that was abandoned, e.g. cancelled, which
+                says nothing about the provider's capacity
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if adapt and error is not None and is_rate_limited(error):
+                self.stats["rate_limited"] += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+                if (delay := retry_after(error)) is not None:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            elif adapt and error is None:
+                # One more slot per window of successful calls
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        if used_tokens is not None:
+            self.charge(used_tokens - reserved_tokens)
+
+    def charge(self, tokens: int):
+        """Correct the token bucket by the difference between estimated and reported usage"""
+        with self._lock:
+            if self.tokens:
+                self.tokens.take(tokens)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Jittered delay before retry number attempt, honouring Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, used_tokens: Optional[Callable[[Any], Optional[int]]] = None) -> Any:
+        """Run fn within the limits, retrying transient failures.
+
+        Args:
+            fn: The provider call
+            tokens: Tokens the call is expected to use
+            used_tokens: Reads the tokens actually used from the result, so
+                the token bucket is corrected after the call
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release(e, tokens)
+                if attempt == self.max_retries or not is_transient(e):
+                    raise
+                delay = self.backoff(attempt, e)
+            else:
+                self.release(None, tokens, used_tokens(result) if used_tokens else None)
+                return result
+            self.stats["retries"] += 1
+            token = current_token()
+            if token:
+                token.wait(delay)
+                token.raise_if_cancelled()
+            else:
+                time.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0, used_tokens: Optional[Callable[[Any], Optional[int]]] = None) -> Any:
+        """Async variant of call"""
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.release(e, tokens)
+                if attempt == self.max_retries or not is_transient(e):
+                    raise
+                delay = self.backoff(attempt, e)
+            except BaseException:
+                # Cancelled: free the slot without counting the call as a success
+                self.release(None, tokens, adapt=False)
+                raise
+            else:
+                self.release(None, tokens, used_tokens(result) if used_tokens else None)
+                return result
+            self.stats["retries"] += 1
+            await cancellable(asyncio.sleep(delay))
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, model: Optional[str] = None) -> ProviderLimiter:
+    """Get the process-wide limiter of a provider, or of one of its models"""
+    name = f"{provider}:{model}" if model else provider
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limits = {**RATE_LIMITS[provider], **MODEL_RATE_LIMITS.get(model, {})}
+            limiter = _limiters[name] = ProviderLimiter(name, **limits)
+        return limiter
+
+
+def message_tokens(messages: List[BaseMessage], model_name: str) -> int:
+    return sum(count_tokens(str(message.content), model_name) for message in messages)
+
+
+def usage_tokens(message: Any) -> Optional[int]:
+    """Total tokens a response reports in its usage metadata"""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Chat model whose calls go through the limiter of its model.
+
+    A streamed call is only retried if it fails before its first chunk.
+    """
+    llm: Any
+    limiter: Any
+    model_name: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "rate-limited"
+
+    def __getattr__(self, name: str) -> Any:
+        # Settings of the wrapped client, such as temperature, read through
+        llm = self.__dict__.get("llm")
+        if llm is None or name.startswith("_"):
+            return super().__getattr__(name)
+        return getattr(llm, name)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self.limiter.call(
+            lambda: self.llm.invoke(messages, stop=stop, **kwargs),
+            message_tokens(messages, self.model_name), usage_tokens
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = await self.limiter.acall(
+            lambda: self.llm.ainvoke(messages, stop=stop, **kwargs),
+            message_tokens(messages, self.model_name), usage_tokens
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = message_tokens(messages, self.model_name)
+        chunks = iter(())
+
+        def first_chunk():
+            nonlocal chunks
+            chunks = iter(self.llm.stream(messages, stop=stop, **kwargs))
+            return next(chunks, None)
+
+        # The limiter holds the slot until the first chunk; the rest of the
+        # stream is charged once it is complete
+        first = self.limiter.call(first_chunk, tokens)
+        response = first
+        if first is not None:
+            yield ChatGenerationChunk(message=first)
+            for chunk in chunks:
+                response += chunk
+                yield ChatGenerationChunk(message=chunk)
+        if response is not None and (used := usage_tokens(response)) is not None:
+            self.limiter.charge(used - tokens)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = message_tokens(messages, self.model_name)
+        chunks = None
+
+        async def first_chunk():
+            nonlocal chunks
+            chunks = self.llm.astream(messages, stop=stop, **kwargs).__aiter__()
+            try:
+                return await chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        first = await self.limiter.acall(first_chunk, tokens)
+        response = first
+        if first is not None:
+            yield ChatGenerationChunk(message=first)
+            async for chunk in chunks:
+                response += chunk
+                yield ChatGenerationChunk(message=chunk)
+        if response is not None and (used := usage_tokens(response)) is not None:
+            self.limiter.charge(used - tokens)
+
+
+_wrapped: Dict[int, RateLimitedChatModel] = {}
+
+
+def rate_limited(llm: BaseChatModel) -> BaseChatModel:
+    """Route a model's calls through the shared limiter of its model.
+
+    Clients are cached, so each one keeps a single wrapper as well.
+    """
+    wrapper = _wrapped.get(id(llm))
+    if wrapper is not None and wrapper.llm is llm:
+        return wrapper
+    model_name = getattr(llm, "model_name", None) or type(llm).__name__
+    wrapper = RateLimitedChatModel(llm=llm, limiter=get_limiter("openai", model_name), model_name=model_name)
+    with _limiters_lock:
+        _wrapped[id(llm)] = wrapper
+    return wrapper
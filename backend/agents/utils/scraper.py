@@ -0,0 +1,278 @@
+"""Concurrent page fetching used by the scrape_urls node.
+
+All selected URLs are fetched at once on a bounded thread pool. Failed
+attempts are rescheduled with exponential backoff instead of sleeping in a
+worker, and the whole batch is bounded by a single deadline, so a scrape takes
+about as long as its slowest page rather than the sum of all pages. Only HTML
+and PDF responses are read, within SCRAPE_MAX_BYTES and PDF_MAX_BYTES, and the
+raw bytes are handed to the parse pool, which returns the extracted text that
+is cached and passed on.
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.documents import Document
+
+from ...config.settings import (
+    SCRAPE_MAX_WORKERS,
+    SCRAPE_TIMEOUT,
+    SCRAPE_MAX_RETRIES,
+    SCRAPE_BACKOFF_BASE,
+    SCRAPE_DEADLINE,
+    SCRAPE_MAX_BYTES,
+    SCRAPE_MAX_SESSIONS,
+    PDF_MAX_BYTES,
+    CANCEL_POLL_INTERVAL
+)
+from .page_cache import PageCache, CachedPage
+from .cassette import ReplayedError
+from .cancellation import CancellationToken
+from .extraction import SkippedContent, is_html, is_pdf, pdf_supported
+from .parse_pool import parse_content
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+# One pooled session per host, shared across iterations and questions; the
+# least recently used hosts are closed once there are SCRAPE_MAX_SESSIONS
+_sessions: "OrderedDict[str, requests.Session]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Get the pooled HTTP session for the host of a URL"""
+    parsed = urlparse(url)
+    host = f"{parsed.scheme}://{parsed.netloc}".lower()
+    evicted = []
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SCRAPE_MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            while len(_sessions) > SCRAPE_MAX_SESSIONS:
+                evicted.append(_sessions.popitem(last=False)[1])
+        else:
+            _sessions.move_to_end(host)
+    # Closing drops idle connections; a request still running on the session completes
+    for old in evicted:
+        old.close()
+    return session
+
+
+def is_retryable(error: Exception) -> bool:
+    """Client errors other than 429 will not go away by retrying"""
+    if isinstance(error, ReplayedError):
+        return error.retryable
+    if isinstance(error, SkippedContent):
+        return False
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+
+def read_body(response: requests.Response, max_bytes: int = SCRAPE_MAX_BYTES) -> bytes:
+    """Read a streamed response body, stopping after max_bytes"""
+    chunks, size = [], 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    return b"".join(chunks)[:max_bytes]
+
+
+def fetch_document(url: str, timeout: float, cached: Optional[CachedPage] = None) -> Tuple[Optional[Document], requests.Response]:
+    """Fetch a single page or PDF and extract its text, raising on any failure.
+
+    When a cached copy is given the request is made conditional, and a
+    304 response comes back with no document. Other content types raise
+    SkippedContent before their body is downloaded, as do PDFs over
+    PDF_MAX_BYTES.
+    """
+    headers = cached.validators() if cached else {}
+    response = get_session(url).get(url, headers=headers, timeout=timeout, verify=True, stream=True)
+    try:
+        if response.status_code == 304 and cached:
+            return None, response
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if is_pdf(content_type, url):
+            if not pdf_supported():
+                raise SkippedContent(f"Skipped PDF {url}, install pypdf to read PDFs")
+            # A PDF cut short cannot be read, so an oversized one is skipped
+            declared = response.headers.get("Content-Length", "")
+            too_large = declared.isdigit() and int(declared) > PDF_MAX_BYTES
+            if not too_large:
+                content = read_body(response, PDF_MAX_BYTES + 1)
+                too_large = len(content) > PDF_MAX_BYTES
+            if too_large:
+                raise SkippedContent(f"Skipped PDF {url} larger than {PDF_MAX_BYTES} bytes")
+        elif is_html(content_type):
+            content = read_body(response)
+        else:
+            raise SkippedContent(f"Skipped non-HTML content ({content_type})")
+    finally:
+        response.close()
+    # requests only knows the charset when the header names one
+    encoding = response.encoding if "charset" in content_type.lower() else None
+    return parse_content(url, content, content_type, encoding), response
+
+
+def scrape_pages(
+    urls: List[str],
+    writer: Optional[Callable] = None,
+    max_workers: int = SCRAPE_MAX_WORKERS,
+    max_retries: int = SCRAPE_MAX_RETRIES,
+    timeout: float = SCRAPE_TIMEOUT,
+    deadline: float = SCRAPE_DEADLINE,
+    backoff_base: float = SCRAPE_BACKOFF_BASE,
+    cache: Optional[PageCache] = None,
+    fetch: Callable = fetch_document,
+    cancel_token: Optional[CancellationToken] = None
+) -> List[Document]:
+    """Fetch all URLs concurrently and return the documents that loaded.
+
+    Args:
+        urls: The URLs to fetch
+        writer: Optional callback for writing messages
+        max_workers: Size of the thread pool
+        max_retries: Attempts per URL before giving up
+        timeout: Per-request timeout in seconds
+        deadline: Time budget in seconds for the whole batch
+        backoff_base: Delay before the first retry, doubled on every retry
+        cache: Optional page cache; fresh pages are served from it without a request
+        fetch: Loads one page, with the signature of fetch_document
+        cancel_token: Optional token; once it is set no fetch or retry is
+            started and the call raises RunCancelled
+
+    Returns:
+        Documents in the same order as the input URLs, skipping failures
+    """
+    if not urls:
+        return []
+
+    expires_at = time.monotonic() + deadline
+    docs: Dict[str, Document] = {}
+    attempts: Dict[str, int] = {url: 0 for url in urls}
+    stale: Dict[str, CachedPage] = {}
+    retry_queue = []  # heap of (due time, url)
+    in_flight = {}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+
+    def submit(url):
+        attempts[url] += 1
+        request_timeout = max(0.1, min(timeout, expires_at - time.monotonic()))
+        in_flight[executor.submit(fetch, url, request_timeout, stale.get(url))] = url
+
+    try:
+        for url in dict.fromkeys(urls):
+            cached = cache.get(url) if cache else None
+            if cached and cached.is_fresh(cache.ttl):
+                cache.stats["hits"] += 1
+                docs[url] = cached.to_document()
+                continue
+            if cached:
+                stale[url] = cached
+            submit(url)
+
+        while in_flight or retry_queue:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            now = time.monotonic()
+            if now >= expires_at:
+                break
+
+            # Launch retries whose backoff has elapsed
+            while retry_queue and retry_queue[0][0] <= now:
+                _, url = heapq.heappop(retry_queue)
+                submit(url)
+
+            wait_for = expires_at - now
+            if retry_queue:
+                wait_for = min(wait_for, retry_queue[0][0] - now)
+            if cancel_token:
+                # Wake up regularly to notice a cancellation
+                wait_for = min(wait_for, CANCEL_POLL_INTERVAL)
+            if not in_flight:
+                if cancel_token:
+                    cancel_token.wait(max(0, wait_for))
+                else:
+                    time.sleep(max(0, wait_for))
+                continue
+
+            done, _ = wait(in_flight, timeout=max(0, wait_for), return_when=FIRST_COMPLETED)
+            for future in done:
+                url = in_flight.pop(future)
+                try:
+                    doc, response = future.result()
+                except Exception as e:
+                    if attempts[url] < max_retries and is_retryable(e):
+                        delay = backoff_base * (2 ** (attempts[url] - 1))
+                        heapq.heappush(retry_queue, (time.monotonic() + delay, url))
+                    elif writer:
+                        writer({"msg": f"Failed to scrape {url} after {attempts[url]} attempts: {str(e)}"})
+                    continue
+
+                if doc is None:
+                    # Not modified since it was cached
+                    cache.stats["revalidated"] += 1
+                    cache.refresh(url)
+                    doc = stale[url].to_document()
+                elif cache:
+                    cache.stats["misses"] += 1
+                    cache.put(url, doc, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                docs[url] = doc
+
+        unfinished = set(in_flight.values()) | {url for _, url in retry_queue}
+        if unfinished and writer:
+            writer({"msg": f"Scrape deadline of {deadline}s reached, skipping {len(unfinished)} URLs"})
+    finally:
+        # Do not wait for stragglers; their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return [docs[url] for url in dict.fromkeys(urls) if url in docs]
+
+
+def cache_latency_report(urls: List[str], cache_path: str) -> Dict[str, Any]:
+    """Scrape the same URLs against a cold and then a warm page cache.
+
+    Args:
+        urls: The URLs to scrape
+        cache_path: Where to create the throwaway cache used for the report
+
+    Returns:
+        Wall time and cache statistics for the cold and the warm pass
+    """
+    cache = PageCache(path=cache_path)
+    cache.clear()
+    report = {}
+    try:
+        for label in ("cold", "warm"):
+            cache.stats = {key: 0 for key in cache.stats}
+            start = time.perf_counter()
+            docs = scrape_pages(urls, cache=cache)
+            report[label] = {
+                "seconds": round(time.perf_counter() - start, 4),
+                "documents": len(docs),
+                "network_requests": cache.stats["misses"] + cache.stats["revalidated"],
+                **cache.stats
+            }
+    finally:
+        cache.close()
+    return report
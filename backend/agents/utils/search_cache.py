@@ -0,0 +1,139 @@
+"""Shared cache for Tavily and SerpAPI search results.
+
+Queries are normalized (case, punctuation, stop words and word order are
+ignored) before lookup, and a query whose normalized terms overlap enough
+with a recent cached query is served from the cache as well, so the
+near-duplicate queries generate_query tends to produce never reach the paid
+provider.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+from ...config.settings import SEARCH_CACHE_PATH, SEARCH_CACHE_TTL, SEARCH_CACHE_SIMILARITY
+
+STOP_WORDS = frozenset("""
+a about again all am an and any are as at be because been being between both but by can could did
+do does doing during each few for from further had has have having he her here hers him his how i
+if in into is it its itself just me more most my now of on once only or other our ours out own same
+she should so some such than that the their theirs them then there these they this those through
+to too until very was we were what when where which while who whom why will with would you your
+yours
+""".split())
+
+# Negation and direction words, which turn a query into a different question
+POLARITY_WORDS = frozenset("""
+above after against before below down no nor not off over under up
+""".split())
+
+# How many recent queries per provider are compared for near-duplicates
+NEAR_DUPLICATE_SCAN_LIMIT = 500
+
+
+def normalize_query(query: str) -> str:
+    """Reduce a query to its sorted set of meaningful terms"""
+    terms = re.findall(r"[a-z0-9]+", query.lower())
+    return " ".join(sorted({term for term in terms if term not in STOP_WORDS}))
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Jaccard overlap between two normalized queries, 0 when their polarity words differ"""
+    terms_a, terms_b = set(a.split()), set(b.split())
+    if not terms_a or not terms_b or terms_a & POLARITY_WORDS != terms_b & POLARITY_WORDS:
+        return 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+class SearchCache:
+    """SQLite-backed search result cache with TTL and near-duplicate lookup"""
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL, similarity: float = SEARCH_CACHE_SIMILARITY):
+        self.path = path
+        self.ttl = ttl
+        self.similarity = similarity
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                provider TEXT NOT NULL,
+                key TEXT NOT NULL,
+                query TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (provider, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS searches_created_at ON searches (provider, created_at)")
+        # Rekey queries normalized by an earlier version, e.g. with "not" dropped
+        for provider, key, query in self._conn.execute("SELECT provider, key, query FROM searches").fetchall():
+            if normalize_query(query) != key:
+                self._conn.execute(
+                    "UPDATE OR REPLACE searches SET key = ? WHERE provider = ? AND key = ?",
+                    (normalize_query(query), provider, key)
+                )
+        self._conn.commit()
+
+    def get(self, provider: str, query: str) -> Optional[List[Any]]:
+        """Return cached results for the query or a near-duplicate of it"""
+        key = normalize_query(query)
+        oldest = time.time() - self.ttl
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results FROM searches WHERE provider = ? AND key = ? AND created_at >= ?",
+                (provider, key, oldest)
+            ).fetchone()
+            if row is not None:
+                self.stats["hits"] += 1
+                return json.loads(row[0])
+
+            if self.similarity < 1.0:
+                candidates = self._conn.execute(
+                    "SELECT key, results FROM searches WHERE provider = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                    (provider, oldest, NEAR_DUPLICATE_SCAN_LIMIT)
+                ).fetchall()
+                best = max(candidates, key=lambda row: query_similarity(key, row[0]), default=None)
+                if best is not None and query_similarity(key, best[0]) >= self.similarity:
+                    self.stats["near_hits"] += 1
+                    return json.loads(best[1])
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, provider: str, query: str, results: List[Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)",
+                (provider, normalize_query(query), query, json.dumps(results), time.time())
+            )
+            self._conn.execute("DELETE FROM searches WHERE created_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM searches")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """Get the process-wide search cache"""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache()
+        return _search_cache
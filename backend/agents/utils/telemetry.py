@@ -0,0 +1,152 @@
+"""Per-node latency, token and cost instrumentation.
+
+Every node registered on the graph is wrapped by instrument_node. The wrapper
+times the node, collects the token usage of every model call the node makes
+and emits one metrics record per node run on the custom stream. The records
+are also appended to the node_metrics state field, so summarize_metrics can
+turn the final state into a per-run summary.
+"""
+import asyncio
+import inspect
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from langgraph.types import StreamWriter
+
+from ...config.models import MODEL_CONFIGS
+from .prompt_packer import count_tokens
+from .cancellation import cancellation_scope, config_token
+
+# Usage of the model calls made by the node currently running
+_node_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("node_usage", default=None)
+
+METRIC_FIELDS = ("seconds", "llm_calls", "prompt_tokens", "completion_tokens", "cost")
+
+
+def new_usage() -> Dict[str, Any]:
+    return {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "models": []}
+
+
+def record_llm_usage(llm: Any, prompt: Any, response: Any):
+    """Add the usage of a model call to the metrics of the running node.
+
+    Token counts come from the response's usage_metadata and are estimated
+    from the prompt and response text when the model does not report them.
+    OpenAIModel only records an input price, so it is applied to all tokens.
+    """
+    usage = _node_usage.get()
+    if usage is None:
+        return
+
+    model_name = getattr(llm, "model_name", None) or type(llm).__name__
+    metadata = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = metadata.get("input_tokens")
+    completion_tokens = metadata.get("output_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = count_tokens(prompt if isinstance(prompt, str) else str(prompt), model_name)
+    if completion_tokens is None:
+        completion_tokens = count_tokens(str(getattr(response, "content", "")), model_name)
+
+    cost_per_1k = MODEL_CONFIGS.get(model_name, {}).get("cost_per_1k_tokens", 0.0)
+    usage["llm_calls"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    usage["cost"] += (prompt_tokens + completion_tokens) / 1000 * cost_per_1k
+    if model_name not in usage["models"]:
+        usage["models"].append(model_name)
+
+
+def _finish(name: str, state: Dict[str, Any], started: float, usage: Dict[str, Any], writer: StreamWriter, result: Any) -> Any:
+    """Emit the metrics of a node run and attach them to its state update"""
+    metrics = {
+        "node": name,
+        "iteration": state.get("iteration", 0),
+        "seconds": round(time.perf_counter() - started, 4),
+        **usage,
+        "cost": round(usage["cost"], 6),
+    }
+    writer({"metrics": metrics})
+    if isinstance(result, dict):
+        result = {**result, "node_metrics": [metrics]}
+    return result
+
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """Wrap a node so each run is timed and its model usage recorded.
+
+    The wrapper keeps the (state, writer, config) signature LangGraph uses to
+    decide what to inject, and passes config on only if the node takes it.
+    It also makes the run's cancellation token current for the node and
+    refuses to start the node once the run was cancelled.
+    """
+    takes_config = "config" in inspect.signature(node).parameters
+
+    def arguments(state, writer, config):
+        return (state, writer, config) if takes_config else (state, writer)
+
+    if asyncio.iscoroutinefunction(node):
+        async def async_wrapper(state: Dict[str, Any], writer: StreamWriter, config: Dict[str, Any]) -> Any:
+            cancel_token = config_token(config)
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            usage = new_usage()
+            token = _node_usage.set(usage)
+            started = time.perf_counter()
+            try:
+                with cancellation_scope(cancel_token):
+                    result = await node(*arguments(state, writer, config))
+            finally:
+                _node_usage.reset(token)
+            return _finish(name, state, started, usage, writer, result)
+        return async_wrapper
+
+    def wrapper(state: Dict[str, Any], writer: StreamWriter, config: Dict[str, Any]) -> Any:
+        cancel_token = config_token(config)
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        usage = new_usage()
+        token = _node_usage.set(usage)
+        started = time.perf_counter()
+        try:
+            with cancellation_scope(cancel_token):
+                result = node(*arguments(state, writer, config))
+        finally:
+            _node_usage.reset(token)
+        return _finish(name, state, started, usage, writer, result)
+    return wrapper
+
+
+def summarize_metrics(node_metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate node metrics into totals per run, per node and per iteration.
+
+    Args:
+        node_metrics: The node_metrics field of a run's state
+
+    Returns:
+        Dictionary with "total", "nodes" and "iterations" entries, each
+        holding runs, seconds, llm_calls, prompt_tokens, completion_tokens
+        and cost. Seconds of parallel branches are summed, so the totals can
+        exceed the wall time of the run.
+    """
+    def empty():
+        return {"runs": 0, **{field: 0 for field in METRIC_FIELDS}}
+
+    total = empty()
+    nodes = defaultdict(empty)
+    iterations = defaultdict(empty)
+    for metrics in node_metrics:
+        for bucket in (total, nodes[metrics["node"]], iterations[metrics["iteration"]]):
+            bucket["runs"] += 1
+            for field in METRIC_FIELDS:
+                bucket[field] += metrics.get(field, 0)
+
+    def rounded(bucket):
+        return {**bucket, "seconds": round(bucket["seconds"], 4), "cost": round(bucket["cost"], 6)}
+
+    return {
+        "total": rounded(total),
+        "nodes": {name: rounded(bucket) for name, bucket in sorted(nodes.items(), key=lambda item: -item[1]["seconds"])},
+        "iterations": {iteration: rounded(bucket) for iteration, bucket in sorted(iterations.items())},
+    }
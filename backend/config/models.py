@@ -243,9 +243,12 @@ class OpenAIModel(Enum):
 DEFAULT_MODEL = OpenAIModel.GPT4O.value["name"]  # Using the latest GPT-4o model
 DEFAULT_EMBEDDING_MODEL = OpenAIModel.EMBEDDING_3_SMALL.value["name"]
 
+# Name to configuration lookup, built once
+MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {model.value["name"]: model.value for model in OpenAIModel}
+
 def get_model_config(model_name: str) -> Dict[str, Any]:
     """Get the configuration for a specific model by name"""
-    for model in OpenAIModel:
-        if model.value["name"] == model_name:
-            return model.value
-    raise ValueError(f"Model {model_name} not found in configuration") 
\ No newline at end of file
+    try:
+        return MODEL_CONFIGS[model_name]
+    except KeyError:
+        raise ValueError(f"Model {model_name} not found in configuration")
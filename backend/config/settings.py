@@ -14,11 +14,85 @@ IMPROVEMENT_THRESHOLD = 0.05
 # Model Configuration
 DEFAULT_MODEL = "gpt-4o-mini"
 FALLBACK_MODEL = "gpt-3.5-turbo"
+LLM_MAX_CONNECTIONS = 100  # shared by every model client
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_KEEPALIVE_EXPIRY = 60  # seconds an idle connection is kept open
+
+# Knowledge Base Configuration
+EMBEDDING_BACKEND = os.getenv("RAVE_EMBEDDINGS", "openai")  # "local" embeds offline with feature hashing
+EMBEDDING_CACHE_SIZE = 10000  # embeddings kept in memory, keyed by text
+KB_PROMPT_TOP_K = 20  # existing nuggets sent with each knowledge base update
+KB_PROMPT_BUDGET_SHARE = 0.3  # share of the update prompt budget for existing nuggets, the rest for search results
+KB_PASSAGE_BUDGET_SHARE = 0.4  # share of the update prompt budget for scraped page passages
+PASSAGE_WORDS = 160  # words per passage of a scraped page
+PASSAGE_OVERLAP_WORDS = 40  # words shared by consecutive passages
+PASSAGE_CANDIDATES = 30  # BM25 candidates per query reranked with embeddings
+PASSAGE_TOP_K = 8  # passages sent with each knowledge base update
+
+# Prompt Budget Configuration
+PROMPT_OUTPUT_RESERVE = 4096  # tokens of the context window kept for the response
+PROMPT_BUDGET_FRACTION = 0.9  # headroom for token counting error
+PROMPT_TOKEN_LIMITS = {  # upper bound on prompt tokens per node, whatever the context window
+    "answer_model": 32000,
+    "kb_model": 24000,
+}
+CHARS_PER_TOKEN = 4  # token estimate when no tokenizer is available
 
 # Search Configuration
 MAX_SEARCH_RESULTS = 3
+MAX_PARALLEL_QUERIES = 1  # queries per iteration; above 1, one query per unmet checklist item
 SEARCH_TIMEOUT = 30  # seconds
 
+# Rate Limit Configuration
+RATE_LIMITS = {  # quotas per provider; OpenAI quotas apply to each model separately
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200_000, "max_concurrency": 32},
+    "serpapi": {"requests_per_minute": 100, "max_concurrency": 8},
+    "tavily": {"requests_per_minute": 100, "max_concurrency": 8},
+}
+MODEL_RATE_LIMITS = {}  # overrides per model, e.g. {"gpt-4o": {"tokens_per_minute": 30_000}}
+RATE_LIMIT_BURST_SECONDS = 10  # seconds of quota that may be spent at once
+RATE_LIMIT_MAX_RETRIES = 5  # attempts after a 429 or a server error before giving up
+RATE_LIMIT_BACKOFF_BASE = 1.0  # seconds, doubled on every retry and jittered
+RATE_LIMIT_BACKOFF_MAX = 60.0  # seconds
+
+# Scraping Configuration
+SCRAPE_MAX_WORKERS = 8  # concurrent page fetches per scrape_urls call
+SCRAPE_TIMEOUT = 10  # seconds per request
+SCRAPE_MAX_RETRIES = 3
+SCRAPE_BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+SCRAPE_DEADLINE = 30  # seconds for all pages of one iteration
+SCRAPE_MAX_BYTES = 2 * 1024 * 1024  # bytes of a page body read, the rest is cut off
+SCRAPE_MAX_SESSIONS = 64  # hosts whose HTTP sessions are kept open, least recently used closed first
+EXTRACT_MIN_CHARS = 250  # shorter main content falls back to the page's cleaned body text
+PARSE_WORKERS = min(4, os.cpu_count() or 1)  # processes parsing pages off the GIL
+PARSE_TIMEOUT = 15  # seconds to parse one document
+PARSE_INLINE_BYTES = 32 * 1024  # smaller pages are parsed in the fetching thread
+PDF_MAX_BYTES = 20 * 1024 * 1024  # larger PDFs are skipped, a cut off PDF cannot be read
+PDF_MAX_PAGES = 50  # pages of a PDF whose text is extracted
+NEAR_DUPLICATE_DISTANCE = 8  # of 64 SimHash bits two pages may differ in and still count as copies; unrelated pages differ in about 32
+NEAR_DUPLICATE_MIN_WORDS = 50  # shorter pages are always kept, too short to fingerprint reliably
+DEDUPE_ACROSS_RUNS = False  # also drop pages that copy one scraped by an earlier run
+FINGERPRINT_INDEX_SIZE = 10000  # pages remembered for DEDUPE_ACROSS_RUNS
+CANCEL_POLL_INTERVAL = 0.05  # seconds between cancellation checks while waiting on pages
+
+# Cache Configuration
+CACHE_DIR = os.getenv("RAVE_CACHE_DIR", ".cache")
+PAGE_CACHE_PATH = os.path.join(CACHE_DIR, "pages.sqlite")
+PAGE_CACHE_TTL = 24 * 60 * 60  # seconds before a cached page is revalidated
+PAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024  # least recently used pages are evicted above this
+SEARCH_CACHE_PATH = os.path.join(CACHE_DIR, "searches.sqlite")
+SEARCH_CACHE_TTL = 6 * 60 * 60  # seconds
+SEARCH_CACHE_SIMILARITY = 0.8  # token overlap at which two queries count as duplicates
+CHECKPOINT_PATH = os.path.join(CACHE_DIR, "checkpoints.sqlite")  # graph state after every step, per session thread
+
+# Batch Configuration
+BATCH_CONCURRENCY = 8  # questions researched at once by the batch runner
+
+# Cassette Configuration
+CASSETTE_MODE = os.getenv("RAVE_CASSETTE_MODE", "off")  # "record" captures provider calls, "replay" serves them offline
+CASSETTE_PATH = os.getenv("RAVE_CASSETTE", os.path.join(CACHE_DIR, "cassette.jsonl"))
+CASSETTE_LATENCY_SCALE = float(os.getenv("RAVE_CASSETTE_LATENCY", "0"))  # replay delay as a multiple of the recorded latency
+
 # Logging Configuration
 LOG_LEVEL = "INFO"
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
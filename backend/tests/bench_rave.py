@@ -0,0 +1,293 @@
+"""Offline benchmark of the full RAVE loop.
+
+Replays the compiled graph against recorded fixtures:
+- canned ChatOpenAI responses for every node
+- the SerpAPI response captured in sample.py
+- canned HTML pages served from a local HTTP server
+
+No network access is needed. Every run starts from empty page and search
+caches, so each run exercises the whole pipeline. The report gives p50/p95
+end-to-end latency, per-node time and peak memory.
+
+Usage:
+    python -m backend.tests.bench_rave --runs 20 --llm-latency 0.05
+"""
+import argparse
+import contextlib
+import copy
+import json
+import math
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, Iterator, List
+from unittest import mock
+from urllib.parse import urlsplit
+
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents import rave_agent
+from backend.agents.utils.kb_index import LocalEmbeddings
+from backend.agents.utils.page_cache import PageCache
+from backend.agents.utils.search_cache import SearchCache
+from backend.agents.utils.telemetry import summarize_metrics
+from backend.tests.sample import sample_response
+
+QUESTION = sample_response["search_parameters"]["q"]
+
+
+class RecordedChatModel(FakeListChatModel):
+    """Plays back recorded responses, optionally taking a fixed time per call"""
+    latency: float = 0.0
+
+    def _call(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super()._stream(*args, **kwargs)
+
+
+def local_link(base_url: str, link: str) -> str:
+    """Point a recorded result link at the local page server"""
+    parts = urlsplit(link)
+    return f"{base_url}/{parts.netloc}{parts.path}"
+
+
+def recorded_search(base_url: str) -> Dict[str, Any]:
+    """The recorded SerpAPI response with links rewritten to the page server"""
+    response = copy.deepcopy(sample_response)
+    for result in response["organic_results"]:
+        result["link"] = local_link(base_url, result["link"])
+    return response
+
+
+def recorded_responses(base_url: str) -> Dict[str, List[str]]:
+    """Model output per node; the first answer falls short so the loop runs twice"""
+    organic = recorded_search(base_url)["organic_results"]
+    checklist = ["Names the capital of France", "Gives the population of Paris"]
+
+    def scores(*values):
+        return json.dumps({"items": [
+            {"item_to_score": item, "current_score": value} for item, value in zip(checklist, values)
+        ]})
+
+    return {
+        "question_model": ["What is the capital of France, and what is its population?"],
+        "checklist_model": [scores(0.0, 0.0)],
+        "query_model": ["capital of France", "population of Paris 2025"],
+        "url_model": [json.dumps({"urls": [
+            {"url": result["link"], "score": 90 - 10 * i} for i, result in enumerate(organic)
+        ]})],
+        "kb_model": [
+            json.dumps({"new_nuggets": [
+                {"content": "Paris is the capital of France.", "source_url": organic[0]["link"], "confidence": 0.95}
+            ]}),
+            json.dumps({"new_nuggets": [
+                {"content": "Paris had an estimated 2,048,472 residents in January 2025.", "source_url": organic[0]["link"], "confidence": 0.8}
+            ]}),
+        ],
+        "answer_model": [
+            "# Paris\n\nParis is the capital of France.",
+            "# Paris\n\nParis is the capital of France, with about 2.05 million residents (2025).",
+        ],
+        "scoring_model": [scores(1.0, 0.2), scores(1.0, 1.0)],
+    }
+
+
+def canned_page(path: str, size: int) -> bytes:
+    """An HTML page of roughly size bytes for a path on the page server"""
+    snippets = {urlsplit(result["link"]).path: result["snippet"] for result in sample_response["organic_results"]}
+    text = snippets.get(path[path.find("/", 1):], "Paris is the capital and largest city of France.")
+    paragraph = f"<p>{text}</p>\n"
+    body = paragraph * max(1, size // len(paragraph))
+    return (
+        f"<html lang='en'><head><title>{path}</title>"
+        f"<meta name='description' content='{text[:80]}'></head><body>{body}</body></html>"
+    ).encode("utf-8")
+
+
+@contextlib.contextmanager
+def page_server(page_size: int) -> Iterator[str]:
+    """Serve canned HTML pages on an ephemeral local port"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = canned_page(self.path, page_size)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@contextlib.contextmanager
+def offline_agent(base_url: str, cache_dir: str, llm_latency: float) -> Iterator[Callable[[], None]]:
+    """Patch rave_agent to use recorded models, the recorded search and throwaway caches"""
+    responses = recorded_responses(base_url)
+    search_response = recorded_search(base_url)
+    models: Dict[str, RecordedChatModel] = {}
+
+    def get_model(node_name, config, writer=None):
+        if node_name not in models:
+            models[node_name] = RecordedChatModel(responses=responses[node_name], latency=llm_latency)
+        return models[node_name]
+
+    class RecordedGoogleSearch:
+        def __init__(self, params):
+            self.params = params
+
+        def get_dict(self):
+            return copy.deepcopy(search_response)
+
+    page_cache = PageCache(path=f"{cache_dir}/pages.sqlite")
+    search_cache = SearchCache(path=f"{cache_dir}/searches.sqlite")
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(rave_agent, "getModel", get_model))
+        stack.enter_context(mock.patch.object(rave_agent, "GoogleSearch", RecordedGoogleSearch))
+        stack.enter_context(mock.patch.object(rave_agent, "get_page_cache", lambda: page_cache))
+        stack.enter_context(mock.patch.object(rave_agent, "get_search_cache", lambda: search_cache))
+        stack.enter_context(mock.patch.object(rave_agent, "get_embeddings", LocalEmbeddings))
+        stack.callback(page_cache.close)
+        stack.callback(search_cache.close)
+
+        # Each run starts cold and plays the recorded responses from the top
+        def reset():
+            models.clear()
+            page_cache.clear()
+            search_cache.clear()
+
+        yield reset
+
+
+def initial_state() -> Dict[str, Any]:
+    return {
+        "messages": [],
+        "question": QUESTION,
+        "improved_question": "",
+        "scored_checklist": [],
+        "current_query": None,
+        "query_history": [],
+        "search_results": [],
+        "urls_to_scrape": [],
+        "scraped_content": [],
+        "knowledge_base": [],
+        "answer": None,
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def run_benchmark(runs: int = 20, warmup: int = 1, llm_latency: float = 0.0, page_size: int = 50_000, max_iterations: int = 3) -> Dict[str, Any]:
+    """Run the compiled graph repeatedly against the recorded fixtures.
+
+    Args:
+        runs: Timed runs
+        warmup: Untimed runs first, to load models, parsers and tokenizers
+        llm_latency: Seconds each recorded model call takes
+        page_size: Approximate size in bytes of each canned page
+        max_iterations: Research iterations allowed per run
+
+    Returns:
+        Dictionary with end-to-end latency percentiles, per-node time and
+        peak memory
+    """
+    config = {"configurable": {"max_iterations": max_iterations, "score_threshold": 0.9}}
+    latencies, node_seconds, final_state = [], {}, None
+
+    with tempfile.TemporaryDirectory() as cache_dir, page_server(page_size) as base_url, \
+            offline_agent(base_url, cache_dir, llm_latency) as reset:
+        for i in range(warmup + runs):
+            reset()
+            start = time.perf_counter()
+            final_state = rave_agent.compiled.invoke(initial_state(), config=config)
+            elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            for node, totals in summarize_metrics(final_state["node_metrics"])["nodes"].items():
+                node_seconds.setdefault(node, []).append(totals["seconds"])
+
+        # One more run under tracemalloc, so tracing does not skew the latencies
+        reset()
+        tracemalloc.start()
+        try:
+            rave_agent.compiled.invoke(initial_state(), config=config)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "runs": runs,
+        "llm_latency": llm_latency,
+        "iterations": final_state.get("iteration", 0) if final_state else 0,
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "mean": round(statistics.mean(latencies), 4),
+            "max": round(max(latencies), 4),
+        },
+        "nodes": {
+            node: {
+                "p50": round(percentile(seconds, 50), 4),
+                "p95": round(percentile(seconds, 95), 4),
+                "share": round(sum(seconds) / sum(latencies), 4),
+            }
+            for node, seconds in sorted(node_seconds.items(), key=lambda item: -sum(item[1]))
+        },
+        "peak_memory_mb": round(peak_bytes / 2**20, 2),
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    latency = report["latency"]
+    lines = [
+        f"{report['runs']} runs, {report['iterations']} iterations each, {report['llm_latency']}s per model call",
+        f"end-to-end  p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  max {latency['max']:.3f}s",
+        f"peak memory {report['peak_memory_mb']:.1f} MB",
+        "",
+        f"{'node':<28}{'p50':>9}{'p95':>9}{'share':>8}",
+    ]
+    for node, stats in report["nodes"].items():
+        lines.append(f"{node:<28}{stats['p50']:>8.3f}s{stats['p95']:>8.3f}s{stats['share']:>7.0%}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAVE graph offline against recorded fixtures")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds each model call takes")
+    parser.add_argument("--page-size", type=int, default=50_000, help="bytes per canned page")
+    parser.add_argument("--max-iterations", type=int, default=3)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs, args.warmup, args.llm_latency, args.page_size, args.max_iterations)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,13 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.insert(0, project_root)
 
 from backend.agents.utils.prompts import create_kb_update_prompt
-from backend.agents.utils.prompts import KBUpdateResponse
+from backend.agents.utils.prompts import KBExtractionResponse
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
 def main():
     # Get format instructions
-    parser = PydanticOutputParser(pydantic_object=KBUpdateResponse)
+    parser = PydanticOutputParser(pydantic_object=KBExtractionResponse)
     format_instructions = parser.get_format_instructions()
     
     # Create the prompt using the actual function
@@ -26,6 +26,7 @@ def main():
             question="test question",
             current_kb="[]",
             search_results="[]",
+            passages="[]",
             current_date=current_date,
             format_instructions=format_instructions
         )
@@ -1,5 +1,6 @@
 import sys
 import os
+import math
 import random
 from enum import Enum
 import json
@@ -9,124 +10,79 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 import streamlit as st
-from backend.agents.rave_agent import graph
+from backend.agents.rave_agent import resumable_graph
+from backend.agents.utils.telemetry import summarize_metrics
+from backend.agents.utils.checkpointer import get_checkpointer, thread_config
+from backend.agents.utils.cancellation import CancellationToken, RunCancelled
+from frontend.values_history import ValuesHistory
+from frontend.session_log import SESSIONS_DIR, LazySessionHistory, SessionLog, compact_session_log, load_any_session, write_session_log
+from frontend.session_index import get_session_index
 from backend.config.models import OpenAIModel, get_model_config
 
 import time
-import copy
-from backend.config.settings import MAX_ITERATIONS, OPENAI_API_KEY, TAVILY_API_KEY
+from backend.config.settings import MAX_ITERATIONS, MAX_PARALLEL_QUERIES, OPENAI_API_KEY, TAVILY_API_KEY
 import pandas as pd
 
 VERSION = "0.1.5"
+SESSIONS_PAGE_SIZE = 20  # sessions listed per page of the sidebar
 
 
 # Session management functions
-def save_session():
-    """Save current session to a file"""
-    try:
-        # Create a serializable copy of the session data
-        
-        # Convert the KnowledgeNugget objects to dictionaries
-        serializable_values_history = []
-        for values_entry in st.session_state.values_history:
-            # Create a copy of the entry to avoid modifying the original
-            entry_copy = values_entry.copy()
-            
-            # Handle knowledge_base if it exists
-            if "knowledge_base" in entry_copy:
-                knowledge_base = entry_copy["knowledge_base"]
-                serializable_knowledge_base = []
-                for nugget in knowledge_base:
-                    try:
-                        # Convert Pydantic model to dict using model_dump()
-                        nugget_dict = nugget.model_dump()
-                        serializable_knowledge_base.append(nugget_dict)
-                    except Exception as e:
-                        print(f"Error serializing nugget: {e}")
-                        continue
-                entry_copy["knowledge_base"] = serializable_knowledge_base
-            
-            serializable_values_history.append(entry_copy)
+def current_model_settings():
+    return {
+        "question_model": st.session_state.question_model,
+        "checklist_model": st.session_state.checklist_model,
+        "query_model": st.session_state.query_model,
+        "answer_model": st.session_state.answer_model,
+        "scoring_model": st.session_state.scoring_model,
+        "kb_model": st.session_state.kb_model,
+        "max_iterations": st.session_state.max_iterations,
+        "score_threshold": st.session_state.score_threshold,
+        "max_parallel_queries": st.session_state.max_parallel_queries
+    }
 
-        session_data = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d_%H%M%S"),
-            "question": st.session_state.current_question,
-            "status_messages": st.session_state.status_messages,
-            "values_history": serializable_values_history,
-            "values_history_description": st.session_state.values_history_description,
-            "current_values_idx": st.session_state.current_values_idx,
-            "processing_status": st.session_state.processing_status,
-            "processing_status_message": st.session_state.processing_status_message,
-            "model_settings": {
-                "question_model": st.session_state.question_model,
-                "checklist_model": st.session_state.checklist_model,
-                "query_model": st.session_state.query_model,
-                "answer_model": st.session_state.answer_model,
-                "scoring_model": st.session_state.scoring_model,
-                "kb_model": st.session_state.kb_model,
-                "max_iterations": st.session_state.max_iterations,
-                "score_threshold": st.session_state.score_threshold
-            }
-        }
-        
-        # Create sessions directory if it doesn't exist
-        os.makedirs("sessions", exist_ok=True)
-        
-        # Save to file with proper error handling
-        filename = f"sessions/session_{session_data['timestamp']}.json"
-        temp_filename = f"{filename}.tmp"
-        
-        # First write to a temporary file
-        with open(temp_filename, "w") as f:
-            json.dump(session_data, f, indent=2)
-        
-        # Verify the temporary file is valid JSON
-        with open(temp_filename, "r") as f:
-            json.load(f)  # This will raise an error if the JSON is invalid
-        
-        # If we get here, the JSON is valid, so we can rename the temp file
-        if os.path.exists(filename):
-            os.remove(filename)
-        os.rename(temp_filename, filename)
-        
-        return filename
-    except Exception as e:
-        print(f"Error saving session: {e}")
-        # Clean up temporary file if it exists
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
-        raise
+def save_session():
+    """Save the current session as a compact session log"""
+    # A run is logged step by step as it happens, so saving it only compacts the log
+    session_log = st.session_state.session_log
+    if session_log is not None:
+        compact_session_log(session_log.path)
+        get_session_index().add(session_log.path)
+        return session_log.path
+
+    # A loaded session is written out as a new log
+    session_log = SessionLog.create(st.session_state.current_question, current_model_settings())
+    write_session_log(session_log.path, {
+        "thread_id": session_log.thread_id,
+        "question": st.session_state.current_question,
+        "model_settings": current_model_settings(),
+        "status_messages": st.session_state.status_messages,
+        "values_history": st.session_state.values_history,
+        "values_history_description": st.session_state.values_history_description,
+        "current_values_idx": st.session_state.current_values_idx,
+        "processing_status": st.session_state.processing_status,
+        "processing_status_message": st.session_state.processing_status_message
+    })
+    get_session_index().add(session_log.path)
+    return session_log.path
 
 def load_session(filename):
     """Load a session from file"""
     try:
         print("loading session", filename)
-        with open(filename, "r") as f:
-            session_data = json.load(f)
+        session_data = load_any_session(filename)
         print("session_data question", session_data["question"])
 
         # Restore session state
+        st.session_state.session_log = None
+        st.session_state.session_path = filename
+        st.session_state.thread_id = session_data.get("thread_id")
         st.session_state.current_question = session_data["question"]
         st.session_state.status_messages = session_data["status_messages"]
-        
-        # Convert serialized knowledge_base back to KnowledgeNugget objects
-        values_history = []
-        for value in session_data["values_history"]:
-            # Create a copy of the value to avoid modifying the original
-            value_copy = value.copy()
-            
-            # Handle knowledge_base if it exists
-            if "knowledge_base" in value_copy:
-                knowledge_base = value_copy["knowledge_base"]
-                reconstructed_knowledge_base = []
-                for nugget_dict in knowledge_base:
-                    # Reconstruct KnowledgeNugget using model_validate
-                    from backend.agents.utils.prompts import KnowledgeNugget
-                    reconstructed_knowledge_base.append(KnowledgeNugget.model_validate(nugget_dict))
-                value_copy["knowledge_base"] = reconstructed_knowledge_base
-            
-            values_history.append(value_copy)
-        
+        values_history = session_data["values_history"]
+        # Session logs are read step by step as they are shown
+        if not isinstance(values_history, LazySessionHistory):
+            values_history = ValuesHistory.from_snapshots(values_history)
         st.session_state.values_history = values_history
         st.session_state.values_history_description = session_data["values_history_description"]
         st.session_state.current_values_idx = session_data["current_values_idx"]
@@ -143,6 +99,7 @@ def load_session(filename):
         st.session_state.kb_model = model_settings["kb_model"]
         st.session_state.max_iterations = model_settings["max_iterations"]
         st.session_state.score_threshold = model_settings["score_threshold"]
+        st.session_state.max_parallel_queries = model_settings.get("max_parallel_queries", MAX_PARALLEL_QUERIES)
         return True
     except Exception as e:
         print("error loading session", e)
@@ -152,7 +109,11 @@ def load_session(filename):
 def delete_session(filename):
     """Delete a saved session file"""
     try:
+        thread_id = load_any_session(filename).get("thread_id") if filename.endswith(".jsonl") else None
         os.remove(filename)
+        get_session_index().remove(filename)
+        if thread_id:
+            get_checkpointer().delete_thread(thread_id)
         return True
     except Exception as e:
         st.error(f"Error deleting session: {str(e)}")
@@ -167,6 +128,8 @@ class ProcessStatus(Enum):
 
 ### Session Management
 def cancel_processing():
+    if st.session_state.cancel_token is not None:
+        st.session_state.cancel_token.cancel()
     st.session_state.processing_status = ProcessStatus.CANCELED.value
     st.session_state.processing_status_message = "Processing canceled"
     output_control_container()
@@ -176,8 +139,11 @@ def new_conversation():
     st.session_state.current_question = ""
     st.session_state.status_messages = []
     st.session_state.current_values = {}
-    st.session_state.values_history = []
+    st.session_state.values_history = ValuesHistory()
     st.session_state.values_history_description = []
+    st.session_state.session_log = None
+    st.session_state.session_path = None
+    st.session_state.thread_id = None
     st.session_state.processing_status = ProcessStatus.WAITING_FOR_INPUT.value
     st.session_state.processing_status_message = "Waiting for input..."
     output_control_container()
@@ -202,6 +168,10 @@ def output_control_container():
             if st.session_state.processing_status == ProcessStatus.PROCESSING.value:
                 st.button("Cancel", key=f"cancel_processing", on_click=cancel_processing)
             
+            resume_from = resumable_nodes()
+            if resume_from:
+                st.button(f"Resume from {', '.join(resume_from)}", key=f"resume_processing_{random.randint(0, 1000000)}", on_click=resume_processing)
+
             if st.session_state.processing_status == ProcessStatus.COMPLETED.value or st.session_state.processing_status == ProcessStatus.CANCELED.value:
                 st.button("New Conversation", key=f"new_conversation_{random.randint(0, 1000000)}", on_click=new_conversation)
 
@@ -230,7 +200,10 @@ def output_values(output_data):
     
     with st.session_state.scraped_content_container:
         if "scraped_content" in output_data:
-            st.json({"scraped_content": output_data["scraped_content"]})
+            st.json({
+                "scraped_content": output_data["scraped_content"],
+                "dropped_duplicates": output_data.get("dropped_duplicates", [])
+            })
 
     with st.session_state.kb_container:
         if "knowledge_base" in output_data:
@@ -240,6 +213,10 @@ def output_values(output_data):
         if "answer" in output_data:
             st.markdown(output_data["answer"])
     
+    with st.session_state.metrics_container:
+        if output_data.get("node_metrics"):
+            output_metrics(output_data["node_metrics"])
+    
     with st.session_state.scored_checklist_container:
         if "scored_checklist" in output_data and output_data["scored_checklist"]:
             scorecard_container = st.container()
@@ -264,6 +241,20 @@ def output_values(output_data):
                     with col2:
                         st.progress(score)
 
+def output_metrics(node_metrics):
+    summary = summarize_metrics(node_metrics)
+    metrics_container = st.container()
+    with metrics_container:
+        total = summary["total"]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Node time", f"{total['seconds']:.1f}s")
+        col2.metric("Tokens", f"{total['prompt_tokens'] + total['completion_tokens']:,}")
+        col3.metric("Estimated cost", f"${total['cost']:.4f}")
+        st.markdown("#### Per node")
+        st.dataframe(pd.DataFrame.from_dict(summary["nodes"], orient="index"))
+        st.markdown("#### Per iteration")
+        st.dataframe(pd.DataFrame.from_dict(summary["iterations"], orient="index"))
+
 def output_currently_selected_values():
     if st.session_state.current_values_idx is not None and 0 <= st.session_state.current_values_idx < len(st.session_state.values_history):
         idx = st.session_state.current_values_idx
@@ -379,75 +370,134 @@ def output_workflow_visualization():
 # Update functions are reactive by calling output_values which writes to pre-defined containers
 def update_values(output_data):
     # print("update_values", output_data)
-    output_data_copy = copy.deepcopy(output_data)
+    # No copy is made: nodes return new objects rather than mutating the state,
+    # and the history only keeps what changed since the previous step
     description = ""
     if len(st.session_state.status_messages) > 0:
         description = st.session_state.status_messages[-1]
     else:
         description = "Initial values"
-    st.session_state.current_values = output_data_copy
-    st.session_state.values_history.append(output_data_copy)
+    st.session_state.current_values = output_data
+    st.session_state.partial_answer = ""  # the streamed answer is now part of the values
+    st.session_state.values_history.append(output_data)
     st.session_state.values_history_description.append(description)
-    output_values(output_data_copy)
+    if st.session_state.session_log is not None:
+        st.session_state.session_log.append_step(output_data, description)
+    output_values(output_data)
+
+def update_partial_answer(token):
+    st.session_state.partial_answer += token
+    with st.session_state.answer_container:
+        st.markdown(st.session_state.partial_answer)
 
 def update_status_messages(message_text):
     st.session_state.status_messages.append(message_text)
+    if st.session_state.session_log is not None:
+        st.session_state.session_log.append_status(message_text)
     st.session_state.processing_status_message = message_text
     output_status_message_area()
 
-def agent_process():
-    print("agent_process: " + st.session_state.current_question)
+def resumable_nodes():
+    """Nodes an interrupted run of the current session would resume from"""
+    if st.session_state.processing_status in (ProcessStatus.PROCESSING.value, ProcessStatus.WAITING_FOR_INPUT.value):
+        return ()
+    if not st.session_state.thread_id:
+        return ()
+    return resumable_graph.get_state(thread_config(st.session_state.thread_id)).next
 
-    initial_state = {
-        "messages": [],
-        "question": st.session_state.current_question,
-        "improved_question": "",
-        "scored_checklist": [],
-        "current_query": None,
-        "query_history": [],
-    "search_results": [],
-    "urls_to_scrape": [],
-        "scraped_content": [],
-        "knowledge_base": [],
-        "answer": None,
-    }
+def agent_process(resume=False):
+    print("agent_process: " + st.session_state.current_question)
 
-    # Create config with model settings
-    config = {
-        "configurable": {
-            "question_model": st.session_state.question_model,
-            "checklist_model": st.session_state.checklist_model,
-            "query_model": st.session_state.query_model,
-            "answer_model": st.session_state.answer_model,
-            "scoring_model": st.session_state.scoring_model,
-            "kb_model": st.session_state.kb_model,
-            "max_iterations": st.session_state.max_iterations,
-            "score_threshold": st.session_state.score_threshold
+    if resume:
+        # Pick up from the last checkpoint of the session's thread
+        graph_input = None
+        if st.session_state.session_log is None:
+            if isinstance(st.session_state.values_history, LazySessionHistory):
+                st.session_state.values_history = ValuesHistory.from_snapshots(st.session_state.values_history)
+            last_values = st.session_state.values_history[-1] if len(st.session_state.values_history) else {}
+            st.session_state.session_log = SessionLog.reopen(st.session_state.session_path, last_values)
+    else:
+        graph_input = {
+            "messages": [],
+            "question": st.session_state.current_question,
+            "improved_question": "",
+            "scored_checklist": [],
+            "current_query": None,
+            "query_history": [],
+        "search_results": [],
+        "urls_to_scrape": [],
+            "scraped_content": [],
+            "knowledge_base": [],
+            "answer": None,
         }
-    }
+
+        # Every step is appended to the session log as it happens
+        st.session_state.session_log = SessionLog.create(st.session_state.current_question, current_model_settings())
+        st.session_state.session_path = st.session_state.session_log.path
+        st.session_state.thread_id = st.session_state.session_log.thread_id
+
+    # Create config with model settings, the session's checkpoint thread and
+    # the token that cancels the run
+    cancel_token = CancellationToken()
+    st.session_state.cancel_token = cancel_token
+    config = thread_config(st.session_state.thread_id, cancel_token=cancel_token, **current_model_settings())
 
     # Process with the agent
-    for output in graph.stream(initial_state, config=config, stream_mode=["values", "custom"]):
-        if isinstance(output, tuple):
-            output_type, output_data = output
-            if output_type == "custom":
-                # Add new status message
-                update_status_messages(output_data.get("msg", ""))
+    try:
+        for output in resumable_graph.stream(graph_input, config=config, stream_mode=["values", "custom"]):
+            if isinstance(output, tuple):
+                output_type, output_data = output
+                if output_type == "custom":
+                    if "answer_token" in output_data:
+                        # Render the answer as it streams in
+                        update_partial_answer(output_data["answer_token"])
+                        continue
+                    if "metrics" in output_data:
+                        # Node metrics reach the Metrics tab through the values
+                        continue
 
-            elif output_type == "values":
-                # Update values in the main area
-                update_values(output_data)
+                    # Add new status message
+                    update_status_messages(output_data.get("msg", ""))
 
-            output_workflow_visualization()
+                elif output_type == "values":
+                    # Update values in the main area
+                    update_values(output_data)
+
+                output_workflow_visualization()
+    finally:
+        # Streamlit stops the script on a rerun, e.g. when Cancel is clicked;
+        # branches still running in the graph's threads stop at their next check
+        cancel_token.cancel()
 
     st.session_state.current_values_idx = len(st.session_state.values_history) - 1
 
-def handle_question_input():
-    st.session_state.current_question = st.session_state.question_input
+def run_agent(resume=False):
     st.session_state.processing_status = ProcessStatus.PROCESSING.value
     output_control_container()
-    agent_process()
-    st.session_state.processing_status = ProcessStatus.COMPLETED.value
+    try:
+        agent_process(resume=resume)
+    except RunCancelled:
+        st.session_state.processing_status = ProcessStatus.CANCELED.value
+        st.session_state.processing_status_message = "Processing canceled"
+        st.session_state.current_values_idx = len(st.session_state.values_history) - 1
+    else:
+        st.session_state.processing_status = ProcessStatus.COMPLETED.value
+    st.session_state.session_log.finish(
+        st.session_state.current_values_idx,
+        st.session_state.processing_status,
+        st.session_state.processing_status_message
+    )
+    get_session_index().add(st.session_state.session_log.path)
+    if st.session_state.processing_status == ProcessStatus.COMPLETED.value:
+        # A completed run has nothing left to resume
+        get_checkpointer().delete_thread(st.session_state.thread_id)
+
+def handle_question_input():
+    st.session_state.current_question = st.session_state.question_input
+    run_agent()
+
+def resume_processing():
+    run_agent(resume=True)
 
 
 ### Initialize session state variables
@@ -459,9 +509,15 @@ if 'initialized' not in st.session_state:
     st.session_state.current_question = ""  # gathered from user
     st.session_state.status_messages = []  # messages from the agent
     st.session_state.current_values = {}  # current values of the agent 
-    st.session_state.values_history = []  # history of values
+    st.session_state.values_history = ValuesHistory()  # history of values, stored as deltas
     st.session_state.values_history_description = []  # description of the values
     st.session_state.current_values_idx = None
+    st.session_state.partial_answer = ""  # answer tokens streamed so far
+    st.session_state.session_log = None  # log of the session being run
+    st.session_state.session_path = None  # log file of the current session
+    st.session_state.thread_id = None  # checkpointer thread of the current session
+    st.session_state.cancel_token = None  # cancels the run in progress
+    st.session_state.sessions_page = 0  # page of the saved sessions list
     st.session_state.debug_message = "-"
 
     # Processing status
@@ -478,6 +534,7 @@ if 'initialized' not in st.session_state:
     st.session_state.kb_container = None
     st.session_state.answer_container = None
     st.session_state.scored_checklist_container = None
+    st.session_state.metrics_container = None
     st.session_state.debug_container = None
     st.session_state.values_history_container = None
     st.session_state.workflow_container = None
@@ -491,6 +548,7 @@ if 'initialized' not in st.session_state:
     st.session_state.kb_model = OpenAIModel.GPT4O.value["name"]
     st.session_state.max_iterations = 3
     st.session_state.score_threshold = 0.9
+    st.session_state.max_parallel_queries = MAX_PARALLEL_QUERIES
 
 ### START OF OUTPUT ###
 
@@ -693,6 +751,14 @@ with st.sidebar:
         step=0.05
     )
 
+    st.session_state.max_parallel_queries = st.slider(
+        "Parallel Queries per Iteration",
+        min_value=1,
+        max_value=5,
+        value=st.session_state.max_parallel_queries,
+        step=1
+    )
+
     # Session Management
     st.markdown("---")
     st.subheader("Session Management")
@@ -703,19 +769,24 @@ with st.sidebar:
             filename = save_session()
             st.success(f"Session saved to {filename}")
     
-    # List and load saved sessions
+    # List and load saved sessions, one page of the index at a time
     st.subheader("Saved Sessions")
-    sessions_dir = "sessions"
-    if os.path.exists(sessions_dir):
-        session_files = sorted([f for f in os.listdir(sessions_dir) if f.endswith(".json")], reverse=True)
-        for session_file in session_files:
+    sessions_dir = SESSIONS_DIR
+    session_index = get_session_index()
+    if st.button("Rescan Sessions"):
+        session_index.rescan()
+    session_count = session_index.count()
+    page_count = max(1, math.ceil(session_count / SESSIONS_PAGE_SIZE))
+    st.session_state.sessions_page = min(st.session_state.sessions_page, page_count - 1)
+    if session_count:
+        for session in session_index.page(st.session_state.sessions_page * SESSIONS_PAGE_SIZE, SESSIONS_PAGE_SIZE):
+            session_file = session["filename"]
             with st.expander(session_file):
+                st.caption(session["question"])
+                score = "-" if session["final_score"] is None else f"{session['final_score']:.2f}"
+                st.caption(f"Iterations: {session['iterations']} | Score: {score} | Size: {session['byte_size'] / 1024:.0f} KB")
                 col1, col2 = st.columns([3, 1])
                 with col1:
-                    # if st.button("Load Session", key=f"load_{session_file}"):
-                    #     if load_session(os.path.join(sessions_dir, session_file)):
-                    #         st.success("Session loaded successfully")
-                    #         st.rerun()
                     if st.button("Load Session", key=f"load_{session_file}", on_click=lambda session_file=session_file: load_session(os.path.join(sessions_dir, session_file))):
                         st.success("Session loaded successfully")
                         st.rerun()
@@ -724,6 +795,18 @@ with st.sidebar:
                         if delete_session(os.path.join(sessions_dir, session_file)):
                             st.success("Session deleted successfully")
                             st.rerun()
+        if page_count > 1:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("<", key="sessions_prev", disabled=st.session_state.sessions_page == 0):
+                    st.session_state.sessions_page -= 1
+                    st.rerun()
+            with col2:
+                st.caption(f"Page {st.session_state.sessions_page + 1} of {page_count}")
+            with col3:
+                if st.button(">", key="sessions_next", disabled=st.session_state.sessions_page >= page_count - 1):
+                    st.session_state.sessions_page += 1
+                    st.rerun()
     else:
         st.info("No saved sessions found")
 
@@ -766,7 +849,7 @@ with right_col:
     output_workflow_visualization()
     
     # Create tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["Search", "Knowledge Base", "Answer", "Scorecard"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Search", "Knowledge Base", "Answer", "Scorecard", "Metrics"])
     
     # Search tab
     with tab1:
@@ -799,6 +882,10 @@ with right_col:
     # Scorecard tab
     with tab4:
         st.session_state.scored_checklist_container = st.empty()
+    
+    # Metrics tab
+    with tab5:
+        st.session_state.metrics_container = st.empty()
 
 st.header("Debug")
 st.markdown("---")
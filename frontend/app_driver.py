@@ -11,6 +11,9 @@ sys.path.insert(0, project_root)
 import streamlit as st
 from backend.agents.rave_agent import search2, get_best_urls_from_search, scrape_urls
 from backend.agents.utils.prompts import URLWithScore
+from backend.agents.utils.page_cache import get_page_cache
+from backend.agents.utils.scraper import cache_latency_report
+from backend.config.settings import CACHE_DIR
 from backend.config.models import OpenAIModel, get_model_config
 import time
 import copy
@@ -77,6 +80,12 @@ def scrape_urls_from_best_urls():
     st.session_state.state_container.write("scraped urls")
     st.session_state.state["scraped_content"] = res["scraped_content"]
 
+def page_cache_report():
+    st.session_state.search_status_container.write("measuring page cache...")
+    urls = [url_obj.url for url_obj in st.session_state.state["urls_to_scrape"]]
+    report = cache_latency_report(urls, os.path.join(CACHE_DIR, "latency_report.sqlite"))
+    st.session_state.state_container.write(report)
+
 left_col, right_col = st.columns([1,4])
 
 def next_url():
@@ -89,6 +98,8 @@ with left_col:
     st.text_input("question", on_change=search, key="query")
     st.button("get best urls", on_click=get_best_urls)
     st.button("scrape urls", on_click=scrape_urls_from_best_urls)  
+    st.button("page cache report", on_click=page_cache_report)
+    st.write("page cache", get_page_cache().stats)
     st.write("STATUS")
     st.session_state.search_status_container = st.empty()
     prev_col, next_col = st.columns([1,1])    
@@ -0,0 +1,159 @@
+"""Index of the saved sessions.
+
+The sidebar used to list the sessions directory and read nothing else, but
+showing anything about a session meant opening its file. The index keeps a
+one-row summary per session file (timestamp, question, iteration count,
+final score and byte size) in a SQLite table next to the sessions, so the
+browser renders a page of sessions from the index alone and only opens a
+file when a session is loaded. Rows are kept in step with the directory by
+comparing file sizes and modification times.
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from frontend.session_log import SESSIONS_DIR, load_any_session
+
+SESSION_INDEX_PATH = os.path.join(SESSIONS_DIR, "index.sqlite")
+SESSION_EXTENSIONS = (".json", ".jsonl")
+
+COLUMNS = ("filename", "timestamp", "question", "iterations", "final_score", "byte_size", "mtime")
+
+
+def summarize_session(path: str) -> Dict[str, Any]:
+    """Read the summary of a session file for the index"""
+    session = load_any_session(path)
+    history = session["values_history"]
+    final_values = history[-1] if len(history) else {}
+
+    iterations = final_values.get("iteration")
+    if iterations is None:
+        iterations = len(final_values.get("query_history", []))
+
+    scores = [item["current_score"] if isinstance(item, dict) else item.current_score
+              for item in final_values.get("scored_checklist", [])]
+    stat = os.stat(path)
+    return {
+        "filename": os.path.basename(path),
+        "timestamp": session.get("timestamp") or "",
+        "question": session.get("question", ""),
+        "iterations": iterations,
+        "final_score": sum(scores) / len(scores) if scores else None,
+        "byte_size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
+class SessionIndex:
+    """SQLite table with one summary row per saved session"""
+
+    def __init__(self, path: str = SESSION_INDEX_PATH, directory: str = SESSIONS_DIR):
+        self.path = path
+        self.directory = directory
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self.created = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+        ).fetchone() is None
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                filename TEXT PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                question TEXT NOT NULL,
+                iterations INTEGER,
+                final_score REAL,
+                byte_size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (timestamp)")
+        self._conn.commit()
+
+    def add(self, path: str):
+        """Index a session file, replacing its previous summary"""
+        summary = summarize_session(path)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO sessions VALUES ({', '.join('?' for _ in COLUMNS)})",
+                tuple(summary[column] for column in COLUMNS)
+            )
+            self._conn.commit()
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE filename = ?", (os.path.basename(filename),))
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Summaries of a page of sessions, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sessions ORDER BY timestamp DESC, filename DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def rescan(self) -> Dict[str, int]:
+        """Bring the index in line with the sessions directory.
+
+        Only files that are new or whose size or modification time changed
+        are read again.
+
+        Returns:
+            Number of sessions added, updated and removed
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            indexed = {
+                filename: (byte_size, mtime)
+                for filename, byte_size, mtime in self._conn.execute("SELECT filename, byte_size, mtime FROM sessions")
+            }
+
+        on_disk = set()
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(SESSION_EXTENSIONS):
+                    continue
+                on_disk.add(filename)
+                path = os.path.join(self.directory, filename)
+                stat = os.stat(path)
+                if indexed.get(filename) == (stat.st_size, stat.st_mtime):
+                    continue
+                try:
+                    self.add(path)
+                except Exception as e:
+                    print(f"Error indexing session {filename}: {str(e)}")
+                    continue
+                stats["updated" if filename in indexed else "added"] += 1
+
+        for filename in set(indexed) - on_disk:
+            self.remove(filename)
+            stats["removed"] += 1
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_session_index: Optional[SessionIndex] = None
+_session_index_lock = threading.Lock()
+
+
+def get_session_index() -> SessionIndex:
+    """Get the process-wide session index, building it on first use"""
+    global _session_index
+    with _session_index_lock:
+        if _session_index is None:
+            _session_index = SessionIndex()
+            if _session_index.created:
+                _session_index.rescan()
+        return _session_index
@@ -0,0 +1,383 @@
+"""Append-only session logs.
+
+A session used to be saved by deep-copying every values snapshot and
+rewriting the whole history as one JSON document, so each save grew with
+state size times steps. A session log is a JSONL file that is written as
+the graph runs:
+
+    {"type": "header", "timestamp": ..., "question": ..., "model_settings": {...}, "thread_id": ...}
+    {"type": "status", "message": "..."}
+    {"type": "step", "description": "...", "set": {...}, "unset": [...]}
+    {"type": "checkpoint", "values": {...}}
+    {"type": "final", "current_values_idx": ..., "processing_status": ..., ...}
+
+The thread id names the session's checkpoints in the graph's checkpointer.
+Each step only carries the state keys that changed since the previous step.
+Compaction rewrites a log with its status messages batched into one record,
+the last state in full as a checkpoint, a single final record and no lines
+cut short by a crash. load_session_log rebuilds the history by applying the
+deltas in one pass, sharing unchanged values between snapshots rather than
+copying them. open_session_log only indexes the steps, so the browser can
+open a session without reading its scraped pages until a step is shown.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from pydantic import BaseModel
+
+from backend.agents.utils.prompts import KnowledgeNugget, URLWithScore
+
+SESSIONS_DIR = "sessions"
+
+# How state fields holding objects are rebuilt from JSON
+FIELD_DECODERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "knowledge_base": KnowledgeNugget.model_validate,
+    "urls_to_scrape": URLWithScore.model_validate,
+    "scraped_content": lambda doc: Document(page_content=doc["page_content"], metadata=doc.get("metadata", {})),
+}
+
+
+def to_jsonable(value: Any) -> Any:
+    """Convert state values (nuggets, documents, messages) into plain JSON values"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, Document):
+        return {"page_content": value.page_content, "metadata": value.metadata}
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
+def decode_field(key: str, value: Any) -> Any:
+    """Rebuild the objects of a state field from its JSON form"""
+    decoder = FIELD_DECODERS.get(key)
+    if decoder is None or not isinstance(value, list):
+        return value
+    return [decoder(item) if isinstance(item, dict) else item for item in value]
+
+
+def encode_json(record: Dict[str, Any]) -> str:
+    return json.dumps(record, default=str)
+
+
+class SessionLog:
+    """Writer for the log of one session"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # The previous step, kept by reference and as JSON, to compute deltas
+        self._last_values: Dict[str, Any] = {}
+        self._last_json: Dict[str, str] = {}
+
+    @classmethod
+    def create(cls, question: str, model_settings: Dict[str, Any], directory: str = SESSIONS_DIR) -> "SessionLog":
+        """Start the log of a new session"""
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        path = os.path.join(directory, f"session_{timestamp}.jsonl")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(directory, f"session_{timestamp}_{suffix}.jsonl")
+            suffix += 1
+        log = cls(path)
+        log._write({
+            "type": "header",
+            "timestamp": timestamp,
+            "question": question,
+            "model_settings": model_settings,
+            "thread_id": log.thread_id,
+        })
+        return log
+
+    @classmethod
+    def reopen(cls, path: str, last_values: Dict[str, Any]) -> "SessionLog":
+        """Continue the log of a session whose last step was last_values"""
+        log = cls(path)
+        log._last_values = dict(last_values)
+        log._last_json = {key: encode_json(to_jsonable(value)) for key, value in last_values.items()}
+        return log
+
+    @property
+    def thread_id(self) -> str:
+        """Checkpointer thread of the session, named after its log file"""
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def _write(self, record: Dict[str, Any]):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(encode_json(record) + "\n")
+
+    def append_status(self, message: str):
+        self._write({"type": "status", "message": message})
+
+    def append_step(self, values: Dict[str, Any], description: str):
+        """Append the keys of a values snapshot that changed since the last step"""
+        changed, changed_json = {}, {}
+        for key, value in values.items():
+            # Values LangGraph did not touch are usually the very same object
+            if key in self._last_values and self._last_values[key] is value:
+                continue
+            encoded = to_jsonable(value)
+            as_json = encode_json(encoded)
+            if self._last_json.get(key) != as_json:
+                changed[key] = encoded
+                changed_json[key] = as_json
+        unset = [key for key in self._last_values if key not in values]
+
+        self._write({"type": "step", "description": description, "set": changed, "unset": unset})
+        self._last_values = dict(values)
+        self._last_json.update(changed_json)
+        for key in unset:
+            self._last_json.pop(key, None)
+
+    def finish(self, current_values_idx: Optional[int], processing_status: str, processing_status_message: str):
+        self._write({
+            "type": "final",
+            "current_values_idx": current_values_idx,
+            "processing_status": processing_status,
+            "processing_status_message": processing_status_message,
+        })
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """Read the records of a log, ignoring a line cut short by a crash"""
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def load_session_log(path: str) -> Dict[str, Any]:
+    """Rebuild a session from its log.
+
+    Returns:
+        The same fields a legacy session file held: timestamp, question,
+        model_settings, status_messages, values_history,
+        values_history_description, current_values_idx, processing_status
+        and processing_status_message
+    """
+    session = {
+        "status_messages": [],
+        "values_history": [],
+        "values_history_description": [],
+        "current_values_idx": None,
+        "processing_status": None,
+        "processing_status_message": "",
+        "model_settings": {},
+    }
+    current: Dict[str, Any] = {}
+    for record in read_records(path):
+        kind = record.get("type")
+        if kind == "header":
+            session.update(
+                timestamp=record["timestamp"],
+                question=record["question"],
+                model_settings=record["model_settings"],
+                thread_id=record.get("thread_id"),
+            )
+        elif kind == "status":
+            session["status_messages"].extend(record["messages"] if "messages" in record else [record["message"]])
+        elif kind == "step":
+            # A new dict per step; unchanged values are shared with the previous step
+            current = {key: value for key, value in current.items() if key not in record["unset"]}
+            current.update({key: decode_field(key, value) for key, value in record["set"].items()})
+            session["values_history"].append(current)
+            session["values_history_description"].append(record["description"])
+        elif kind == "final":
+            session.update({key: value for key, value in record.items() if key != "type"})
+
+    if session["current_values_idx"] is None and session["values_history"]:
+        session["current_values_idx"] = len(session["values_history"]) - 1
+    return session
+
+
+def write_session_log(path: str, session: Dict[str, Any]):
+    """Write a whole session as a compact log, replacing the file atomically"""
+    temp_path = f"{path}.tmp"
+    log = SessionLog(temp_path)
+    try:
+        with open(temp_path, "w") as f:
+            f.write(encode_json({
+                "type": "header",
+                "timestamp": session.get("timestamp") or datetime.now().strftime("%Y-%m-%d_%H%M%S"),
+                "question": session.get("question", ""),
+                "model_settings": session.get("model_settings", {}),
+                "thread_id": session.get("thread_id"),
+            }) + "\n")
+            if session.get("status_messages"):
+                f.write(encode_json({"type": "status", "messages": session["status_messages"]}) + "\n")
+        values = None
+        for values, description in zip(session["values_history"], session["values_history_description"]):
+            log.append_step(values, description)
+        if values is not None:
+            # The last state in full, so opening the session needs no deltas
+            log._write({"type": "checkpoint", "values": to_jsonable(values)})
+        log.finish(session.get("current_values_idx"), session.get("processing_status"), session.get("processing_status_message", ""))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def compact_session_log(path: str):
+    """Rewrite a log in its compact form"""
+    write_session_log(path, load_session_log(path))
+
+
+STEP_PREFIX = '{"type": "step", "description": '
+CHECKPOINT_PREFIX = '{"type": "checkpoint"'
+
+
+class LazySessionHistory:
+    """The values history of a session log, read from disk as steps are opened.
+
+    Opening a session only scans the log for step offsets and descriptions.
+    The deltas are parsed up to the step that is opened, and nuggets and
+    documents are only rebuilt for the snapshot that is returned.
+    """
+
+    def __init__(self, path: str, step_offsets: List[int], checkpoint_offset: Optional[int] = None):
+        self.path = path
+        self._offsets = step_offsets
+        self._checkpoint_offset = checkpoint_offset
+        self._deltas: List[Dict[str, Any]] = []
+        self._cached: Optional[Tuple[int, Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _read(self, offset: int) -> Dict[str, Any]:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def _parse_deltas(self, index: int):
+        """Parse the step records up to and including index"""
+        if len(self._deltas) > index:
+            return
+        with open(self.path, "rb") as f:
+            for offset in self._offsets[len(self._deltas):index + 1]:
+                f.seek(offset)
+                record = json.loads(f.readline())
+                self._deltas.append({"set": record["set"], "unset": record["unset"]})
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index < len(self._offsets):
+            raise IndexError("values history index out of range")
+        if self._cached and self._cached[0] == index:
+            return dict(self._cached[1])
+
+        if index == len(self._offsets) - 1 and self._checkpoint_offset is not None:
+            raw = self._read(self._checkpoint_offset)["values"]
+        else:
+            self._parse_deltas(index)
+            raw = {}
+            for delta in self._deltas[:index + 1]:
+                for key in delta["unset"]:
+                    raw.pop(key, None)
+                raw.update(delta["set"])
+
+        values = {key: decode_field(key, value) for key, value in raw.items()}
+        self._cached = (index, values)
+        return dict(values)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self._parse_deltas(len(self._offsets) - 1)
+        values: Dict[str, Any] = {}
+        for delta in self._deltas:
+            values = {key: value for key, value in values.items() if key not in delta["unset"]}
+            values.update({key: decode_field(key, value) for key, value in delta["set"].items()})
+            yield dict(values)
+
+
+def open_session_log(path: str) -> Dict[str, Any]:
+    """Open a session log without parsing its steps.
+
+    Returns:
+        The fields of load_session_log, with values_history as a
+        LazySessionHistory
+    """
+    session = {
+        "status_messages": [],
+        "values_history_description": [],
+        "current_values_idx": None,
+        "processing_status": None,
+        "processing_status_message": "",
+        "model_settings": {},
+    }
+    step_offsets, checkpoint_offset = [], None
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        offset = 0
+        for raw_line in f:
+            line = raw_line.decode("utf-8")
+            if line.startswith(STEP_PREFIX):
+                try:
+                    description, _ = decoder.raw_decode(line, len(STEP_PREFIX))
+                except json.JSONDecodeError:
+                    break
+                # Only steps written in full count; a torn last line is ignored
+                if line.endswith("\n"):
+                    step_offsets.append(offset)
+                    session["values_history_description"].append(description)
+            elif line.startswith(CHECKPOINT_PREFIX):
+                checkpoint_offset = offset
+            else:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = {}
+                kind = record.get("type")
+                if kind == "header":
+                    session.update(
+                        timestamp=record["timestamp"],
+                        question=record["question"],
+                        model_settings=record["model_settings"],
+                        thread_id=record.get("thread_id"),
+                    )
+                elif kind == "status":
+                    session["status_messages"].extend(record["messages"] if "messages" in record else [record["message"]])
+                elif kind == "final":
+                    session.update({key: value for key, value in record.items() if key != "type"})
+            offset += len(raw_line)
+
+    # A checkpoint is only valid if no step was logged after it
+    if checkpoint_offset is not None and step_offsets and checkpoint_offset < step_offsets[-1]:
+        checkpoint_offset = None
+    session["values_history"] = LazySessionHistory(path, step_offsets, checkpoint_offset)
+    if session["current_values_idx"] is None and step_offsets:
+        session["current_values_idx"] = len(step_offsets) - 1
+    return session
+
+
+def load_legacy_session(path: str) -> Dict[str, Any]:
+    """Read a session saved as a single JSON document"""
+    with open(path) as f:
+        session = json.load(f)
+    session["values_history"] = [
+        {key: decode_field(key, value) for key, value in values.items()}
+        for values in session["values_history"]
+    ]
+    return session
+
+
+def load_any_session(path: str) -> Dict[str, Any]:
+    """Open a session log lazily, or load a legacy JSON session"""
+    if path.endswith(".jsonl"):
+        return open_session_log(path)
+    return load_legacy_session(path)
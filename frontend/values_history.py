@@ -0,0 +1,90 @@
+"""History of graph state snapshots stored as deltas.
+
+update_values used to deep-copy every values event, so a session held a full
+copy of the scraped documents, search results and knowledge base for every
+step. ValuesHistory keeps only the keys that changed at each step. Unchanged
+values are shared by reference, which is safe because nodes return new
+objects instead of mutating the state. Any step is rebuilt on demand from the
+nearest checkpoint, so memory grows with what changed rather than with state
+size times steps.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Every this many steps the full mapping of keys to values is kept, so that
+# rebuilding a step never replays more than this many deltas
+CHECKPOINT_INTERVAL = 16
+
+Delta = Tuple[Dict[str, Any], Tuple[str, ...]]
+
+_MISSING = object()
+
+
+class ValuesHistory:
+    """A list-like sequence of state snapshots, stored as per-key deltas"""
+
+    def __init__(self):
+        self._deltas: List[Delta] = []
+        self._checkpoints: Dict[int, Dict[str, Any]] = {}
+        self._last: Dict[str, Any] = {}
+
+    @classmethod
+    def from_snapshots(cls, snapshots: Iterable[Dict[str, Any]]) -> "ValuesHistory":
+        history = cls()
+        for values in snapshots:
+            history.append(values)
+        return history
+
+    def append(self, values: Dict[str, Any]):
+        """Record a snapshot, keeping only the values that changed"""
+        changed = {}
+        current = {}
+        for key, value in values.items():
+            previous = self._last.get(key, _MISSING)
+            if previous is value:
+                current[key] = previous
+            elif previous is not _MISSING and _equal(previous, value):
+                # Keep the object we already hold and let the equal copy go
+                current[key] = previous
+            else:
+                changed[key] = current[key] = value
+        unset = tuple(key for key in self._last if key not in values)
+
+        index = len(self._deltas)
+        self._deltas.append((changed, unset))
+        if index % CHECKPOINT_INTERVAL == 0:
+            self._checkpoints[index] = current
+        self._last = current
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """Rebuild the snapshot of a step"""
+        if index < 0:
+            index += len(self._deltas)
+        if not 0 <= index < len(self._deltas):
+            raise IndexError("values history index out of range")
+        if index == len(self._deltas) - 1:
+            return dict(self._last)
+
+        start = index - index % CHECKPOINT_INTERVAL
+        values = dict(self._checkpoints[start])
+        for changed, unset in self._deltas[start + 1:index + 1]:
+            for key in unset:
+                values.pop(key, None)
+            values.update(changed)
+        return values
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        values: Dict[str, Any] = {}
+        for changed, unset in self._deltas:
+            values = {key: value for key, value in values.items() if key not in unset}
+            values.update(changed)
+            yield dict(values)
+
+
+def _equal(a: Any, b: Any) -> bool:
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
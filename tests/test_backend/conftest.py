@@ -0,0 +1,190 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+
+def make_pdf(text):
+    """A one-page PDF showing text"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves canned pages; /slow/* sleeps, /flaky fails the first request, /doc.pdf is a PDF, /data.json is neither"""
+    hits = {}
+    etag = '"v1"'
+
+    def do_GET(self):
+        PageHandler.hits[self.path] = PageHandler.hits.get(self.path, 0) + 1
+        if self.path.startswith("/slow"):
+            time.sleep(0.5)
+        if self.path == "/flaky" and PageHandler.hits[self.path] == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == "/hang":
+            time.sleep(3)
+        if self.path == "/doc.pdf":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.end_headers()
+            self.wfile.write(make_pdf("Paris has about two million inhabitants."))
+            return
+        if self.path == "/data.json":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"content": "not a page"}')
+            return
+        if self.headers.get("If-None-Match") == PageHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = f"<html lang='en'><head><title>{self.path}</title></head><body><p>Content of {self.path}</p></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", PageHandler.etag)
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    PageHandler.hits = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def page_hits(server):
+    """Requests received by the page server, keyed by path"""
+    return PageHandler.hits
+
+
+# Canned model output for every node that calls an LLM
+FAKE_RESPONSES = {
+    "question_model": "What is the capital of France and how large is it?",
+    "checklist_model": '{"items": [{"item_to_score": "Names the capital", "current_score": 0.0}, {"item_to_score": "Gives the population", "current_score": 0.0}]}',
+    "query_model": "capital of France population",
+    "url_model": '{"urls": [{"url": "URL/page/paris", "score": 90}, {"url": "URL/page/capitals", "score": 60}]}',
+    "kb_model": '{"new_nuggets": [{"content": "Paris is the capital of France.", "source_url": "URL/page/paris", "confidence": 0.9}]}',
+    "answer_model": "# Paris\n\nParis is the capital of France.",
+    "scoring_model": '{"items": [{"item_to_score": "Names the capital", "current_score": 1.0}, {"item_to_score": "Gives the population", "current_score": 1.0}]}',
+}
+
+
+class FakeGoogleSearch:
+    """Stands in for serpapi.GoogleSearch, returning organic results on the page server"""
+    base_url = ""
+    calls = 0
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        FakeGoogleSearch.calls += 1
+        return {
+            "organic_results": [
+                {"title": "Paris", "link": f"{self.base_url}/page/paris", "snippet": "Paris is the capital of France."},
+                {"title": "Capitals", "link": f"{self.base_url}/page/capitals", "snippet": "The capital of France has been Paris since 1944."},
+            ]
+        }
+
+
+@pytest.fixture
+def fake_responses():
+    """Per-node fake LLM output; tests may replace entries with a list of responses"""
+    return dict(FAKE_RESPONSES)
+
+
+@pytest.fixture
+def fake_search(server):
+    """The fake SerpAPI client, with its call counter reset"""
+    FakeGoogleSearch.base_url = server
+    FakeGoogleSearch.calls = 0
+    return FakeGoogleSearch
+
+
+@pytest.fixture
+def offline_agent(monkeypatch, server, tmp_path, fake_responses, fake_search):
+    """The rave_agent module with fake LLMs, fake SerpAPI and throwaway caches"""
+    from langchain_core.language_models import FakeListChatModel
+    from backend.agents import rave_agent
+    from backend.agents.utils.page_cache import PageCache
+    from backend.agents.utils.search_cache import SearchCache
+    from backend.agents.utils.kb_index import LocalEmbeddings
+
+    # One model per node so a list of responses is played back in order
+    models = {}
+
+    def fake_get_model(node_name, config, writer=None):
+        if node_name not in models:
+            responses = fake_responses[node_name]
+            if isinstance(responses, str):
+                responses = [responses]
+            models[node_name] = FakeListChatModel(responses=[r.replace("URL", server) for r in responses])
+        return models[node_name]
+
+    page_cache = PageCache(path=str(tmp_path / "pages.sqlite"))
+    search_cache = SearchCache(path=str(tmp_path / "searches.sqlite"))
+    monkeypatch.setattr(rave_agent, "getModel", fake_get_model)
+    monkeypatch.setattr(rave_agent, "GoogleSearch", fake_search)
+    monkeypatch.setattr(rave_agent, "get_page_cache", lambda: page_cache)
+    monkeypatch.setattr(rave_agent, "get_search_cache", lambda: search_cache)
+    monkeypatch.setattr(rave_agent, "get_embeddings", LocalEmbeddings)
+    return rave_agent
+
+
+@pytest.fixture
+def run_config():
+    return {
+        "configurable": {
+            "max_iterations": 2,
+            "score_threshold": 0.9
+        }
+    }
+
+
+@pytest.fixture
+def initial_state():
+    return {
+        "messages": [],
+        "question": "What is the capital of France?",
+        "improved_question": "",
+        "scored_checklist": [],
+        "current_query": None,
+        "query_history": [],
+        "search_results": [],
+        "urls_to_scrape": [],
+        "scraped_content": [],
+        "knowledge_base": [],
+        "answer": None,
+    }
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from backend.agents import batch
+from backend.agents.batch import read_questions, run_batch, unknown_fields
+
+
+def read_results(path):
+    with open(path) as f:
+        return {record["id"]: record for record in map(json.loads, f)}
+
+
+def test_batch_writes_a_result_per_question(offline_agent, tmp_path):
+    questions_path = tmp_path / "questions.jsonl"
+    questions_path.write_text(
+        '{"id": "france", "question": "What is the capital of France?"}\n'
+        '"How large is Paris?"\n'
+        '{"id": "broken", "question": "What is the capital of Spain?", "max_iterations": null}\n'
+    )
+    output_path = str(tmp_path / "results.jsonl")
+    questions = read_questions(str(questions_path))
+
+    counts = asyncio.run(run_batch(questions, output_path, concurrency=2, settings={"max_iterations": 2}))
+
+    assert counts == {"completed": 2, "error": 1, "cancelled": 0, "skipped": 0}
+    results = read_results(output_path)
+    assert results["france"]["answer"].startswith("# Paris")
+    assert results["france"]["final_score"] == 1.0
+    assert results["france"]["knowledge_base"][0]["content"] == "Paris is the capital of France."
+    assert results["france"]["metrics"]["total"]["llm_calls"] > 0
+    assert results["2"]["question"] == "How large is Paris?"
+    assert results["broken"]["status"] == "error"
+
+
+def test_resumed_batch_only_runs_missing_questions(offline_agent, tmp_path):
+    output_path = str(tmp_path / "results.jsonl")
+    questions = [{"id": "a", "question": "What is the capital of France?"}]
+    asyncio.run(run_batch(questions, output_path))
+
+    questions.append({"id": "b", "question": "How large is Paris?"})
+    counts = asyncio.run(run_batch(questions, output_path, resume=True))
+
+    assert counts["skipped"] == 1
+    assert counts["completed"] == 1
+    assert set(read_results(output_path)) == {"a", "b"}
+
+
+def test_resume_counts_only_questions_of_this_batch_and_retries_errors(offline_agent, tmp_path):
+    output_path = str(tmp_path / "results.jsonl")
+    questions = [
+        {"id": "a", "question": "What is the capital of France?"},
+        {"id": "b", "question": "How large is Paris?"},
+        {"id": "broken", "question": "What is the capital of Spain?", "max_iterations": None},
+    ]
+    asyncio.run(run_batch(questions, output_path))
+
+    # "b" is in the output but not in this batch; "broken" failed and runs again
+    retry = [questions[0], {"id": "broken", "question": "What is the capital of Spain?"}]
+    counts = asyncio.run(run_batch(retry, output_path, resume=True))
+
+    assert counts == {"completed": 1, "error": 0, "cancelled": 0, "skipped": 1}
+    assert read_results(output_path)["broken"]["status"] == "completed"
+
+
+def test_only_run_settings_reach_the_run_config(monkeypatch, tmp_path):
+    configs = []
+
+    class RecordingGraph:
+        async def ainvoke(self, state, config):
+            configs.append(config["configurable"])
+            return {}
+
+    monkeypatch.setattr(batch, "async_graph", RecordingGraph())
+    questions = [{
+        "id": "a",
+        "question": "What is the capital of France?",
+        "answer_model": "o3-mini",
+        "max_parallel_queries": 2,
+        "expected_answer": "Paris",
+        "max_iteration": 5,
+    }]
+
+    asyncio.run(run_batch(questions, str(tmp_path / "results.jsonl")))
+
+    assert configs[0]["answer_model"] == "o3-mini" and configs[0]["max_parallel_queries"] == 2
+    assert not {"id", "question", "expected_answer", "max_iteration"} & set(configs[0])
+    assert unknown_fields(questions) == {"expected_answer": 1, "max_iteration": 1}
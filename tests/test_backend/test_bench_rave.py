@@ -0,0 +1,18 @@
+from backend.tests.bench_rave import percentile, run_benchmark
+
+
+def test_benchmark_replays_the_full_loop_offline():
+    report = run_benchmark(runs=2, warmup=0, page_size=2_000)
+
+    assert report["iterations"] == 2
+    assert report["latency"]["p50"] <= report["latency"]["p95"]
+    assert {"scrape_urls", "update_knowledge_base", "search2", "generate_query"} <= set(report["nodes"])
+    assert report["peak_memory_mb"] > 0
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 21))
+
+    assert percentile(values, 50) == 10
+    assert percentile(values, 95) == 19
+    assert percentile([3.0], 95) == 3.0
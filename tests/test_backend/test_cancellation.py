@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents.rave_agent import build_graph, NODES, LLMCall, acall_llm
+from backend.agents.utils.cancellation import CancellationToken, RunCancelled, cancellation_scope
+from backend.agents.utils.scraper import scrape_pages
+
+
+def test_cancelled_run_stops_before_the_next_node(offline_agent, monkeypatch, initial_state, run_config):
+    token = CancellationToken()
+    requested = []
+    fake_get_model = offline_agent.getModel
+
+    def get_model(node_name, config, writer=None):
+        requested.append(node_name)
+        if node_name == "kb_model":
+            token.cancel()
+        return fake_get_model(node_name, config, writer)
+
+    monkeypatch.setattr(offline_agent, "getModel", get_model)
+    config = {"configurable": {**run_config["configurable"], "cancel_token": token}}
+
+    with pytest.raises(RunCancelled):
+        build_graph(NODES).compile().invoke(dict(initial_state), config=config)
+
+    assert requested[-1] == "kb_model"
+    assert "answer_model" not in requested
+
+
+def test_cancelling_aborts_an_async_call_in_flight():
+    token = CancellationToken()
+    model = FakeListChatModel(responses=["a slow streamed answer"], sleep=0.5)
+    threading.Timer(0.1, token.cancel).start()
+
+    async def call():
+        with cancellation_scope(token):
+            return await acall_llm(LLMCall(model, "question", on_token=lambda text: None))
+
+    start = time.monotonic()
+    with pytest.raises(RunCancelled):
+        asyncio.run(call())
+    assert time.monotonic() - start < 0.5
+
+
+def test_cancelling_stops_waiting_on_pages(server):
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel).start()
+
+    start = time.monotonic()
+    with pytest.raises(RunCancelled):
+        scrape_pages([f"{server}/slow/1", f"{server}/slow/2"], cancel_token=token)
+    assert time.monotonic() - start < 0.4
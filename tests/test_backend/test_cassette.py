@@ -0,0 +1,155 @@
+import asyncio
+import json
+import sys
+import time
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents.rave_agent import build_graph, NODES
+from backend.agents.utils.cassette import CassetteMiss, ReplayedError, cassette_fetch, use_cassette, wrap_model
+from backend.agents.utils.scraper import scrape_pages, fetch_document, is_retryable
+
+
+def record_and_replay(offline_agent, monkeypatch, tmp_path, initial_state, run_config):
+    """Run the graph once while recording, then again with every provider broken"""
+    cassette_path = str(tmp_path / "run.jsonl")
+    fake_get_model = offline_agent.getModel
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: wrap_model(fake_get_model(node_name, config, writer)))
+    graph = build_graph(NODES).compile()
+
+    with use_cassette(cassette_path, "record"):
+        recorded = graph.invoke(dict(initial_state), config=run_config)
+
+    class OfflineSearch:
+        def __init__(self, params):
+            pass
+
+        def get_dict(self):
+            raise ConnectionError("SerpAPI is not reachable")
+
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: wrap_model(FakeListChatModel(responses=["not recorded"])))
+    monkeypatch.setattr(offline_agent, "GoogleSearch", OfflineSearch)
+    with use_cassette(cassette_path, "replay"):
+        replayed = graph.invoke(dict(initial_state), config=run_config)
+
+    return cassette_path, recorded, replayed
+
+
+def test_full_graph_replays_without_providers(offline_agent, monkeypatch, tmp_path, page_hits, initial_state, run_config):
+    cassette_path, recorded, replayed = record_and_replay(offline_agent, monkeypatch, tmp_path, initial_state, run_config)
+
+    with open(cassette_path) as f:
+        kinds = [json.loads(line)["kind"] for line in f]
+    assert {"meta", "llm", "search", "page"} <= set(kinds)
+    assert page_hits["/page/paris"] == 1
+    assert replayed["answer"] == recorded["answer"]
+    assert replayed["knowledge_base"] == recorded["knowledge_base"]
+    assert [doc.page_content for doc in replayed["scraped_content"]] == [doc.page_content for doc in recorded["scraped_content"]]
+
+
+def test_replay_on_a_later_day_sees_the_recorded_date(offline_agent, fake_responses, monkeypatch, tmp_path, initial_state, run_config):
+    from datetime import datetime, timedelta
+
+    # A second iteration brings in the query generator prompt as well
+    low = '{"items": [{"item_to_score": "Names the capital", "current_score": 1.0}, {"item_to_score": "Gives the population", "current_score": 0.2}]}'
+    fake_responses["scoring_model"] = [low, fake_responses["scoring_model"]]
+    fake_responses["query_model"] = ["capital of France", "population of Paris"]
+
+    class NextMonth(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=30)
+
+    fake_get_model = offline_agent.getModel
+    graph = build_graph(NODES).compile()
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: wrap_model(fake_get_model(node_name, config, writer)))
+    with use_cassette(str(tmp_path / "run.jsonl"), "record"):
+        recorded = graph.invoke(dict(initial_state), config=run_config)
+
+    # Move the clock of every backend module that reads it
+    for name, module in list(sys.modules.items()):
+        if name.startswith("backend.") and getattr(module, "datetime", None) is datetime:
+            monkeypatch.setattr(module, "datetime", NextMonth)
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: wrap_model(FakeListChatModel(responses=["not recorded"])))
+    with use_cassette(str(tmp_path / "run.jsonl"), "replay") as replaying:
+        assert replaying.date == recorded_date(tmp_path / "run.jsonl")
+        replayed = graph.invoke(dict(initial_state), config=run_config)
+
+    assert replayed["query_history"] == ["capital of France", "population of Paris"]
+    assert replayed["answer"] == recorded["answer"]
+
+
+def recorded_date(path):
+    with open(path) as f:
+        return json.loads(f.readline())["date"]
+
+
+def test_model_calls_replay_in_every_call_style(tmp_path):
+    model = FakeListChatModel(responses=["Paris"])
+    with use_cassette(str(tmp_path / "llm.jsonl"), "record"):
+        assert wrap_model(model).invoke("Capital of France?").content == "Paris"
+
+    with use_cassette(str(tmp_path / "llm.jsonl"), "replay"):
+        replay_model = wrap_model(model)
+        assert replay_model.invoke("Capital of France?").content == "Paris"
+        assert asyncio.run(replay_model.ainvoke("Capital of France?")).content == "Paris"
+        assert "".join(chunk.content for chunk in replay_model.stream("Capital of France?")) == "Paris"
+        with pytest.raises(CassetteMiss):
+            replay_model.invoke("Capital of Spain?")
+
+
+def test_replayed_latency_follows_the_recording(server, tmp_path):
+    path = str(tmp_path / "pages.jsonl")
+    with use_cassette(path, "record"):
+        scrape_pages([f"{server}/slow/1"], fetch=cassette_fetch(fetch_document, is_retryable))
+
+    with use_cassette(path, "replay", latency_scale=1.0):
+        start = time.monotonic()
+        docs = scrape_pages([f"{server}/slow/1"], fetch=cassette_fetch(fetch_document, is_retryable))
+        elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.4
+    assert "Content of /slow/1" in docs[0].page_content
+
+
+class SlowFailingChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        time.sleep(0.3)
+        raise ConnectionError("provider unavailable")
+
+
+def test_async_replay_of_errors_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    model = SlowFailingChatModel(responses=["unused"])
+    with use_cassette(path, "record"):
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                wrap_model(model).invoke("Capital of France?")
+
+    async def replay_both():
+        replay_model = wrap_model(model)
+        return await asyncio.gather(*(replay_model.ainvoke("Capital of France?") for _ in range(2)), return_exceptions=True)
+
+    with use_cassette(path, "replay", latency_scale=1.0):
+        start = time.monotonic()
+        errors = asyncio.run(replay_both())
+        elapsed = time.monotonic() - start
+
+    assert all(isinstance(error, ReplayedError) for error in errors)
+    # The two recorded delays overlap instead of running back to back
+    assert 0.3 <= elapsed < 0.55
+
+
+def test_recorded_client_errors_are_not_retried_on_replay(server, page_hits, tmp_path):
+    path = str(tmp_path / "pages.jsonl")
+    with use_cassette(path, "record"):
+        scrape_pages([f"{server}/missing"], fetch=cassette_fetch(fetch_document, is_retryable))
+
+    messages = []
+    with use_cassette(path, "replay"):
+        docs = scrape_pages([f"{server}/missing"], writer=messages.append, fetch=cassette_fetch(fetch_document, is_retryable))
+
+    assert docs == []
+    assert page_hits["/missing"] == 1
+    assert "after 1 attempts" in messages[0]["msg"]
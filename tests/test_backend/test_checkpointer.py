@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from backend.agents.rave_agent import build_graph, NODES, ASYNC_NODES
+from backend.agents.utils.checkpointer import SqliteCheckpointSaver, thread_config
+
+
+def test_interrupted_run_resumes_from_the_failed_node(offline_agent, tmp_path, initial_state, run_config):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = thread_config("session-1", **run_config["configurable"])
+
+    def crash(state, writer):
+        raise RuntimeError("process died")
+
+    crashing = build_graph(dict(NODES, generate_answer=crash)).compile(checkpointer=SqliteCheckpointSaver(path))
+    with pytest.raises(RuntimeError):
+        crashing.invoke(dict(initial_state), config=config)
+
+    # A new saver on the same file, as after a restart
+    graph = build_graph(NODES).compile(checkpointer=SqliteCheckpointSaver(path))
+    assert graph.get_state(config).next == ("generate_answer",)
+
+    resumed_nodes = []
+    for update in graph.stream(None, config=config, stream_mode="updates"):
+        resumed_nodes.extend(update)
+
+    assert resumed_nodes[0] == "generate_answer"
+    assert "improve_question" not in resumed_nodes
+    assert "scrape_urls" not in resumed_nodes
+    final_state = graph.get_state(config)
+    assert final_state.next == ()
+    assert final_state.values["answer"].startswith("# Paris")
+
+
+def test_async_graph_checkpoints_and_threads_are_separate(offline_agent, tmp_path, initial_state, run_config):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    graph = build_graph(ASYNC_NODES).compile(checkpointer=saver)
+    config = thread_config("session-1", **run_config["configurable"])
+
+    asyncio.run(graph.ainvoke(dict(initial_state), config=config))
+
+    assert saver.get_tuple(config).checkpoint["channel_values"]["answer"].startswith("# Paris")
+    assert len(list(saver.list(config, limit=3))) == 3
+    assert saver.get_tuple(thread_config("session-2")) is None
+
+    saver.delete_thread("session-1")
+    assert saver.get_tuple(config) is None
+
+
+def test_public_graph_needs_no_thread_id_and_saver_names_it(offline_agent, initial_state, run_config, tmp_path):
+    assert offline_agent.graph.invoke(dict(initial_state), config=run_config)["answer"]
+
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    with pytest.raises(ValueError, match="thread_id"):
+        build_graph(NODES).compile(checkpointer=saver).invoke(dict(initial_state), config=run_config)
+    with pytest.raises(ValueError, match="thread_id"):
+        saver.get_tuple(run_config)
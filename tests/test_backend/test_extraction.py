@@ -0,0 +1,61 @@
+from backend.agents.utils.extraction import extract_document, normalize_text
+from backend.agents.utils.scraper import scrape_pages
+
+ARTICLE = " ".join(
+    f"Paragraph {i} of the story explains, at some length, how the city grew along the river over the centuries."
+    for i in range(3)
+)
+
+PAGE = f"""<html lang="fr"><head><title>Paris</title><meta name="description" content="About Paris"></head>
+<body>
+  <nav><a href="/">Home</a> <a href="/news">News</a></nav>
+  <div class="cookie-banner">We use cookies to improve your experience.</div>
+  <div id="main-content" class="article-body">
+    <h1>The history of Paris</h1>
+    <p>{ARTICLE}</p>
+    <p>{ARTICLE.replace("Paragraph", "Section")}</p>
+    <p>Share</p><p>Share</p>
+  </div>
+  <div class="related-articles"><p>{"Read more about London, Rome, Berlin and Madrid in our travel guides. " * 3}</p></div>
+  <footer>Copyright 2024 Example News</footer>
+  <script>track("page");</script>
+</body></html>"""
+
+
+def test_keeps_the_main_content_only():
+    doc = extract_document("https://example.com/paris", PAGE.encode("utf-8"))
+
+    assert doc.page_content.startswith("The history of Paris")
+    assert "Paragraph 0 of the story" in doc.page_content and "Section 2 of the story" in doc.page_content
+    for boilerplate in ("Home", "cookies", "London", "Copyright", "track("):
+        assert boilerplate not in doc.page_content
+    assert doc.page_content.count("Share") == 1
+    assert doc.metadata == {
+        "source": "https://example.com/paris",
+        "raw_bytes": len(PAGE.encode("utf-8")),
+        "title": "Paris",
+        "description": "About Paris",
+        "language": "fr",
+    }
+    assert len(doc.page_content) < len(PAGE)
+
+
+def test_short_pages_keep_their_cleaned_body():
+    page = "<html><head><meta charset='iso-8859-1'></head><body><nav>Menu</nav><p>Caf\xe9 cr\xe8me</p></body></html>"
+
+    doc = extract_document("https://example.com/cafe", page.encode("iso-8859-1"))
+
+    assert doc.page_content == "Café crème"
+
+
+def test_normalize_text_collapses_whitespace_and_repeats():
+    assert normalize_text("  a  b \n\n A B\nc\t d  \n") == "a b\nc d"
+
+
+def test_non_html_responses_are_skipped_without_retry(server, page_hits):
+    messages = []
+    docs = scrape_pages([f"{server}/data.json", f"{server}/ok"], writer=messages.append)
+
+    assert [doc.metadata["source"] for doc in docs] == [f"{server}/ok"]
+    assert page_hits["/data.json"] == 1
+    assert any("non-HTML" in m["msg"] for m in messages)
@@ -0,0 +1,144 @@
+import asyncio
+
+from backend.agents.rave_agent import build_graph, NODES, ASYNC_NODES
+
+
+def test_sync_graph_runs_offline(offline_agent, initial_state, run_config):
+    graph = build_graph(NODES).compile()
+
+    final_state = graph.invoke(initial_state, config=run_config)
+
+    assert final_state["answer"].startswith("# Paris")
+    assert final_state["query_history"] == ["capital of France population"]
+    assert len(final_state["scraped_content"]) == 2
+    assert final_state["knowledge_base"][0].content == "Paris is the capital of France."
+    assert all(item["current_score"] == 1.0 for item in final_state["scored_checklist"])
+
+
+def test_async_graph_matches_sync_graph(offline_agent, initial_state, run_config):
+    sync_state = build_graph(NODES).compile().invoke(dict(initial_state), config=run_config)
+
+    async def run():
+        messages, values = [], None
+        async for mode, data in build_graph(ASYNC_NODES).compile().astream(
+            dict(initial_state), config=run_config, stream_mode=["values", "custom"]
+        ):
+            if mode == "custom" and "msg" in data:
+                messages.append(data["msg"])
+            else:
+                values = data
+        return messages, values
+
+    messages, async_state = asyncio.run(run())
+
+    assert async_state["answer"] == sync_state["answer"]
+    assert async_state["scored_checklist"] == sync_state["scored_checklist"]
+    assert "Scraped 2 of 2 URLs" in messages
+    assert messages[-1] == "All items meet or exceed threshold, stopping search"
+
+
+def test_async_graph_serves_sessions_concurrently(offline_agent, initial_state, run_config):
+    graph = build_graph(ASYNC_NODES).compile()
+
+    async def run_many():
+        return await asyncio.gather(*[
+            graph.ainvoke(dict(initial_state, question=f"Question {i}"), config=run_config)
+            for i in range(5)
+        ])
+
+    states = asyncio.run(run_many())
+
+    assert [state["question"] for state in states] == [f"Question {i}" for i in range(5)]
+    assert all(state["answer"] for state in states)
+
+
+def test_checklist_and_first_query_run_in_parallel(offline_agent, initial_state, run_config):
+    graph = build_graph(NODES).compile()
+
+    steps = {}
+    for event in graph.stream(initial_state, config=run_config, stream_mode="debug"):
+        if event["type"] == "task":
+            steps.setdefault(event["payload"]["name"], []).append(event["step"])
+
+    assert steps["generate_scored_checklist"] == steps["generate_initial_query"]
+    assert steps["search2"][0] == steps["generate_scored_checklist"][0] + 1
+    assert "generate_query" not in steps
+
+
+def test_later_iterations_loop_through_generate_query(offline_agent, fake_responses, initial_state, run_config):
+    low = '{"items": [{"item_to_score": "Names the capital", "current_score": 1.0}, {"item_to_score": "Gives the population", "current_score": 0.2}]}'
+    fake_responses["scoring_model"] = [low, fake_responses["scoring_model"]]
+    fake_responses["query_model"] = ["capital of France", "population of Paris"]
+    graph = build_graph(NODES).compile()
+
+    final_state = graph.invoke(initial_state, config=run_config)
+
+    assert final_state["query_history"] == ["capital of France", "population of Paris"]
+    assert all(item["current_score"] == 1.0 for item in final_state["scored_checklist"])
+
+
+def test_merge_search_results_dedupes_by_url_and_resets():
+    from backend.agents.rave_agent import merge_search_results
+
+    merged = merge_search_results(
+        [{"link": "https://a.example"}],
+        [{"link": "https://a.example"}, {"url": "https://b.example"}]
+    )
+
+    assert merged == [{"link": "https://a.example"}, {"url": "https://b.example"}]
+    assert merge_search_results(merged, None) == []
+
+
+def test_unmet_items_fan_out_to_parallel_searches(offline_agent, fake_responses, fake_search, initial_state, run_config):
+    low = '{"items": [{"item_to_score": "Names the capital", "current_score": 0.1}, {"item_to_score": "Gives the population", "current_score": 0.2}]}'
+    fake_responses["scoring_model"] = [low, fake_responses["scoring_model"]]
+    fake_responses["query_model"] = ["capital of France", '{"queries": ["capital city of France", "population of Paris"]}']
+    run_config["configurable"]["max_parallel_queries"] = 3
+    graph = build_graph(NODES).compile()
+
+    steps = {}
+    final_state = None
+    for mode, data in graph.stream(initial_state, config=run_config, stream_mode=["debug", "values"]):
+        if mode == "debug" and data["type"] == "task":
+            steps.setdefault(data["payload"]["name"], []).append(data["step"])
+        elif mode == "values":
+            final_state = data
+
+    assert final_state["query_history"] == ["capital of France", "capital city of France", "population of Paris"]
+    assert final_state["iteration"] == 2
+    # Both second-iteration searches ran in the same step
+    assert len(steps["search2"]) == 3 and steps["search2"][1] == steps["search2"][2]
+    assert fake_search.calls == 3
+    # Both searches returned the same two pages, merged into one list
+    assert len(final_state["search_results"]) == 2
+
+
+def test_answer_tokens_stream_on_custom_channel(offline_agent, initial_state, run_config):
+    graph = build_graph(NODES).compile()
+
+    tokens, final_state = [], None
+    for mode, data in graph.stream(initial_state, config=run_config, stream_mode=["custom", "values"]):
+        if mode == "custom" and "answer_token" in data:
+            tokens.append(data["answer_token"])
+        elif mode == "values":
+            final_state = data
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == final_state["answer"]
+
+
+def test_answer_tokens_stream_on_async_graph(offline_agent, initial_state, run_config):
+    async def run():
+        tokens = []
+        async for mode, data in build_graph(ASYNC_NODES).compile().astream(
+            initial_state, config=run_config, stream_mode=["custom", "values"]
+        ):
+            if mode == "custom" and "answer_token" in data:
+                tokens.append(data["answer_token"])
+            elif mode == "values":
+                final_state = data
+        return tokens, final_state
+
+    tokens, final_state = asyncio.run(run())
+
+    assert "".join(tokens) == final_state["answer"]
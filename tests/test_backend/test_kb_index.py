@@ -0,0 +1,109 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents.utils.kb_index import KnowledgeBaseIndex, LocalEmbeddings
+from backend.agents.utils.prompts import KnowledgeNugget
+
+
+def make_kb():
+    facts = [
+        "Paris is the capital of France.",
+        "The Eiffel Tower was completed in 1889.",
+        "Bananas are rich in potassium.",
+        "The Seine flows through Paris.",
+        "Photosynthesis converts light into chemical energy.",
+    ]
+    return [
+        KnowledgeNugget(content=fact, source_url=f"https://example.com/{i}", nugget_id=str(i))
+        for i, fact in enumerate(facts)
+    ]
+
+
+def test_top_k_ranks_relevant_nuggets_first():
+    index = KnowledgeBaseIndex(make_kb(), LocalEmbeddings())
+
+    top = index.top_k(["Eiffel Tower completed 1889"], k=2)
+
+    assert top[0].nugget_id == "1"
+    assert index.get("3").content == "The Seine flows through Paris."
+
+
+def test_nuggets_sharing_an_id_keep_their_own_scores():
+    kb = make_kb()
+    kb[3] = kb[3].model_copy(update={"nugget_id": "1"})
+    kb[4] = kb[4].model_copy(update={"nugget_id": ""})
+    index = KnowledgeBaseIndex(kb, LocalEmbeddings())
+
+    assert len(index.scores(["Seine"])) == len(kb)
+    assert index.top_k(["Seine flows"], k=1)[0].content == "The Seine flows through Paris."
+    assert index.get("1").content == "The Eiffel Tower was completed in 1889."
+
+
+class BrokenEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        raise ConnectionError("offline")
+
+    def embed_query(self, text):
+        raise ConnectionError("offline")
+
+
+def test_falls_back_to_local_embeddings():
+    messages = []
+    index = KnowledgeBaseIndex(make_kb(), BrokenEmbeddings(), messages.append)
+
+    assert index.top_k(["bananas potassium"], k=1)[0].nugget_id == "2"
+    assert isinstance(index.embedder, LocalEmbeddings)
+    assert "local embeddings" in messages[0]["msg"]
+
+
+class RecordingChatModel(FakeListChatModel):
+    prompts: list = []
+
+    def _call(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._call(messages, *args, **kwargs)
+
+
+def test_kb_update_prompt_only_carries_top_k_nuggets(offline_agent, monkeypatch, run_config):
+    model = RecordingChatModel(responses=['{"new_nuggets": [{"content": "The Eiffel Tower was completed in 1889", "source_url": "https://example.org/eiffel", "confidence": 0.5}]}'])
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: model)
+    run_config["configurable"]["kb_prompt_top_k"] = 1
+    kb = make_kb()
+    state = {
+        "question": "When was the Eiffel Tower built?",
+        "improved_question": "When was the Eiffel Tower built?",
+        "knowledge_base": kb,
+        "search_results": [{"title": "Eiffel Tower", "snippet": "The Eiffel Tower was completed in 1889."}],
+    }
+
+    result = offline_agent.update_knowledge_base(state, lambda msg: None, run_config)
+
+    prompt = model.prompts[-1]
+    assert "Eiffel Tower was completed" in prompt
+    assert "Bananas" not in prompt and "Photosynthesis" not in prompt and "Seine" not in prompt
+    assert len(result["knowledge_base"]) == len(kb)
+    assert result["knowledge_base"][1].sources == ["https://example.com/1", "https://example.org/eiffel"]
+    # The nugget in the input state is left untouched
+    assert kb[1].sources == []
+
+
+def test_kb_update_without_search_results_ranks_nuggets_by_open_checklist_items(offline_agent, monkeypatch, run_config):
+    from langchain_core.documents import Document
+
+    model = RecordingChatModel(responses=['{"new_nuggets": []}'])
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: model)
+    run_config["configurable"]["kb_prompt_top_k"] = 1
+    state = {
+        "question": "Which river flows through Paris?",
+        "improved_question": "Which river flows through Paris?",
+        "scored_checklist": [{"item_to_score": "Names the river Seine that flows through Paris", "current_score": 0.0}],
+        "knowledge_base": make_kb(),
+        "search_results": None,
+        "scraped_content": [Document(page_content="Opening hours and ticket prices.", metadata={"source": "https://example.com/tickets"})],
+    }
+
+    offline_agent.update_knowledge_base(state, lambda msg: None, run_config)
+
+    prompt = model.prompts[-1]
+    assert "The Seine flows through Paris." in prompt
+    assert "Paris is the capital of France." not in prompt
@@ -0,0 +1,41 @@
+from backend.agents.knowledge_base import KnowledgeBase, corroborations
+from backend.agents.utils.prompts import KnowledgeNugget
+
+
+def test_ids_continue_after_existing_ones_without_collisions():
+    kb = KnowledgeBase([
+        KnowledgeNugget(content="Paris is the capital of France.", source_url="https://a.example", nugget_id="7"),
+        KnowledgeNugget(content="The Seine flows through Paris.", source_url="https://a.example", nugget_id="7"),
+        KnowledgeNugget(content="Legacy nugget.", source_url="https://a.example", nugget_id="3f2a9c1e"),
+    ])
+
+    added = kb.add("The Louvre is in Paris.", "https://b.example")
+
+    assert [nugget.nugget_id for nugget in kb] == ["7", "8", "3f2a9c1e", "9"]
+    assert added.outcome == "added" and kb.get("9") is added.nugget
+
+
+def test_same_content_from_a_new_source_corroborates():
+    original = KnowledgeNugget(content="Paris is the capital of France.", source_url="https://a.example", confidence=0.6, nugget_id="1")
+    kb = KnowledgeBase([original])
+
+    corroborated = kb.add("paris is the capital of  France", "https://b.example", 0.5)
+    repeated = kb.add("Paris is the capital of France!", "https://b.example", 0.9)
+
+    assert (corroborated.outcome, repeated.outcome) == ("corroborated", "repeated")
+    assert len(kb) == 1
+    nugget = kb.get("1")
+    assert corroborations(nugget) == 2
+    assert nugget.confidence == 0.9
+    assert corroborated.nugget.confidence == 0.8
+    # Earlier states keep their nugget as it was
+    assert original.sources == [] and original.confidence == 0.6
+
+
+def test_conflicts_are_linked_both_ways():
+    kb = KnowledgeBase([KnowledgeNugget(content="Paris has 2.1 million residents.", source_url="https://a.example", nugget_id="1")])
+
+    result = kb.add("Paris has 2.0 million residents.", "https://b.example", conflicts_with=["1", "missing"])
+
+    assert result.nugget.conflicts_with == ["1"]
+    assert kb.get("1").conflicts_with == [result.nugget.nugget_id]
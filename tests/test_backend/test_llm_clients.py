@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.agents.rave_agent import getModel
+from backend.agents.utils.llm_clients import LoopAsyncClient, get_chat_model, get_http_clients
+from backend.config.models import get_model_config
+
+
+def test_clients_are_reused_per_settings():
+    first = get_chat_model("gpt-4o", 0.0, "sk-test")
+
+    assert get_chat_model("gpt-4o", 0.0, "sk-test") is first
+    assert get_chat_model("gpt-4o", 0.5, "sk-test") is not first
+    assert get_chat_model("gpt-4o", 0.0, "sk-other") is not first
+
+
+def test_clients_share_one_connection_pool():
+    http_client, http_async_client = get_http_clients()
+
+    for model in (get_chat_model("gpt-4o", 0.0, "sk-test"), get_chat_model("o3-mini", None, "sk-test")):
+        assert model.http_client is http_client
+        assert model.http_async_client is http_async_client
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_client_survives_a_new_event_loop():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+    client = LoopAsyncClient()
+
+    async def fetch():
+        return (await client.get(url)).text
+
+    try:
+        # The second run would reuse a connection of the first, closed loop
+        assert asyncio.run(fetch()) == "ok"
+        assert asyncio.run(fetch()) == "ok"
+    finally:
+        httpd.shutdown()
+
+
+def test_get_model_uses_registry():
+    config = {"configurable": {"answer_model": "o3-mini"}}
+
+    model = getModel("answer_model", config)
+
+    assert model is getModel("answer_model", config)
+    assert model.temperature is None
+
+
+def test_get_model_config_lookup():
+    assert get_model_config("gpt-4")["context_window"] == 8192
+    with pytest.raises(ValueError):
+        get_model_config("not-a-model")
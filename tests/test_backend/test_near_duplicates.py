@@ -0,0 +1,57 @@
+import random
+
+from langchain_core.documents import Document
+
+from backend.agents.utils.near_duplicates import FingerprintIndex, filter_near_duplicates, hamming, simhash
+
+WORDS = "river city bank bridge museum tower street market palace garden square island church".split()
+
+
+def article(seed, words=1000):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randrange(50)) for _ in range(words))
+
+
+def page(url, text):
+    return Document(page_content=text, metadata={"source": url})
+
+
+def test_simhash_separates_copies_from_other_pages():
+    text = article(1)
+    edited = text.replace(text.split()[10], "changed", 1) + " Published by Example Wire"
+
+    assert hamming(simhash(text), simhash(edited)) <= 8
+    assert hamming(simhash(text), simhash(article(2))) > 16
+    assert simhash("too short to fingerprint") is None
+
+
+def test_keeps_the_highest_scored_copy():
+    text = article(1)
+    docs = [
+        page("https://mirror.example/a", text + " Mirrored copy"),
+        page("https://news.example/a", text),
+        page("https://other.example/b", article(2)),
+        page("https://short.example/c", "Paris is the capital of France."),
+    ]
+
+    kept, dropped = filter_near_duplicates(docs, {"https://mirror.example/a": 40, "https://news.example/a": 90, "https://other.example/b": 70})
+
+    assert [doc.metadata["source"] for doc in kept] == ["https://news.example/a", "https://other.example/b", "https://short.example/c"]
+    assert dropped == [{"url": "https://mirror.example/a", "duplicate_of": "https://news.example/a", "score": 40, "distance": dropped[0]["distance"]}]
+
+
+def test_shared_index_drops_copies_seen_by_earlier_runs():
+    index = FingerprintIndex(max_size=2)
+    text = article(1)
+    filter_near_duplicates([page("https://news.example/a", text)], {}, index)
+
+    # The same URL fetched again is not a copy of itself, a mirror is
+    kept, dropped = filter_near_duplicates(
+        [page("https://news.example/a", text), page("https://mirror.example/a", text)], {"https://news.example/a": 50}, index
+    )
+
+    assert [doc.metadata["source"] for doc in kept] == ["https://news.example/a"]
+    assert dropped[0]["duplicate_of"] == "https://news.example/a"
+
+    filter_near_duplicates([page("https://other.example/b", article(2)), page("https://third.example/c", article(3))], {}, index)
+    assert len(index) == 2 and index.nearest(simhash(text)) is None
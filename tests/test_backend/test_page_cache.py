@@ -0,0 +1,88 @@
+import sqlite3
+import time
+
+from langchain_core.documents import Document
+
+from backend.agents.utils import page_cache
+from backend.agents.utils.page_cache import PageCache, normalize_url
+from backend.agents.utils.scraper import scrape_pages, cache_latency_report
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Example.com:443/a?b=2&a=1#frag") == "https://example.com/a?a=1&b=2"
+    assert normalize_url("http://example.com?utm_source=x") == "http://example.com/"
+    assert normalize_url("http://example.com:8080/") == "http://example.com:8080/"
+
+
+def test_lru_eviction(tmp_path):
+    cache = PageCache(path=str(tmp_path / "pages.sqlite"), max_bytes=250)
+    for name in ("a", "b", "c"):
+        cache.put(f"http://example.com/{name}", Document(page_content="x" * 100, metadata={}))
+        time.sleep(0.01)
+        # Keep "a" recently used so "b" is the eviction victim
+        cache.get("http://example.com/a")
+
+    assert cache.get("http://example.com/a") is not None
+    assert cache.get("http://example.com/b") is None
+    assert cache.get("http://example.com/c") is not None
+    assert cache.total_bytes() <= 250
+
+
+def test_pages_of_another_content_version_are_not_served(tmp_path, monkeypatch):
+    path = str(tmp_path / "pages.sqlite")
+    # A cache written before pages were versioned
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE pages (key TEXT PRIMARY KEY, url TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL, "
+        "etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (page_cache.url_key("https://example.com/old"), "https://example.com/old", "Menu Home Paris", "{}", None, None, time.time(), time.time(), 15)
+    )
+    conn.commit()
+    conn.close()
+
+    cache = PageCache(path)
+    assert cache.get("https://example.com/old") is None
+    cache.put("https://example.com/new", Document(page_content="Paris", metadata={}))
+    assert cache.get("https://example.com/new").text == "Paris"
+    cache.close()
+
+    monkeypatch.setattr(page_cache, "CONTENT_VERSION", page_cache.CONTENT_VERSION + 1)
+    cache = PageCache(path)
+    assert cache.get("https://example.com/new") is None
+    assert cache.total_bytes() == 0
+
+
+def test_warm_cache_makes_no_requests(server, page_hits, tmp_path):
+    cache = PageCache(path=str(tmp_path / "pages.sqlite"))
+    urls = [f"{server}/page/{i}" for i in range(3)]
+
+    cold = scrape_pages(urls, cache=cache)
+    hits_after_cold = sum(page_hits.values())
+    warm = scrape_pages(urls, cache=cache)
+
+    assert [doc.page_content for doc in warm] == [doc.page_content for doc in cold]
+    assert sum(page_hits.values()) == hits_after_cold == 3
+    assert cache.stats["hits"] == 3
+
+
+def test_stale_page_is_revalidated(server, page_hits, tmp_path):
+    cache = PageCache(path=str(tmp_path / "pages.sqlite"), ttl=0)
+    url = f"{server}/page/1"
+
+    first = scrape_pages([url], cache=cache)
+    second = scrape_pages([url], cache=cache)
+
+    assert second[0].page_content == first[0].page_content
+    assert page_hits["/page/1"] == 2
+    assert cache.stats["revalidated"] == 1
+
+
+def test_cache_latency_report(server, tmp_path):
+    report = cache_latency_report([f"{server}/slow/{i}" for i in range(2)], str(tmp_path / "report.sqlite"))
+
+    assert report["cold"]["network_requests"] == 2
+    assert report["warm"]["network_requests"] == 0
+    assert report["warm"]["seconds"] < report["cold"]["seconds"]
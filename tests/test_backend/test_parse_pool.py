@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from backend.agents.utils import parse_pool
+from backend.agents.utils.parse_pool import ParsePool, ParseTimeout, parse_content, time_limit
+from backend.agents.utils.scraper import scrape_pages
+
+
+def test_large_pages_are_parsed_in_a_worker_process():
+    paragraph = "<p>The river divides the city into a northern bank and a southern bank, each with its own history.</p>"
+    page = f"<html><head><title>Paris</title></head><body><article>{paragraph * 400}</article></body></html>".encode()
+    assert len(page) > parse_pool.PARSE_INLINE_BYTES
+
+    doc = parse_content("https://example.com/paris", page, "text/html; charset=utf-8", "utf-8")
+
+    assert parse_pool._parse_pool is not None
+    assert doc.page_content == "The river divides the city into a northern bank and a southern bank, each with its own history."
+    assert doc.metadata["title"] == "Paris"
+    assert doc.metadata["raw_bytes"] == len(page)
+
+
+def test_time_limit_interrupts_a_slow_parse():
+    start = time.monotonic()
+    with pytest.raises(ParseTimeout):
+        with time_limit(0.05):
+            time.sleep(1)
+    assert time.monotonic() - start < 0.5
+
+
+def test_time_queued_behind_other_tasks_does_not_count():
+    pool = ParsePool(workers=1)
+    pool.submit(time.sleep, 1.0)
+
+    assert pool.run(len, "abc", timeout=0.3) == 3
+    assert not pool.retired
+
+
+def test_a_stuck_worker_retires_the_pool_and_lets_other_tasks_finish():
+    pool = ParsePool(workers=2)
+    _, other = pool.submit(time.sleep, 1.0)
+
+    with pytest.raises(FuturesTimeout):
+        pool.run(time.sleep, 30, timeout=0.3)
+
+    assert pool.retired
+    assert other.result(timeout=5) is None
+    # Once the other task is done the stuck worker is killed
+    _, stuck = next(iter(pool.tasks.items()))
+    with pytest.raises(BrokenProcessPool):
+        stuck.result(timeout=5)
+    assert parse_pool.get_parse_pool() is not pool
+
+
+def test_pdfs_are_fetched_and_extracted(server):
+    docs = scrape_pages([f"{server}/doc.pdf"])
+
+    assert docs[0].page_content == "Paris has about two million inhabitants."
+    assert docs[0].metadata["content_type"] == "application/pdf"
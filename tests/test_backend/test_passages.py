@@ -0,0 +1,71 @@
+from langchain_core.documents import Document
+
+from backend.agents.utils.kb_index import LocalEmbeddings
+from backend.agents.utils.passages import PassageIndex, chunk_document
+from test_kb_index import BrokenEmbeddings, RecordingChatModel
+
+
+def make_page(url, *paragraphs, filler=60):
+    """A page whose paragraphs are separated by unrelated filler words"""
+    padding = " ".join(f"filler{i}" for i in range(filler))
+    return Document(page_content=f" {padding} ".join(paragraphs), metadata={"source": url, "title": url.rsplit("/", 1)[-1]})
+
+
+def test_chunks_overlap_and_cover_the_page():
+    doc = Document(page_content=" ".join(f"w{i}" for i in range(25)), metadata={"source": "https://example.com/a"})
+
+    passages = chunk_document(doc, words=10, overlap=3)
+
+    assert [p.text.split()[0] for p in passages] == ["w0", "w7", "w14", "w21"]
+    assert passages[0].text.split()[-3:] == passages[1].text.split()[:3]
+    assert passages[-1].text.split()[-1] == "w24"
+    assert passages[0].source_url == "https://example.com/a"
+
+
+def test_top_k_finds_passages_for_each_query():
+    docs = [
+        make_page("https://example.com/paris", "Paris is the capital of France.", "The Seine flows through Paris."),
+        make_page("https://example.com/census", "Bananas are rich in potassium.", "The population of Paris is about two million people."),
+    ]
+    index = PassageIndex(docs, LocalEmbeddings())
+
+    top = index.top_k(["capital of France", "population of Paris"], k=2)
+
+    texts = " ".join(passage.text for passage in top)
+    assert "capital of France" in texts and "two million" in texts
+    assert index.top_k(["photosynthesis"], k=2) == []
+
+
+def test_falls_back_to_local_embeddings():
+    messages = []
+    index = PassageIndex([make_page("https://example.com/fruit", "Bananas are rich in potassium.")], BrokenEmbeddings(), messages.append)
+
+    assert "potassium" in index.top_k(["bananas potassium"], k=1)[0].text
+    assert "local embeddings" in messages[0]["msg"]
+
+
+def test_kb_update_prompt_carries_passages_for_unmet_items(offline_agent, monkeypatch, run_config):
+    model = RecordingChatModel(responses=['{"new_nuggets": []}'])
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: model)
+    run_config["configurable"]["passage_top_k"] = 1
+    state = {
+        "question": "How many people live in Paris?",
+        "improved_question": "How many people live in Paris?",
+        "scored_checklist": [
+            {"item_to_score": "Names the capital of France", "current_score": 1.0},
+            {"item_to_score": "Gives the population of Paris", "current_score": 0.2},
+        ],
+        "knowledge_base": [],
+        "search_results": [],
+        "scraped_content": [
+            make_page("https://example.com/paris", "Paris is the capital of France.", "The population of Paris is about two million people.", filler=400),
+        ],
+    }
+    messages = []
+
+    offline_agent.update_knowledge_base(state, messages.append, run_config)
+
+    prompt = model.prompts[-1]
+    assert "two million people" in prompt
+    assert "Paris is the capital of France" not in prompt
+    assert any("passages from 1 scraped pages" in m["msg"] for m in messages)
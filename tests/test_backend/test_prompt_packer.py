@@ -0,0 +1,112 @@
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents.utils import prompt_packer
+from backend.agents.utils.prompt_packer import count_tokens, pack_items, prompt_budget
+from backend.agents.utils.prompts import KnowledgeNugget
+
+
+def test_everything_is_kept_when_it_fits():
+    packed = pack_items(["a", "b", "c"], budget=1000)
+
+    assert packed.kept == ["a", "b", "c"]
+    assert packed.dropped == []
+
+
+def test_highest_priority_items_are_kept_in_original_order():
+    items = ["low " * 10, "high " * 10, "mid " * 10, "tiny"]
+    budget = sum(count_tokens(f'"{item}"') + 1 for item in items[1:3]) + count_tokens("\"tiny\"") + 2
+
+    packed = pack_items(items, budget, priorities=lambda: [1, 3, 2, 0])
+
+    assert packed.kept == [items[1], items[2], items[3]]
+    assert packed.dropped == [items[0]]
+    assert packed.tokens <= budget
+
+
+def test_tokens_are_approximated_without_a_tokenizer(monkeypatch):
+    monkeypatch.setitem(prompt_packer._encodings, "offline-model", None)
+
+    assert count_tokens("x" * 40, "offline-model") == 10
+
+
+def test_budget_follows_the_context_window():
+    small = prompt_budget("answer_model", {"configurable": {"answer_model": "gpt-4"}})
+    large = prompt_budget("answer_model", {"configurable": {"answer_model": "gpt-4o"}})
+
+    assert 0 < small < large
+
+
+class RecordingChatModel(FakeListChatModel):
+    prompts: list = []
+
+    def _call(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._call(messages, *args, **kwargs)
+
+    def _stream(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._stream(messages, *args, **kwargs)
+
+
+def make_large_kb():
+    filler = [
+        KnowledgeNugget(
+            content=f"Bananas grown on plantation {i} are harvested green and shipped in refrigerated containers.",
+            source_url=f"https://example.com/bananas/{i}",
+            confidence=0.5,
+            nugget_id=f"b{i}"
+        )
+        for i in range(300)
+    ]
+    relevant = KnowledgeNugget(
+        content="The Eiffel Tower was completed in 1889.",
+        source_url="https://example.com/eiffel",
+        nugget_id="eiffel"
+    )
+    return filler[:150] + [relevant] + filler[150:]
+
+
+def test_answer_prompt_fits_the_model_budget(offline_agent, monkeypatch, run_config):
+    model = RecordingChatModel(responses=["It was completed in 1889."])
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: model)
+    run_config["configurable"]["answer_model"] = "gpt-4"
+    state = {
+        "question": "When was the Eiffel Tower built?",
+        "improved_question": "When was the Eiffel Tower completed?",
+        "scored_checklist": [{"item_to_score": "Year the Eiffel Tower was completed"}],
+        "knowledge_base": make_large_kb(),
+    }
+    messages = []
+
+    result = offline_agent.generate_answer(state, messages.append, run_config)
+
+    prompt = model.prompts[-1]
+    assert result["answer"] == "It was completed in 1889."
+    assert "Eiffel Tower was completed in 1889" in prompt
+    assert count_tokens(prompt, "gpt-4") <= prompt_budget("answer_model", run_config)
+    assert any("Dropped" in m.get("msg", "") and "knowledge nuggets" in m["msg"] for m in messages)
+
+
+def test_kb_update_prompt_fits_the_model_budget(offline_agent, monkeypatch, run_config):
+    model = RecordingChatModel(responses=['{"new_nuggets": []}'])
+    monkeypatch.setattr(offline_agent, "getModel", lambda node_name, config, writer=None: model)
+    run_config["configurable"]["kb_model"] = "gpt-4"
+    run_config["configurable"]["kb_prompt_top_k"] = 1000
+    state = {
+        "question": "When was the Eiffel Tower built?",
+        "improved_question": "When was the Eiffel Tower built?",
+        "knowledge_base": make_large_kb(),
+        "search_results": [
+            {"title": f"Result {i}", "link": f"https://example.com/{i}", "snippet": "Eiffel Tower history " * 20}
+            for i in range(50)
+        ],
+    }
+    messages = []
+
+    offline_agent.update_knowledge_base(state, messages.append, run_config)
+
+    prompt = model.prompts[-1]
+    assert "Eiffel Tower was completed in 1889" in prompt
+    assert "Result 0" in prompt
+    assert count_tokens(prompt, "gpt-4") <= prompt_budget("kb_model", run_config)
+    assert any("search results" in m.get("msg", "") for m in messages)
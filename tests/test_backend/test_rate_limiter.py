@@ -0,0 +1,182 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from backend.agents.utils.cancellation import CancellationToken, RunCancelled, cancellation_scope
+from backend.agents.utils.rate_limiter import ProviderLimiter, RateLimitedChatModel, ReturnedError
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+def failing(times, error):
+    """A provider call that raises error the first `times` calls"""
+    calls = []
+
+    def call():
+        calls.append(time.monotonic())
+        if len(calls) <= times:
+            raise error
+        return "ok"
+    return call, calls
+
+
+def test_requests_are_paced_by_the_bucket():
+    limiter = ProviderLimiter("test", requests_per_minute=600, burst_seconds=0.1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.call(lambda: None)
+
+    # One request of burst, then one every 0.1s
+    assert time.monotonic() - start >= 0.45
+
+
+def test_rate_limited_call_waits_for_retry_after_and_halves_concurrency():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, max_concurrency=8, backoff_base=0.01)
+    call, calls = failing(1, ProviderError(429, {"retry-after": "0.2"}))
+
+    assert limiter.call(call) == "ok"
+
+    assert calls[1] - calls[0] >= 0.2
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.concurrency == pytest.approx(4 + 1 / 4)
+
+
+def test_concurrency_grows_back_after_successes():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, max_concurrency=4, backoff_base=0.01)
+    limiter.call(failing(1, ProviderError(429))[0])
+    assert limiter.concurrency < 3
+
+    for _ in range(20):
+        limiter.call(lambda: None)
+
+    assert limiter.concurrency == 4
+
+
+def test_client_errors_are_not_retried():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, backoff_base=0.01)
+    call, calls = failing(1, ProviderError(400))
+
+    with pytest.raises(ProviderError):
+        limiter.call(call)
+    assert len(calls) == 1
+
+
+def test_async_calls_retry_server_errors():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, backoff_base=0.01)
+    call, calls = failing(2, ProviderError(503))
+
+    async def acall():
+        return call()
+
+    assert asyncio.run(limiter.acall(acall)) == "ok"
+    assert len(calls) == 3
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_async_call_frees_its_slot_without_growing_concurrency():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, max_concurrency=4)
+    limiter.concurrency = 2.0
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(limiter.acall(cancelled))
+    assert limiter.in_flight == 0
+    assert limiter.concurrency == 2.0
+
+
+def test_async_wait_for_a_slot_stops_when_the_run_is_cancelled():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000)
+    limiter.paused_until = time.monotonic() + 60
+    token = CancellationToken()
+
+    async def wait_for_slot():
+        with cancellation_scope(token):
+            asyncio.get_running_loop().call_later(0.1, token.cancel)
+            await limiter.aacquire()
+
+    start = time.monotonic()
+    with pytest.raises(RunCancelled):
+        asyncio.run(wait_for_slot())
+    assert time.monotonic() - start < 1
+    assert limiter.in_flight == 0
+
+
+class FlakyChatModel(FakeListChatModel):
+    """Rejects its first streamed call with a 429"""
+    failures: int = 1
+
+    def _stream(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ProviderError(429)
+        return super()._stream(*args, **kwargs)
+
+
+def test_wrapped_model_retries_a_stream_rejected_before_its_first_chunk():
+    limiter = ProviderLimiter("test", requests_per_minute=60_000, tokens_per_minute=1_000_000, backoff_base=0.01)
+    model = RateLimitedChatModel(llm=FlakyChatModel(responses=["Paris"]), limiter=limiter, model_name="fake")
+
+    assert "".join(chunk.content for chunk in model.stream("Capital of France?")) == "Paris"
+    assert model.invoke("Capital of France?").content == "Paris"
+    assert model.responses == ["Paris"]
+    assert limiter.stats["retries"] == 1
+
+
+def search_state():
+    return {"question": "What is the capital of France?", "current_query": "capital of France"}
+
+
+def test_serpapi_error_responses_make_the_limiter_back_off(offline_agent, fake_search, monkeypatch):
+    limiter = ProviderLimiter("serpapi", requests_per_minute=60_000, max_concurrency=4, backoff_base=0.01)
+    monkeypatch.setattr(offline_agent, "get_limiter", lambda provider: limiter)
+    throttled = [{"error": "Your account has run out of searches."}]
+    get_dict = fake_search.get_dict
+    monkeypatch.setattr(fake_search, "get_dict", lambda self: throttled.pop() if throttled else get_dict(self))
+
+    result = offline_agent.search2(search_state(), lambda message: None)
+
+    assert len(result["search_results"]) == 2
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.stats["retries"] == 1
+    assert limiter.concurrency < 4
+
+
+def test_returned_errors_are_classified_by_message():
+    assert ReturnedError("HTTPError('429 Client Error: Too Many Requests for url: https://api.tavily.com/search')").status_code == 429
+    assert ReturnedError("ConnectionError('Read timed out')").status_code == 503
+    assert ReturnedError("HTTPError('401 Client Error: Unauthorized')").status_code == 400
+
+
+def test_tavily_error_strings_are_retried_and_never_returned(offline_agent, monkeypatch):
+    limiter = ProviderLimiter("tavily", requests_per_minute=60_000, backoff_base=0.01)
+    monkeypatch.setattr(offline_agent, "get_limiter", lambda provider: limiter)
+    responses = [[{"url": "https://example.com/paris", "content": "Paris"}], "HTTPError('429 Client Error: Too Many Requests')"]
+
+    class FakeTavily:
+        def __init__(self, **kwargs):
+            pass
+
+        def invoke(self, query):
+            return responses.pop()
+
+    monkeypatch.setattr(offline_agent, "TavilySearchResults", FakeTavily)
+
+    result = offline_agent.search(search_state(), lambda message: None)
+
+    assert result["search_results"] == [{"url": "https://example.com/paris", "content": "Paris"}]
+    assert limiter.stats["rate_limited"] == 1
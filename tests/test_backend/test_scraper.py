@@ -0,0 +1,62 @@
+import time
+
+from backend.agents.utils import scraper
+from backend.agents.utils.scraper import get_session, scrape_pages
+
+
+def test_pages_are_fetched_concurrently(server):
+    urls = [f"{server}/slow/{i}" for i in range(6)]
+
+    start = time.monotonic()
+    docs = scrape_pages(urls)
+    elapsed = time.monotonic() - start
+
+    assert [doc.metadata["source"] for doc in docs] == urls
+    assert docs[0].metadata["title"] == "/slow/0"
+    assert "Content of /slow/0" in docs[0].page_content
+    # Six half-second pages should take about as long as one
+    assert elapsed < 1.5
+
+
+def test_failed_fetch_is_retried_with_backoff(server, page_hits):
+    docs = scrape_pages([f"{server}/flaky"], backoff_base=0.05)
+
+    assert len(docs) == 1
+    assert page_hits["/flaky"] == 2
+
+
+def test_client_errors_are_not_retried(server, page_hits):
+    messages = []
+    docs = scrape_pages([f"{server}/missing", f"{server}/ok"], writer=messages.append)
+
+    assert [doc.metadata["source"] for doc in docs] == [f"{server}/ok"]
+    assert page_hits["/missing"] == 1
+    assert any("Failed to scrape" in m["msg"] for m in messages)
+
+
+def test_deadline_bounds_the_batch(server):
+    messages = []
+
+    start = time.monotonic()
+    docs = scrape_pages([f"{server}/hang", f"{server}/ok"], writer=messages.append, deadline=1)
+    elapsed = time.monotonic() - start
+
+    assert [doc.metadata["source"] for doc in docs] == [f"{server}/ok"]
+    assert elapsed < 2
+    assert any("deadline" in m["msg"] for m in messages)
+
+
+def test_least_recently_used_sessions_are_closed(monkeypatch):
+    monkeypatch.setattr(scraper, "SCRAPE_MAX_SESSIONS", 2)
+    monkeypatch.setattr(scraper, "_sessions", scraper.OrderedDict())
+    closed = []
+    first = get_session("https://a.example.com/page")
+    monkeypatch.setattr(first, "close", lambda: closed.append("a"))
+    second = get_session("https://b.example.com/page")
+    monkeypatch.setattr(second, "close", lambda: closed.append("b"))
+
+    assert get_session("https://a.example.com/other") is first
+    get_session("https://c.example.com/page")
+
+    assert closed == ["b"]
+    assert list(scraper._sessions) == ["https://a.example.com", "https://c.example.com"]
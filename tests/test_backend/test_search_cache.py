@@ -0,0 +1,47 @@
+from backend.agents.utils.search_cache import SearchCache, normalize_query
+
+
+def test_normalize_query_ignores_case_order_and_stop_words():
+    assert normalize_query("What is the capital of France?") == normalize_query("france CAPITAL")
+    assert normalize_query("  tariffs   and the economy ") == "economy tariffs"
+
+
+def test_negated_and_opposite_queries_do_not_collide(tmp_path):
+    assert normalize_query("inflation before 2020") != normalize_query("inflation after 2020")
+    assert normalize_query("is aspirin safe") != normalize_query("is aspirin not safe")
+
+    cache = SearchCache(path=str(tmp_path / "searches.sqlite"), similarity=0.75)
+    cache.put("serpapi", "is aspirin safe during pregnancy for headaches in adults", [{"title": "Safe"}])
+
+    assert cache.get("serpapi", "is aspirin not safe during pregnancy for headaches in adults") is None
+    assert cache.get("serpapi", "inflation after 2020") is None
+
+
+def test_exact_and_near_duplicate_hits(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "searches.sqlite"), similarity=0.75)
+    results = [{"title": "Paris", "link": "https://en.wikipedia.org/wiki/Paris"}]
+    cache.put("serpapi", "capital of France population 2025", results)
+
+    assert cache.get("serpapi", "France capital population 2025") == results
+    assert cache.get("serpapi", "capital of France population 2025 latest") == results
+    assert cache.get("serpapi", "history of Lyon") is None
+    assert cache.get("tavily:3", "capital of France population 2025") is None
+    assert cache.stats == {"hits": 1, "near_hits": 1, "misses": 2}
+
+
+def test_expired_results_are_not_served(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "searches.sqlite"), ttl=0)
+    cache.put("serpapi", "capital of France", [{"title": "Paris"}])
+
+    assert cache.get("serpapi", "capital of France") is None
+
+
+def test_search_errors_are_not_cached(offline_agent, monkeypatch):
+    monkeypatch.setattr(offline_agent, "cassette_search", lambda provider, query, search: "HTTPError('500 Server Error')")
+    messages = []
+
+    result = offline_agent.search({"question": "What is the capital of France?", "current_query": "capital of France"}, messages.append)
+
+    assert result == {}
+    assert "500 Server Error" in messages[-1]["msg"]
+    assert offline_agent.get_search_cache().get(f"tavily:{offline_agent.MAX_SEARCH_RESULTS}", "capital of France") is None
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from backend.agents.rave_agent import build_graph, NODES, ASYNC_NODES
+from backend.agents.utils import telemetry
+from backend.agents.utils.telemetry import record_llm_usage, summarize_metrics
+from backend.config.models import get_model_config
+
+
+def test_every_node_run_emits_metrics(offline_agent, initial_state, run_config):
+    graph = build_graph(NODES).compile()
+
+    events, final_state = [], None
+    for mode, data in graph.stream(initial_state, config=run_config, stream_mode=["values", "custom"]):
+        if mode == "custom" and "metrics" in data:
+            events.append(data["metrics"])
+        elif mode == "values":
+            final_state = data
+
+    by_node = {metrics["node"]: metrics for metrics in events}
+    assert set(by_node) == set(NODES) - {"generate_query"}
+    assert by_node["improve_question"]["llm_calls"] == 1
+    assert by_node["generate_answer"]["prompt_tokens"] > 0
+    assert by_node["generate_answer"]["completion_tokens"] > 0
+    assert by_node["search2"]["llm_calls"] == 0
+    assert by_node["scrape_urls"]["seconds"] > 0
+    # Parallel branches may finish in either order
+    assert sorted(final_state["node_metrics"], key=str) == sorted(events, key=str)
+
+
+def test_async_nodes_are_metered(offline_agent, initial_state, run_config):
+    graph = build_graph(ASYNC_NODES).compile()
+
+    final_state = asyncio.run(graph.ainvoke(initial_state, config=run_config))
+
+    summary = summarize_metrics(final_state["node_metrics"])
+    assert summary["nodes"]["update_knowledge_base"]["llm_calls"] == 1
+    assert summary["total"]["runs"] == len(final_state["node_metrics"])
+    assert summary["total"]["prompt_tokens"] == sum(m["prompt_tokens"] for m in final_state["node_metrics"])
+
+
+def test_reported_usage_is_priced_from_the_model_config():
+    usage = telemetry.new_usage()
+    token = telemetry._node_usage.set(usage)
+    try:
+        response = SimpleNamespace(content="Paris", usage_metadata={"input_tokens": 1500, "output_tokens": 500})
+        record_llm_usage(SimpleNamespace(model_name="gpt-4o"), "What is the capital of France?", response)
+    finally:
+        telemetry._node_usage.reset(token)
+
+    assert usage["prompt_tokens"] == 1500
+    assert usage["completion_tokens"] == 500
+    assert usage["cost"] == 2 * get_model_config("gpt-4o")["cost_per_1k_tokens"]
+
+
+def test_summary_groups_by_node_and_iteration():
+    metrics = [
+        {"node": "search2", "iteration": 1, "seconds": 1.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0},
+        {"node": "search2", "iteration": 2, "seconds": 2.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0},
+        {"node": "generate_answer", "iteration": 2, "seconds": 0.5, "llm_calls": 1, "prompt_tokens": 100, "completion_tokens": 50, "cost": 0.01},
+    ]
+
+    summary = summarize_metrics(metrics)
+
+    assert list(summary["nodes"]) == ["search2", "generate_answer"]
+    assert summary["nodes"]["search2"]["runs"] == 2
+    assert summary["iterations"][2]["seconds"] == 2.5
+    assert summary["total"]["cost"] == 0.01
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+from frontend.session_index import SessionIndex
+from frontend.session_log import SessionLog, compact_session_log, load_session_log, open_session_log
+
+from test_session_log import LEGACY_SESSION, run_steps
+
+
+def test_opened_log_reads_steps_lazily(tmp_path):
+    log = SessionLog.create("Capital of France?", {"answer_model": "gpt-4o"}, directory=str(tmp_path))
+    history = run_steps(log)
+
+    session = open_session_log(log.path)
+    lazy = session["values_history"]
+
+    assert len(lazy) == 3
+    assert lazy._deltas == []
+    assert session["values_history_description"] == ["step 0", "step 1", "step 2"]
+    assert session["status_messages"] == ["status 0", "status 1", "status 2"]
+    assert lazy[1] == history[1]
+    assert len(lazy._deltas) == 2
+    assert list(lazy) == history
+
+
+def test_compacted_log_opens_its_last_step_from_the_checkpoint(tmp_path):
+    log = SessionLog.create("Capital of France?", {}, directory=str(tmp_path))
+    history = run_steps(log)
+    compact_session_log(log.path)
+
+    lazy = open_session_log(log.path)["values_history"]
+
+    assert lazy[-1] == history[-1]
+    assert lazy._deltas == []
+    assert lazy[0] == load_session_log(log.path)["values_history"][0]
+
+
+def test_index_pages_and_follows_the_directory(tmp_path):
+    sessions_dir = tmp_path / "sessions"
+    sessions_dir.mkdir()
+    shutil.copy(LEGACY_SESSION, sessions_dir)
+    log = SessionLog.create("Capital of France?", {}, directory=str(sessions_dir))
+    run_steps(log)
+    index = SessionIndex(str(tmp_path / "index.sqlite"), str(sessions_dir))
+
+    assert index.rescan() == {"added": 2, "updated": 0, "removed": 0}
+    assert index.rescan() == {"added": 0, "updated": 0, "removed": 0}
+    assert index.count() == 2
+    newest, oldest = index.page(0, 2)
+    assert newest["filename"] == os.path.basename(log.path)
+    assert newest["final_score"] is None
+    assert oldest["filename"] == os.path.basename(LEGACY_SESSION)
+    assert oldest["byte_size"] == os.path.getsize(LEGACY_SESSION)
+    assert 0 < oldest["final_score"] <= 1
+    assert [row["filename"] for row in index.page(1, 10)] == [oldest["filename"]]
+
+    os.remove(log.path)
+    assert index.rescan()["removed"] == 1
+    assert index.count() == 1
@@ -0,0 +1,78 @@
+import json
+import os
+
+from langchain_core.documents import Document
+
+from backend.agents.utils.prompts import KnowledgeNugget, URLWithScore
+from frontend.session_log import SessionLog, compact_session_log, load_any_session, load_session_log, write_session_log
+
+LEGACY_SESSION = os.path.join(os.path.dirname(__file__), "..", "..", "sessions", "session_2025-04-18_234148.json")
+
+
+def run_steps(log):
+    nugget = KnowledgeNugget(content="Paris is the capital of France.", source_url="https://example.com/paris", nugget_id="1")
+    docs = [Document(page_content="Paris ...", metadata={"source": "https://example.com/paris"})]
+    first = {"question": "Capital of France?", "knowledge_base": [], "scraped_content": []}
+    second = {**first, "urls_to_scrape": [URLWithScore(url="https://example.com/paris", score=90)], "scraped_content": docs}
+    third = {**second, "knowledge_base": [nugget], "answer": "Paris"}
+    for i, values in enumerate([first, second, third]):
+        log.append_status(f"status {i}")
+        log.append_step(values, f"step {i}")
+    log.finish(2, "COMPLETED", "done")
+    return [first, second, third]
+
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_steps_only_log_what_changed(tmp_path):
+    log = SessionLog.create("Capital of France?", {"answer_model": "gpt-4o"}, directory=str(tmp_path))
+    run_steps(log)
+
+    steps = [record for record in records(log.path) if record["type"] == "step"]
+
+    assert set(steps[1]["set"]) == {"urls_to_scrape", "scraped_content"}
+    assert set(steps[2]["set"]) == {"knowledge_base", "answer"}
+
+
+def test_log_reloads_to_the_same_history(tmp_path):
+    log = SessionLog.create("Capital of France?", {"answer_model": "gpt-4o"}, directory=str(tmp_path))
+    history = run_steps(log)
+
+    session = load_session_log(log.path)
+
+    assert session["values_history"] == history
+    assert session["values_history_description"] == ["step 0", "step 1", "step 2"]
+    assert session["status_messages"] == ["status 0", "status 1", "status 2"]
+    assert session["current_values_idx"] == 2
+    assert session["model_settings"] == {"answer_model": "gpt-4o"}
+    assert session["thread_id"] == log.thread_id
+    # Unchanged values are shared between steps rather than copied
+    assert session["values_history"][2]["scraped_content"] is session["values_history"][1]["scraped_content"]
+
+
+def test_compaction_batches_status_and_drops_torn_lines(tmp_path):
+    log = SessionLog.create("Capital of France?", {}, directory=str(tmp_path))
+    history = run_steps(log)
+    with open(log.path, "a") as f:
+        f.write('{"type": "step", "descr')
+
+    compact_session_log(log.path)
+
+    kinds = [record["type"] for record in records(log.path)]
+    assert kinds == ["header", "status", "step", "step", "step", "checkpoint", "final"]
+    assert load_session_log(log.path)["values_history"] == history
+
+
+def test_legacy_session_converts_to_a_smaller_log(tmp_path):
+    legacy = load_any_session(LEGACY_SESSION)
+    path = str(tmp_path / "converted.jsonl")
+
+    write_session_log(path, legacy)
+
+    converted = load_session_log(path)
+    assert converted["values_history"] == legacy["values_history"]
+    assert converted["question"] == legacy["question"]
+    assert os.path.getsize(path) < os.path.getsize(LEGACY_SESSION) / 2
@@ -0,0 +1,42 @@
+import pytest
+
+from frontend.values_history import CHECKPOINT_INTERVAL, ValuesHistory
+
+
+def make_snapshots(steps):
+    documents = [f"page {i}" * 100 for i in range(10)]
+    snapshots, values = [], {"question": "Capital of France?", "scraped_content": documents}
+    for i in range(steps):
+        values = {**values, "current_query": f"query {i}"}
+        if i % 5 == 0:
+            values = {**values, "knowledge_base": [f"nugget {j}" for j in range(i)]}
+        if i == 7:
+            values = {key: value for key, value in values.items() if key != "current_query"}
+        snapshots.append(values)
+    return snapshots
+
+
+def test_every_step_is_rebuilt_exactly():
+    snapshots = make_snapshots(CHECKPOINT_INTERVAL * 2 + 3)
+    history = ValuesHistory.from_snapshots(snapshots)
+
+    assert len(history) == len(snapshots)
+    assert [history[i] for i in range(len(history))] == snapshots
+    assert list(history) == snapshots
+    assert history[-1] == snapshots[-1]
+    with pytest.raises(IndexError):
+        history[len(snapshots)]
+
+
+def test_unchanged_values_are_shared_not_copied():
+    history = ValuesHistory.from_snapshots(make_snapshots(20))
+
+    assert history[3]["scraped_content"] is history[19]["scraped_content"]
+
+
+def test_equal_copies_are_stored_once():
+    history = ValuesHistory()
+    history.append({"knowledge_base": ["Paris is the capital of France."]})
+    history.append({"knowledge_base": ["Paris is the capital of France."]})
+
+    assert history[1]["knowledge_base"] is history[0]["knowledge_base"]